@@ -0,0 +1,259 @@
+# benchmarks/bench_battle.py
+"""
+Микробенчмарки боевого движка (game/arena_battle_system.py).
+
+Замеры для колод от 5×5 до 50×50:
+* construct    — ArenaBattle(...) со свежими картами (синергии);
+* next_turn    — один ход (бои пересоздаются, время только next_turn);
+* auto_battle  — бой целиком;
+* to_dict      — BattleCard.to_dict для всех карт боя;
+* json         — json.dumps/loads состояния боя, как в battle_storage;
+* reconstruct  — цикл BattleCard.from_dict + ArenaBattle из main.battle_turn.
+
+Результат — операций в секунду (медиана по раундам). С --save замеры
+пишутся в baseline, без него сравниваются с baseline: если какой-то
+замер медленнее на --threshold и больше, скрипт завершается с кодом 1.
+Baseline зависит от машины — сохраняйте его там же, где сравниваете
+(в CI — отдельным шагом с --save на том же раннере). Без baseline
+скрипт тоже завершается с кодом 1, чтобы проверка не проходила молча.
+
+    python -m benchmarks.bench_battle --save      # записать baseline
+    python -m benchmarks.bench_battle             # сравнить
+    python -m benchmarks.bench_battle --sizes 5 50 --rounds 9
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from game.arena_battle_system import ArenaBattle, BattleCard
+
+BASELINE_FILE = Path(__file__).parent / "baselines" / "battle.json"
+DECK_SIZES = (5, 10, 20, 50)
+RARITIES = ("E", "D", "C", "B", "A", "S", "ASS", "SSS")
+ANIME = ("Naruto", "Bleach", "One Piece", "Jujutsu Kaisen", "Frieren", "Berserk")
+
+ROUND_SECONDS = 0.2  # минимальная длительность одного раунда замера
+
+
+# ===== ДАННЫЕ =====
+
+
+def make_deck(size: int, rng: random.Random, enemy: bool = False) -> List[dict]:
+    """Колода в формате BattleCard.to_dict (как в Redis)"""
+    sign = -1 if enemy else 1
+    deck = []
+    for position in range(size):
+        health = rng.randint(300, 3000)
+        card = BattleCard(
+            id=sign * (position + 1),
+            user_card_id=position + 1,
+            name=f"Card {position}",
+            rarity=rng.choice(RARITIES),
+            anime=rng.choice(ANIME),
+            power=rng.randint(100, 5000),
+            health=health,
+            max_health=health,
+            attack=rng.randint(30, 600),
+            defense=rng.randint(10, 400),
+            level=rng.randint(1, 100),
+            image_url=f"https://example.com/{position}.jpg",
+            position=position,
+        )
+        deck.append(card.to_dict())
+    return deck
+
+
+def cards(deck: List[dict]) -> List[BattleCard]:
+    return [BattleCard.from_dict(data) for data in deck]
+
+
+# ===== ЗАМЕРЫ =====
+
+
+def bench(fn: Callable[[], Tuple[int, float]], rounds: int) -> float:
+    """
+    Операций в секунду, медиана по rounds раундам. fn выполняет пачку
+    операций и возвращает (количество, секунды) — время меряет само,
+    чтобы подготовка не попадала в замер.
+    """
+    results = []
+    for _ in range(rounds):
+        operations = 0
+        elapsed = 0.0
+        while elapsed < ROUND_SECONDS:
+            done, seconds = fn()
+            operations += done
+            elapsed += seconds
+        results.append(operations / elapsed)
+    return statistics.median(results)
+
+
+def timed(fn: Callable[[], None], repeat: int = 1):
+    """Замер без подготовки: fn вызывается repeat раз"""
+
+    def run():
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return repeat, time.perf_counter() - started
+
+    return run
+
+
+def cases(size: int, seed: int) -> Dict[str, Callable]:
+    rng = random.Random(seed)
+    player_deck = make_deck(size, rng)
+    enemy_deck = make_deck(size, rng, enemy=True)
+    battle_data = {
+        "user_id": 1,
+        "opponent_id": None,
+        "player_cards": player_deck,
+        "enemy_cards": enemy_deck,
+        "turn": 0,
+        "winner": None,
+        "created_at": "2026-01-01T00:00:00",
+        "player_rating": 1000,
+        "opponent_rating": 1000,
+    }
+    encoded = json.dumps(battle_data, default=str)
+
+    def construct():
+        player, enemy = cards(player_deck), cards(enemy_deck)
+        started = time.perf_counter()
+        ArenaBattle(player, enemy)
+        return 1, time.perf_counter() - started
+
+    def next_turn():
+        battle = ArenaBattle(cards(player_deck), cards(enemy_deck))
+        turns = 0
+        started = time.perf_counter()
+        while not battle.winner:
+            battle.next_turn()
+            turns += 1
+        return turns, time.perf_counter() - started
+
+    def auto_battle():
+        battle = ArenaBattle(cards(player_deck), cards(enemy_deck))
+        started = time.perf_counter()
+        battle.auto_battle()
+        return 1, time.perf_counter() - started
+
+    battle_cards = cards(player_deck) + cards(enemy_deck)
+
+    def to_dict():
+        return [card.to_dict() for card in battle_cards]
+
+    def json_roundtrip():
+        json.loads(json.dumps(battle_data, default=str))
+
+    def reconstruct():
+        # Как в main.battle_turn: из JSON в карты и бой
+        data = json.loads(encoded)
+        player_cards_dict = {}
+        enemy_cards_dict = {}
+        for card_data in data.get("player_cards", []):
+            card = BattleCard.from_dict(card_data)
+            player_cards_dict[card.id] = card
+        for card_data in data.get("enemy_cards", []):
+            card = BattleCard.from_dict(card_data)
+            enemy_cards_dict[card.id] = card
+        battle = ArenaBattle(
+            list(player_cards_dict.values()), list(enemy_cards_dict.values())
+        )
+        battle.turn = data.get("turn", 0)
+
+    return {
+        "construct": construct,
+        "next_turn": next_turn,
+        "auto_battle": auto_battle,
+        "to_dict": timed(to_dict, 10),
+        "json": timed(json_roundtrip, 10),
+        "reconstruct": timed(reconstruct, 10),
+    }
+
+
+def run(sizes: List[int], rounds: int, only: List[str], seed: int) -> Dict[str, float]:
+    random.seed(seed)  # движок использует модуль random
+    results = {}
+    for size in sizes:
+        for name, fn in cases(size, seed).items():
+            if only and name not in only:
+                continue
+            key = f"{name}/{size}v{size}"
+            results[key] = bench(fn, rounds)
+            print(f"{key:<24}{results[key]:>14,.0f} оп/с")
+    return results
+
+
+# ===== BASELINE =====
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], threshold: float):
+    """Список регрессий: (замер, было, стало, изменение)"""
+    regressions = []
+    print(f"\n{'замер':<24}{'baseline':>14}{'сейчас':>14}{'изм.':>9}")
+    for key, current in results.items():
+        before = baseline.get(key)
+        if not before:
+            continue
+        change = current / before - 1
+        mark = "  ❌" if change < -threshold else ""
+        print(f"{key:<24}{before:>14,.0f}{current:>14,.0f}{change:>+9.1%}{mark}")
+        if change < -threshold:
+            regressions.append((key, before, current, change))
+    return regressions
+
+
+def main(args: argparse.Namespace) -> int:
+    results = run(args.sizes, args.rounds, args.cases, args.seed)
+    baseline_file = Path(args.baseline)
+
+    if args.save:
+        baseline_file.parent.mkdir(parents=True, exist_ok=True)
+        saved = {}
+        if baseline_file.exists():
+            saved = json.loads(baseline_file.read_text())
+        saved.update(results)
+        baseline_file.write_text(json.dumps(saved, indent=2, sort_keys=True))
+        print(f"\n💾 Baseline сохранён: {baseline_file}")
+        return 0
+
+    if not baseline_file.exists():
+        # Без baseline сравнивать не с чем — проверка не должна молча проходить
+        print(f"\n❌ Нет baseline ({baseline_file}) — запишите его с --save")
+        return 1
+
+    regressions = compare(
+        results, json.loads(baseline_file.read_text()), args.threshold
+    )
+    if regressions:
+        print(
+            f"\n❌ Регрессия больше {args.threshold:.0%}: {len(regressions)} замер(ов)"
+        )
+        return 1
+    print("\n✅ Регрессий нет")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарки боевого движка")
+    parser.add_argument("--sizes", type=int, nargs="*", default=list(DECK_SIZES))
+    parser.add_argument("--cases", nargs="*", help="только эти замеры")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=float(os.getenv("BENCH_THRESHOLD", "0.15")),
+        help="допустимое падение (0.15 = 15%%)",
+    )
+    parser.add_argument("--baseline", default=str(BASELINE_FILE))
+    parser.add_argument("--save", action="store_true", help="записать baseline")
+    sys.exit(main(parser.parse_args()))
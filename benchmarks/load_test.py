@@ -0,0 +1,393 @@
+# benchmarks/load_test.py
+"""
+Нагрузочный тест вебхука.
+
+Тысячи виртуальных пользователей проходят реальные сценарии (/start,
+открытие пачки, листание коллекции, экспедиция, арена с ходами через
+/api/battle/turn, викторина). Апдейты строятся как настоящие Update от
+Telegram и отправляются в /webhook приложения main.app внутри процесса
+(httpx ASGITransport), Bot API подменён TelegramStub. Кнопки берутся из
+клавиатур, которые бот "отправил" в stub, поэтому сценарии идут по тем же
+callback_data, что и у живых игроков.
+
+По каждому сценарию печатается p50/p95/p99 задержки шага, пропускная
+способность и среднее число SQL-запросов и команд Redis на шаг.
+
+Нужна отдельная БД с каталогом карт (DB_URL), для арены — Redis
+(REDIS_URL), иначе сценарий arena пропускается:
+    DB_URL=postgresql+asyncpg://.../kami_load python -m benchmarks.load_test \\
+        --users 2000 --concurrency 200 --json load.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+# До импорта main: тестовый токен и секрет вебхука
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:load-test")
+os.environ.setdefault("TELEGRAM_WEBHOOK_SECRET", "load-test")
+
+import httpx
+
+from benchmarks.telegram_stub import TelegramStub
+from services.query_stats import track_queries
+
+FIRST_USER_ID = 8_000_000_000  # вне диапазона настоящих telegram_id
+MAX_BATTLE_TURNS = 60
+
+
+# ===== СТАТИСТИКА =====
+
+
+@dataclass
+class ScenarioStats:
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    skipped: int = 0  # нужной кнопки не оказалось
+    queries: int = 0
+    redis_calls: int = 0
+    runs: int = 0
+
+    def summary(self, elapsed: float) -> dict:
+        latencies = sorted(self.latencies)
+        steps = len(latencies)
+        return {
+            "runs": self.runs,
+            "steps": steps,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "p50_ms": _percentile(latencies, 50) * 1000,
+            "p95_ms": _percentile(latencies, 95) * 1000,
+            "p99_ms": _percentile(latencies, 99) * 1000,
+            "steps_per_s": steps / elapsed if elapsed else 0.0,
+            "queries_per_step": self.queries / steps if steps else 0.0,
+            "redis_per_step": self.redis_calls / steps if steps else 0.0,
+        }
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(
+        0, min(len(sorted_values) - 1, round(percent / 100 * len(sorted_values)) - 1)
+    )
+    return sorted_values[rank]
+
+
+class MissingButton(Exception):
+    """В последней клавиатуре нет нужной кнопки — сценарий дальше не идёт"""
+
+
+# ===== АПДЕЙТЫ =====
+
+
+class UpdateFactory:
+    """Update в формате Bot API (как их присылает Telegram)"""
+
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _user(self, user_id: int) -> dict:
+        return {
+            "id": user_id,
+            "is_bot": False,
+            "first_name": f"Load{user_id % 100000}",
+            "username": f"load_{user_id}",
+            "language_code": "ru",
+        }
+
+    def message(self, user_id: int, text: str) -> dict:
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            "text": text,
+        }
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [
+                {"type": "bot_command", "offset": 0, "length": len(command)}
+            ]
+        return {"update_id": next(self._update_ids), "message": message}
+
+    def callback(self, user_id: int, data: str) -> dict:
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._update_ids)),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": {"id": 1, "is_bot": True, "first_name": "Bot"},
+                    "text": "…",
+                },
+            },
+        }
+
+
+# ===== ВИРТУАЛЬНЫЙ ПОЛЬЗОВАТЕЛЬ =====
+
+
+class VirtualUser:
+    def __init__(self, harness: "LoadHarness", user_id: int, rng: random.Random):
+        self.harness = harness
+        self.user_id = user_id
+        self.rng = rng
+        self.stats: Optional[ScenarioStats] = None
+
+    async def _step(self, request: Callable):
+        stats = self.stats
+        with track_queries("load_test") as queries:
+            started = time.perf_counter()
+            try:
+                response = await request()
+                ok = (
+                    response.status_code == 200
+                    and response.json().get("status", "ok") != "error"
+                )
+            except Exception:
+                ok = False
+            stats.latencies.append(time.perf_counter() - started)
+        stats.queries += queries.count
+        stats.redis_calls += queries.redis_calls
+        if not ok:
+            stats.errors += 1
+
+    async def send(self, text: str):
+        update = self.harness.updates.message(self.user_id, text)
+        await self._step(lambda: self.harness.post_update(update))
+
+    async def press(self, data: str):
+        update = self.harness.updates.callback(self.user_id, data)
+        await self._step(lambda: self.harness.post_update(update))
+
+    async def press_prefix(self, prefix: str, pick: str = "random"):
+        options = self.harness.stub.callbacks(self.user_id, prefix)
+        if not options:
+            raise MissingButton(prefix)
+        data = options[-1] if pick == "last" else self.rng.choice(options)
+        await self.press(data)
+
+    async def api(self, path: str, payload: dict) -> dict:
+        result = {}
+
+        async def request():
+            response = await self.harness.client.post(path, json=payload)
+            result.update(response.json())
+            return response
+
+        await self._step(request)
+        return result
+
+
+# ===== СЦЕНАРИИ =====
+
+
+async def scenario_start(user: VirtualUser):
+    await user.send("/start")
+    await user.send("/profile")
+
+
+async def scenario_open_pack(user: VirtualUser):
+    await user.send("/open_pack")
+    await user.send("/daily")
+    await user.send("/open_pack")
+
+
+async def scenario_collection(user: VirtualUser):
+    await user.send("/collection")
+    await user.press("collection_by_rarity")
+    await user.press_prefix("rarity_")
+    for _ in range(3):  # листаем вперёд
+        await user.press_prefix("rarity_", pick="last")
+    await user.press("collection_stats")
+    await user.press("collection_strongest")
+
+
+async def scenario_expedition(user: VirtualUser):
+    await user.send("/expedition")
+    await user.press_prefix("exped_new_")
+    for _ in range(3):
+        await user.press_prefix("exped_select_")
+    await user.press("exped_confirm_cards")
+    await user.press_prefix("exped_start_")
+    await user.press("exped_list")
+
+
+async def scenario_arena(user: VirtualUser):
+    await user.send("/arena")
+    urls = user.harness.stub.web_app_urls(user.user_id)
+    if not urls:
+        raise MissingButton("web_app")
+    battle_id = parse_qs(urlparse(urls[0]).query)["battle_id"][0]
+    for _ in range(MAX_BATTLE_TURNS):
+        result = await user.api("/api/battle/turn", {"battle_id": battle_id})
+        if not result.get("success") or result.get("winner"):
+            break
+    await user.press("arena_top")
+
+
+async def scenario_quiz(user: VirtualUser):
+    await user.send("/quiz")
+    await user.press("quiz_start")
+    for _ in range(5):
+        await user.press_prefix("quiz_answer_")
+        await user.press_prefix("quiz_next")
+
+
+SCENARIOS: Dict[str, Callable] = {
+    "start": scenario_start,
+    "open_pack": scenario_open_pack,
+    "collection": scenario_collection,
+    "expedition": scenario_expedition,
+    "arena": scenario_arena,
+    "quiz": scenario_quiz,
+}
+WEIGHTS = {
+    "start": 1,
+    "open_pack": 3,
+    "collection": 3,
+    "expedition": 1,
+    "arena": 2,
+    "quiz": 2,
+}
+
+
+# ===== ПРОГОН =====
+
+
+class LoadHarness:
+    def __init__(self, scenarios: List[str], latency: float, seed: int):
+        import main
+
+        self.main = main
+        self.stub = TelegramStub(latency=latency)
+        main.bot.session.middleware(self.stub)  # последним — самым внутренним
+        self.updates = UpdateFactory()
+        self.scenarios = scenarios
+        self.stats: Dict[str, ScenarioStats] = defaultdict(ScenarioStats)
+        self.seed = seed
+        self.client: Optional[httpx.AsyncClient] = None
+        self._headers = {
+            "X-Telegram-Bot-Api-Secret-Token": os.environ["TELEGRAM_WEBHOOK_SECRET"]
+        }
+
+    async def post_update(self, update: dict) -> httpx.Response:
+        return await self.client.post("/webhook", json=update, headers=self._headers)
+
+    async def run_user(self, index: int, semaphore: asyncio.Semaphore):
+        rng = random.Random(self.seed + index)
+        user = VirtualUser(self, FIRST_USER_ID + index, rng)
+        weights = [WEIGHTS[name] for name in self.scenarios]
+        plan = ["start"] + rng.choices(self.scenarios, weights, k=3)
+
+        async with semaphore:
+            for name in plan:
+                user.stats = self.stats[name]
+                user.stats.runs += 1
+                try:
+                    await SCENARIOS[name](user)
+                except MissingButton:
+                    user.stats.skipped += 1
+
+    async def run(self, users: int, concurrency: int, with_outbound: bool) -> float:
+        main = self.main
+        transport = httpx.ASGITransport(app=main.app)
+        async with main.lifespan(main.app):
+            if not with_outbound:
+                # Лимиты Telegram (30/с) упёрли бы тест в очередь outbound
+                await main.outbound.stop()
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://load-test"
+            ) as client:
+                self.client = client
+                semaphore = asyncio.Semaphore(concurrency)
+                started = time.perf_counter()
+                await asyncio.gather(
+                    *(self.run_user(i, semaphore) for i in range(users))
+                )
+                return time.perf_counter() - started
+
+
+def print_report(report: dict):
+    header = (
+        f"{'scenario':<12}{'runs':>7}{'steps':>8}{'err':>6}{'skip':>6}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'steps/s':>9}"
+        f"{'sql/st':>8}{'redis/st':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for name, row in report["scenarios"].items():
+        print(
+            f"{name:<12}{row['runs']:>7}{row['steps']:>8}{row['errors']:>6}"
+            f"{row['skipped']:>6}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+            f"{row['p99_ms']:>9.1f}{row['steps_per_s']:>9.1f}"
+            f"{row['queries_per_step']:>8.1f}{row['redis_per_step']:>9.1f}"
+        )
+    print(
+        f"\n⏱️ {report['elapsed_s']:.1f}с, {report['steps']} шагов, "
+        f"{report['steps_per_s']:.1f} шагов/с"
+    )
+    print(f"📨 Вызовы Bot API: {report['telegram_calls']}")
+
+
+async def main(args: argparse.Namespace):
+    scenarios = args.scenarios or list(SCENARIOS)
+    if "arena" in scenarios and not os.getenv("REDIS_URL"):
+        print("⚠️ REDIS_URL не задан — сценарий arena пропущен")
+        scenarios = [name for name in scenarios if name != "arena"]
+
+    harness = LoadHarness(scenarios, args.telegram_latency, args.seed)
+    elapsed = await harness.run(args.users, args.concurrency, args.with_outbound)
+
+    summaries = {
+        name: harness.stats[name].summary(elapsed)
+        for name in ["start"] + [s for s in scenarios if s != "start"]
+        if name in harness.stats
+    }
+    steps = sum(row["steps"] for row in summaries.values())
+    report = {
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "elapsed_s": elapsed,
+        "steps": steps,
+        "steps_per_s": steps / elapsed if elapsed else 0.0,
+        "scenarios": summaries,
+        "telegram_calls": dict(harness.stub.calls.most_common()),
+    }
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест /webhook")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument(
+        "--scenarios", nargs="*", choices=list(SCENARIOS), help="по умолчанию все"
+    )
+    parser.add_argument(
+        "--telegram-latency", type=float, default=0.0, help="задержка stub, секунд"
+    )
+    parser.add_argument(
+        "--with-outbound", action="store_true", help="не отключать лимиты outbound"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="сохранить отчёт в файл")
+    asyncio.run(main(parser.parse_args()))
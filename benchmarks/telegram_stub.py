@@ -0,0 +1,102 @@
+# benchmarks/telegram_stub.py
+"""
+Telegram Bot API в памяти для нагрузочного теста.
+
+Подключается последним middleware сессии бота и не передаёт запрос
+дальше: на любой метод сразу отвечает правдоподобным результатом
+(Message, True, список Message для альбома). Заодно запоминает последнюю
+inline-клавиатуру в каждом чате — виртуальные пользователи "нажимают"
+кнопки из неё — и считает вызовы по методам.
+"""
+
+import asyncio
+import itertools
+import time
+import typing
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.methods import GetMe, GetWebhookInfo, SendMediaGroup
+from aiogram.types import (
+    Chat,
+    InlineKeyboardMarkup,
+    Message,
+    User,
+    WebhookInfo,
+)
+
+
+class TelegramStub(BaseRequestMiddleware):
+    """Отвечает на запросы к Bot API без сети"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency  # искусственная задержка ответа, секунд
+        self.calls: Counter = Counter()
+        self.keyboards: Dict[int, InlineKeyboardMarkup] = {}
+        self._message_ids = itertools.count(1_000_000)
+
+    async def __call__(
+        self, make_request: NextRequestMiddlewareType, bot, method
+    ) -> Any:
+        self.calls[type(method).__name__] += 1
+
+        chat_id = getattr(method, "chat_id", None)
+        markup = getattr(method, "reply_markup", None)
+        if chat_id is not None and isinstance(markup, InlineKeyboardMarkup):
+            self.keyboards[chat_id] = markup
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._result(bot, method, chat_id)
+
+    # ===== ОТВЕТЫ =====
+
+    def _result(self, bot, method, chat_id: Optional[int]):
+        if isinstance(method, SendMediaGroup):
+            return [self._message(bot, chat_id) for _ in method.media]
+        if isinstance(method, GetMe):
+            return User(id=bot.id, is_bot=True, first_name="Stub", username="stub_bot")
+        if isinstance(method, GetWebhookInfo):
+            return WebhookInfo(
+                url="", has_custom_certificate=False, pending_update_count=0
+            )
+
+        returning = method.__returning__
+        if returning is bool:
+            return True
+        if returning is Message or Message in typing.get_args(returning):
+            return self._message(bot, chat_id)
+        return True
+
+    def _message(self, bot, chat_id: Optional[int]) -> Message:
+        return Message(
+            message_id=next(self._message_ids),
+            date=int(time.time()),
+            chat=Chat(id=chat_id or 0, type="private"),
+        ).as_(bot)
+
+    # ===== КЛАВИАТУРЫ =====
+
+    def buttons(self, chat_id: int) -> List[Any]:
+        """Кнопки последней клавиатуры в чате"""
+        markup = self.keyboards.get(chat_id)
+        if not markup:
+            return []
+        return [button for row in markup.inline_keyboard for button in row]
+
+    def callbacks(self, chat_id: int, prefix: str = "") -> List[str]:
+        """callback_data кнопок последней клавиатуры, начинающиеся с prefix"""
+        return [
+            button.callback_data
+            for button in self.buttons(chat_id)
+            if button.callback_data and button.callback_data.startswith(prefix)
+        ]
+
+    def web_app_urls(self, chat_id: int) -> List[str]:
+        return [
+            button.web_app.url for button in self.buttons(chat_id) if button.web_app
+        ]
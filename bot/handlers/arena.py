@@ -9,14 +9,16 @@ import uuid
 from datetime import datetime
 import logging
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.base import AsyncSessionLocal
-from database.crud import get_user_or_create
+from database.crud import get_arena_leaderboard
 from database.models.user import User
 from database.models.user_card import UserCard
 from database.models.card import Card
 from database.models.arena_battle import ArenaBattle as DBArenaBattle
 from game.arena_battle_system import ArenaBattle, BattleCard
 from services.redis_client import battle_storage
+from bot.middlewares import ResolvedUser
 from game.arena_ranks import get_rank, ARENA_RANKS
 
 
@@ -46,113 +48,124 @@ def generate_init_data(user_id: int, battle_id: str) -> str:
     return encoded
 
 
-async def get_user_deck(user_id: int) -> list:
+async def get_user_deck(user_id: int, session: AsyncSession = None) -> list:
     """Получает колоду пользователя (до 5 карт)"""
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(UserCard, Card)
-            .join(Card, UserCard.card_id == Card.id)
-            .where(and_(UserCard.user_id == user_id, UserCard.is_in_deck == True))
-            .order_by(Card.rarity.desc())
-            .limit(5)
-        )
-        return result.all()
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            return await get_user_deck(user_id, session=session)
 
+    result = await session.execute(
+        select(UserCard, Card)
+        .join(Card, UserCard.card_id == Card.id)
+        .where(and_(UserCard.user_id == user_id, UserCard.is_in_deck == True))
+        .order_by(Card.rarity.desc())
+        .limit(5)
+    )
+    return result.all()
 
-async def generate_opponent(user_id: int, user_rating: int) -> tuple:
-    """Генерирует колоду противника с учетом рейтинга"""
-    async with AsyncSessionLocal() as session:
-        # Пытаемся найти противника с похожим рейтингом (±200)
-        rating_range_low = max(0, user_rating - 500)
-        rating_range_high = user_rating + 500
 
-        result = await session.execute(
-            select(User)
-            .where(
-                User.id != user_id,
-                User.arena_rating.between(rating_range_low, rating_range_high),
-                func.coalesce(func.json_array_length(User.selected_deck), 0) >= 5,
-            )
-            .order_by(func.random())
-            .limit(1)
+async def generate_opponent(
+    user_id: int, user_rating: int, session: AsyncSession = None
+) -> tuple:
+    """Генерирует колоду противника с учетом рейтинга"""
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            return await generate_opponent(user_id, user_rating, session=session)
+
+    # Пытаемся найти противника с похожим рейтингом (±200)
+    rating_range_low = max(0, user_rating - 500)
+    rating_range_high = user_rating + 500
+
+    result = await session.execute(
+        select(User)
+        .where(
+            User.id != user_id,
+            User.arena_rating.between(rating_range_low, rating_range_high),
+            func.coalesce(func.json_array_length(User.selected_deck), 0) >= 5,
         )
+        .order_by(func.random())
+        .limit(1)
+    )
 
-        opponent = result.scalar_one_or_none()
+    opponent = result.scalar_one_or_none()
 
-        if opponent and opponent.selected_deck:
-            result = await session.execute(
-                select(UserCard, Card)
-                .join(Card, UserCard.card_id == Card.id)
-                .where(UserCard.id.in_(opponent.selected_deck))
-                .limit(5)
-            )
+    if opponent and opponent.selected_deck:
+        result = await session.execute(
+            select(UserCard, Card)
+            .join(Card, UserCard.card_id == Card.id)
+            .where(UserCard.id.in_(opponent.selected_deck))
+            .limit(5)
+        )
 
-            opponent_cards = result.all()
+        opponent_cards = result.all()
 
-            if len(opponent_cards) >= 5:
-                logger.info(f"Found real opponent: {opponent.id} with rating {opponent.arena_rating}")
-                return opponent_cards, opponent.id, opponent.arena_rating
+        if len(opponent_cards) >= 5:
+            logger.info(f"Found real opponent: {opponent.id} with rating {opponent.arena_rating}")
+            return opponent_cards, opponent.id, opponent.arena_rating
 
-        # Если не нашли реального противника, генерируем тестовую колоду
-        # с рейтингом, близким к пользователю
-        logger.info("No real opponent found, generating test deck")
-        test_rating = max(500, user_rating + random.randint(-300, 300))
-        return await generate_test_deck(user_rating), None, test_rating
+    # Если не нашли реального противника, генерируем тестовую колоду
+    # с рейтингом, близким к пользователю
+    logger.info("No real opponent found, generating test deck")
+    test_rating = max(500, user_rating + random.randint(-300, 300))
+    return await generate_test_deck(user_rating, session), None, test_rating
 
 
-async def generate_test_deck(user_rating: int) -> list:
+async def generate_test_deck(user_rating: int, session: AsyncSession = None) -> list:
     """Генерирует тестовую колоду с указанием, что она тестовая"""
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(select(Card).order_by(func.random()).limit(5))
-        cards = result.scalars().all()
-
-        # Определяем силу тестовой колоды в зависимости от рейтинга
-        level_base = max(5, min(30, user_rating // 150 + 5))
-
-        test_deck = []
-        for i, card in enumerate(cards):
-            level = level_base + random.randint(-3, 3)
-
-            # Рассчитываем характеристики на основе уровня
-            power = int(card.base_power * (1 + (level - 1) * 0.06))
-            health = int(card.base_health * (1 + (level - 1) * 0.04))
-            attack = int(card.base_attack * (1 + (level - 1) * 0.07))
-            defense = int(card.base_defense * (1 + (level - 1) * 0.04))
-
-            rarity_mult = {
-                "E": 1.0, "D": 1.1, "C": 1.2, "B": 1.3,
-                "A": 1.45, "S": 1.65, "ASS": 1.8, "SSS": 2.0,
-            }.get(card.rarity, 1.0)
-
-            power = int(power * rarity_mult)
-            health = int(health * rarity_mult)
-            attack = int(attack * rarity_mult)
-            defense = int(defense * rarity_mult)
-
-            # Добавляем флаг, что это тестовая карта
-            test_deck.append(
-                (
-                    type(
-                        "UserCard",
-                        (),
-                        {
-                            "id": -i - 1,
-                            "user_id": -1,
-                            "card_id": card.id,
-                            "level": level,
-                            "current_power": power,
-                            "current_health": health,
-                            "current_attack": attack,
-                            "current_defense": defense,
-                            "is_in_deck": True,
-                            "is_test_card": True,  # Флаг тестовой карты
-                        },
-                    ),
-                    card,
-                )
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            return await generate_test_deck(user_rating, session=session)
+
+    result = await session.execute(select(Card).order_by(func.random()).limit(5))
+    cards = result.scalars().all()
+
+    # Определяем силу тестовой колоды в зависимости от рейтинга
+    level_base = max(5, min(30, user_rating // 150 + 5))
+
+    test_deck = []
+    for i, card in enumerate(cards):
+        level = level_base + random.randint(-3, 3)
+
+        # Рассчитываем характеристики на основе уровня
+        power = int(card.base_power * (1 + (level - 1) * 0.06))
+        health = int(card.base_health * (1 + (level - 1) * 0.04))
+        attack = int(card.base_attack * (1 + (level - 1) * 0.07))
+        defense = int(card.base_defense * (1 + (level - 1) * 0.04))
+
+        rarity_mult = {
+            "E": 1.0, "D": 1.1, "C": 1.2, "B": 1.3,
+            "A": 1.45, "S": 1.65, "ASS": 1.8, "SSS": 2.0,
+        }.get(card.rarity, 1.0)
+
+        power = int(power * rarity_mult)
+        health = int(health * rarity_mult)
+        attack = int(attack * rarity_mult)
+        defense = int(defense * rarity_mult)
+
+        # Добавляем флаг, что это тестовая карта
+        test_deck.append(
+            (
+                type(
+                    "UserCard",
+                    (),
+                    {
+                        "id": -i - 1,
+                        "user_id": -1,
+                        "card_id": card.id,
+                        "level": level,
+                        "current_power": power,
+                        "current_health": health,
+                        "current_attack": attack,
+                        "current_defense": defense,
+                        "is_in_deck": True,
+                        "is_test_card": True,  # Флаг тестовой карты
+                    },
+                ),
+                card,
             )
+        )
 
-        return test_deck
+    return test_deck
 
 
 def prepare_battle_cards(cards_data: list, is_user: bool = True) -> list:
@@ -179,22 +192,20 @@ def prepare_battle_cards(cards_data: list, is_user: bool = True) -> list:
 
 
 @router.message(Command("arena"))
-async def cmd_arena(message: types.Message, user_id: int = None):
+async def cmd_arena(
+    message: types.Message, session: AsyncSession, db_user: ResolvedUser
+):
     """Вход на арену"""
-    # Определяем какой ID использовать
-    if user_id:
-        tg_id = user_id
-    else:
-        tg_id = message.from_user.id
+    # При вызове из callback message.from_user — это бот, поэтому берём db_user
+    tg_id = db_user.telegram_id
 
     try:
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, tg_id)
+        user = await session.get(User, db_user.id)
 
         logger.info(f"Arena user: tg_id={tg_id}, db_id={user.id}")
 
         # Получаем колоду пользователя
-        user_deck = await get_user_deck(user.id)
+        user_deck = await get_user_deck(user.id, session)
 
         if len(user_deck) < 5:
             await message.answer(
@@ -223,7 +234,9 @@ async def cmd_arena(message: types.Message, user_id: int = None):
         progress_bar = "█" * int(progress // 10) + "░" * (10 - int(progress // 10))
 
         # Генерируем противника с учетом рейтинга
-        opponent_deck, opponent_id, opponent_rating = await generate_opponent(user.id, user.arena_rating)
+        opponent_deck, opponent_id, opponent_rating = await generate_opponent(
+            user.id, user.arena_rating, session
+        )
 
         # Создаем уникальный ID для боя
         battle_id = str(uuid.uuid4())
@@ -236,7 +249,7 @@ async def cmd_arena(message: types.Message, user_id: int = None):
         battle = ArenaBattle(user_battle_cards, opponent_battle_cards)
 
         battle_data = {
-            "user_id": message.from_user.id,
+            "user_id": tg_id,
             "opponent_id": opponent_id,
             "player_cards": [card.to_dict() for card in user_battle_cards],
             "enemy_cards": [card.to_dict() for card in opponent_battle_cards],
@@ -303,11 +316,13 @@ async def cmd_arena(message: types.Message, user_id: int = None):
 
 
 @router.callback_query(F.data == "open_arena")
-async def open_arena(callback: types.CallbackQuery):
+async def open_arena(
+    callback: types.CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
     """Обработчик кнопки открытия арены"""
     try:
         # Передаем правильный параметр
-        await cmd_arena(callback.message, callback.from_user.id)
+        await cmd_arena(callback.message, session, db_user)
         await callback.answer()
     except Exception as e:
         logger.exception(f"Ошибка в open_arena: {e}")
@@ -315,71 +330,58 @@ async def open_arena(callback: types.CallbackQuery):
 
 
 @router.callback_query(F.data == "arena_top")
-async def show_arena_top(callback: types.CallbackQuery):
+async def show_arena_top(
+    callback: types.CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
     """Показать топ игроков арены"""
     try:
-        async with AsyncSessionLocal() as session:
-            # Получаем топ-10 игроков по рейтингу
-            result = await session.execute(
-                select(User)
-                .where(User.arena_wins + User.arena_losses > 0)  # Игроки с боями
-                .order_by(User.arena_rating.desc())
-                .limit(10)
-            )
-            top_players = result.scalars().all()
-
-            # Получаем карты в колодах топ-игроков для отображения
-            text = "<b>🏆 ТОП-10 ИГРОКОВ АРЕНЫ</b>\n\n"
-
-            from game.arena_ranks import get_rank_display
-
-            for i, player in enumerate(top_players, 1):
-                rank_display = get_rank_display(player.arena_rating)
-                win_rate = (player.arena_wins / (player.arena_wins + player.arena_losses) * 100) if (player.arena_wins + player.arena_losses) > 0 else 0
-
-                # Получаем информацию о колоде
-                deck_info = ""
-                if player.selected_deck:
-                    deck_result = await session.execute(
-                        select(Card.card_name, Card.rarity)
-                        .join(UserCard, UserCard.card_id == Card.id)
-                        .where(UserCard.id.in_(player.selected_deck[:5]))  # Топ-5 карты
-                    )
-                    top_cards = deck_result.all()
-                    if top_cards:
-                        deck_info = " | ".join([f"{name} [{rarity}]" for name, rarity in top_cards])
-
-                medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else "📌"
-                text += f"{medal} <b>{i}. {player.first_name}</b>\n"
-                text += f"   {rank_display} | {player.arena_rating}⭐\n"
-                text += f"   Побед: {player.arena_wins} | Винрейт: {win_rate:.1f}%\n"
-                if deck_info:
-                    text += f"   🃏 {deck_info}\n"
-                text += "\n"
-
-            # Добавляем информацию о пользователе
-            user = await get_user_or_create(session, callback.from_user.id)
-
-            # Находим место пользователя в топе
-            user_position = 0
-            if user.arena_wins + user.arena_losses > 0:
-                user_pos_result = await session.execute(
-                    select(func.count())
-                    .select_from(User)
-                    .where(
-                        User.arena_rating > user.arena_rating,
-                        User.arena_wins + User.arena_losses > 0
-                    )
+        # Топ-10 игроков по рейтингу с картами колод (с реплики, если есть)
+        top_players = await get_arena_leaderboard(10, session=session)
+
+        text = "<b>🏆 ТОП-10 ИГРОКОВ АРЕНЫ</b>\n\n"
+
+        from game.arena_ranks import get_rank_display
+
+        for i, (player, top_cards) in enumerate(top_players, 1):
+            rank_display = get_rank_display(player.arena_rating)
+            win_rate = (player.arena_wins / (player.arena_wins + player.arena_losses) * 100) if (player.arena_wins + player.arena_losses) > 0 else 0
+
+            # Информация о колоде (топ-5 карт)
+            deck_info = ""
+            if top_cards:
+                deck_info = " | ".join([f"{name} [{rarity}]" for name, rarity in top_cards])
+
+            medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else "📌"
+            text += f"{medal} <b>{i}. {player.first_name}</b>\n"
+            text += f"   {rank_display} | {player.arena_rating}⭐\n"
+            text += f"   Побед: {player.arena_wins} | Винрейт: {win_rate:.1f}%\n"
+            if deck_info:
+                text += f"   🃏 {deck_info}\n"
+            text += "\n"
+
+        # Добавляем информацию о пользователе
+        user = await session.get(User, db_user.id)
+
+        # Находим место пользователя в топе
+        user_position = 0
+        if user.arena_wins + user.arena_losses > 0:
+            user_pos_result = await session.execute(
+                select(func.count())
+                .select_from(User)
+                .where(
+                    User.arena_rating > user.arena_rating,
+                    User.arena_wins + User.arena_losses > 0
                 )
-                higher_count = user_pos_result.scalar()
-                user_position = higher_count + 1
+            )
+            higher_count = user_pos_result.scalar()
+            user_position = higher_count + 1
 
-            rank_display = get_rank_display(user.arena_rating)
-            win_rate = (user.arena_wins / (user.arena_wins + user.arena_losses) * 100) if (user.arena_wins + user.arena_losses) > 0 else 0
+        rank_display = get_rank_display(user.arena_rating)
+        win_rate = (user.arena_wins / (user.arena_wins + user.arena_losses) * 100) if (user.arena_wins + user.arena_losses) > 0 else 0
 
-            text += f"<b>📊 ТВОЕ МЕСТО:</b> {user_position}\n"
-            text += f"{rank_display} | {user.arena_rating}⭐\n"
-            text += f"Побед: {user.arena_wins} | Винрейт: {win_rate:.1f}%\n"
+        text += f"<b>📊 ТВОЕ МЕСТО:</b> {user_position}\n"
+        text += f"{rank_display} | {user.arena_rating}⭐\n"
+        text += f"Побед: {user.arena_wins} | Винрейт: {win_rate:.1f}%\n"
 
         keyboard = InlineKeyboardMarkup(
             inline_keyboard=[
@@ -397,7 +399,9 @@ async def show_arena_top(callback: types.CallbackQuery):
 
 
 @router.message(F.web_app_data)
-async def handle_webapp_data(message: types.Message):
+async def handle_webapp_data(
+    message: types.Message, session: AsyncSession, db_user: ResolvedUser
+):
     """Обрабатывает данные из WebApp"""
     try:
         # 🚨 ВАЖНО: логируем ВСЕ входящие данные
@@ -423,48 +427,48 @@ async def handle_webapp_data(message: types.Message):
         if action == "battle_result":
             logger.info(f"🎯 Processing battle result: {result}")
 
-            async with AsyncSessionLocal() as session:
-                user = await get_user_or_create(session, message.from_user.id)
+            user = await session.get(User, db_user.id)
 
-                # Начисляем награды
-                if result == "win":
-                    rating_change = rewards.get("rating", 20)
-                    coins_reward = rewards.get("coins", 50)
-                    dust_reward = rewards.get("dust", 50)
+            # Начисляем награды
+            if result == "win":
+                rating_change = rewards.get("rating", 20)
+                coins_reward = rewards.get("coins", 50)
+                dust_reward = rewards.get("dust", 50)
 
-                    user.arena_wins += 1
-                    user.arena_rating += rating_change
-                    user.coins += coins_reward
-                    user.dust += dust_reward
+                user.arena_wins += 1
+                user.arena_rating += rating_change
+                user.coins += coins_reward
+                user.dust += dust_reward
 
-                elif result == "lose":
-                    rating_change = rewards.get("rating", -15)
-                    coins_reward = rewards.get("coins", 25)
-                    dust_reward = rewards.get("dust", 25)
+            elif result == "lose":
+                rating_change = rewards.get("rating", -15)
+                coins_reward = rewards.get("coins", 25)
+                dust_reward = rewards.get("dust", 25)
 
-                    user.arena_losses += 1
-                    user.arena_rating = max(0, user.arena_rating + rating_change)
-                    user.coins += coins_reward
-                    user.dust += dust_reward
+                user.arena_losses += 1
+                user.arena_rating = max(0, user.arena_rating + rating_change)
+                user.coins += coins_reward
+                user.dust += dust_reward
 
-                await session.commit()
+            await session.commit()
 
-                logger.info(f"✅ User updated: wins={user.arena_wins}, rating={user.arena_rating}")
+            logger.info(f"✅ User updated: wins={user.arena_wins}, rating={user.arena_rating}")
 
-                # Убираем клавиатуру арены
-                from aiogram.types import ReplyKeyboardRemove
+            # Убираем клавиатуру арены
+            from aiogram.types import ReplyKeyboardRemove
 
-                await message.answer(
-                    f"{'🎉' if result == 'win' else '😔'} <b>БИТВА ЗАВЕРШЕНА!</b>\n\n"
-                    f"💰 Получено: +{coins_reward}💰 +{dust_reward}✨\n"
-                    f"⭐ Рейтинг: {user.arena_rating}",
-                    reply_markup=ReplyKeyboardRemove()
-                )
+            await message.answer(
+                f"{'🎉' if result == 'win' else '😔'} <b>БИТВА ЗАВЕРШЕНА!</b>\n\n"
+                f"💰 Получено: +{coins_reward}💰 +{dust_reward}✨\n"
+                f"⭐ Рейтинг: {user.arena_rating}",
+                reply_markup=ReplyKeyboardRemove()
+            )
 
-                # Удаляем битву из Redis
-                if battle_id:
-                    await battle_storage.delete_battle(battle_id)
+            # Удаляем битву из Redis
+            if battle_id:
+                await battle_storage.delete_battle(battle_id)
 
     except Exception as e:
+        await session.rollback()
         logger.exception(f"❌ Ошибка обработки WebApp данных: {e}")
         await message.answer(json.dumps({"type": "error", "message": str(e)}))
@@ -9,13 +9,17 @@ from aiogram.types import (
     InlineKeyboardButton,
 )
 from datetime import datetime
+import asyncio
 import logging
 
-from database.base import AsyncSessionLocal
-from database.crud import get_user_or_create
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.models.user import User
 from game.expedition_system import ExpeditionManager
 from bot.states import ExpeditionStates
+from bot.middlewares import ResolvedUser
+from services.telegram_sender import Priority, send_priority
+from services.expedition_scheduler import expedition_scheduler
+from services.file_id_cache import card_file_ids
 from bot.keyboards import (
     expedition_main_keyboard,
     expedition_cards_keyboard,
@@ -28,20 +32,20 @@ logger = logging.getLogger(__name__)
 
 
 @router.message(Command("expedition"))
-async def cmd_expedition(message: Message):
+async def cmd_expedition(
+    message: Message, session: AsyncSession, db_user: ResolvedUser
+):
     """Главное меню экспедиций"""
     try:
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, message.from_user.id)
+        user = await session.get(User, db_user.id)
 
-            active, uncollected = await ExpeditionManager.get_active_expeditions(
-                session, user.id
-            )
-            await session.commit()
+        active, uncollected = await ExpeditionManager.get_active_expeditions(
+            session, user.id
+        )
 
-            free_slots = user.expeditions_slots - len(active)
+        free_slots = user.expeditions_slots - len(active)
 
-            text = f"""
+        text = f"""
     <b>🏕️ ЭКСПЕДИЦИИ</b>
     
     📊 <b>Ваши слоты:</b> {user.expeditions_slots}
@@ -70,12 +74,12 @@ async def cmd_expedition(message: Message):
     • +50% награды за карты из одного аниме
     • x1-x3 за количество карт
     """
-            await message.answer(
-                text,
-                reply_markup=expedition_main_keyboard(
-                    len(active), len(uncollected), user.expeditions_slots, free_slots
-                ),
-            )
+        await message.answer(
+            text,
+            reply_markup=expedition_main_keyboard(
+                len(active), len(uncollected), user.expeditions_slots, free_slots
+            ),
+        )
 
     except Exception as e:
         logger.exception(f"Ошибка cmd_expedition: {e}")
@@ -83,20 +87,20 @@ async def cmd_expedition(message: Message):
 
 
 @router.callback_query(F.data == "expedition", StateFilter("*"))
-async def exped_main_menu(callback: CallbackQuery):
+async def exped_main_menu(
+    callback: CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
     """Возврат в главное меню экспедиций"""
     try:
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, callback.from_user.id)
+        user = await session.get(User, db_user.id)
 
-            active, uncollected = await ExpeditionManager.get_active_expeditions(
-                session, user.id
-            )
-            await session.commit()
+        active, uncollected = await ExpeditionManager.get_active_expeditions(
+            session, user.id
+        )
 
-            free_slots = user.expeditions_slots - len(active)
+        free_slots = user.expeditions_slots - len(active)
 
-            text = f"""
+        text = f"""
     <b>🏕️ ЭКСПЕДИЦИИ</b>
     
     📊 <b>Ваши слоты:</b> {user.expeditions_slots}
@@ -125,13 +129,13 @@ async def exped_main_menu(callback: CallbackQuery):
     • +50% награды за карты из одного аниме
     • x1-x3 за количество карт
     """
-            await callback.message.edit_text(
-                text,
-                reply_markup=expedition_main_keyboard(
-                    len(active), len(uncollected), user.expeditions_slots, free_slots
-                ),
-            )
-            await callback.answer()
+        await callback.message.edit_text(
+            text,
+            reply_markup=expedition_main_keyboard(
+                len(active), len(uncollected), user.expeditions_slots, free_slots
+            ),
+        )
+        await callback.answer()
 
     except Exception as e:
         logger.exception(f"Ошибка exped_main_menu: {e}")
@@ -139,7 +143,12 @@ async def exped_main_menu(callback: CallbackQuery):
 
 
 @router.callback_query(F.data.startswith("exped_new_"))
-async def exped_new_start(callback: CallbackQuery, state: FSMContext):
+async def exped_new_start(
+    callback: CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    db_user: ResolvedUser,
+):
     """Начало новой экспедиции - выбор карт"""
     try:
         duration = callback.data.replace("exped_new_", "")  # short, medium, long
@@ -149,46 +158,37 @@ async def exped_new_start(callback: CallbackQuery, state: FSMContext):
         await state.update_data(selected_cards=[])
         await state.set_state(ExpeditionStates.choosing_cards)
 
-        # Показываем доступные карты
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, callback.from_user.id)
-            cards = await ExpeditionManager.get_available_cards(session, user.id)
-
-            # 🔍 ДОБАВЛЯЕМ ОТЛАДКУ
-            logger.info(f"Найдено доступных карт: {len(cards)}")
-            if cards:
-                for user_card, card in cards[:3]:
-                    logger.info(
-                        f"  - Карта: {card.card_name} [{card.rarity}], Ур.{user_card.level}, ID: {user_card.id}"
-                    )
-                    logger.info(
-                        f"    is_in_deck: {user_card.is_in_deck}, is_in_expedition: {user_card.is_in_expedition}"
-                    )
+        # Снимок доступных карт на время выбора: дальше нажатия не ходят в БД
+        user = db_user
+        cards = await ExpeditionManager.snapshot_candidates(session, user.id)
+        await state.update_data(candidates=cards)
 
-            if not cards:
-                await callback.message.edit_text(
-                    "❌ <b>Нет карт для экспедиции!</b>\n\n"
-                    "Карты должны быть:\n"
-                    "• Не в колоде\n"
-                    "• Не в другой экспедиции\n\n"
-                    "Откройте пачку: /open_pack",
-                    reply_markup=InlineKeyboardMarkup(
-                        inline_keyboard=[
-                            [
-                                InlineKeyboardButton(
-                                    text="« Назад", callback_data="expedition"
-                                )
-                            ]
+        logger.info(f"Найдено доступных карт: {len(cards)}")
+
+        if not cards:
+            await callback.message.edit_text(
+                "❌ <b>Нет карт для экспедиции!</b>\n\n"
+                "Карты должны быть:\n"
+                "• Не в колоде\n"
+                "• Не в другой экспедиции\n\n"
+                "Откройте пачку: /open_pack",
+                reply_markup=InlineKeyboardMarkup(
+                    inline_keyboard=[
+                        [
+                            InlineKeyboardButton(
+                                text="« Назад", callback_data="expedition"
+                            )
                         ]
-                    ),
-                )
-                await callback.answer()
-                return
+                    ]
+                ),
+            )
+            await callback.answer()
+            return
 
-            # Получаем количество карт для отображения
-            card_count = len(cards)
+        # Получаем количество карт для отображения
+        card_count = len(cards)
 
-            text = f"""
+        text = f"""
     <b>🏕️ ВЫБЕРИТЕ КАРТЫ</b>
     
     📊 Доступно карт: {card_count}
@@ -197,10 +197,10 @@ async def exped_new_start(callback: CallbackQuery, state: FSMContext):
     
     💡 <b>Бонус +50%</b> если все карты из одного аниме!
     """
-            await callback.message.edit_text(
-                text, reply_markup=expedition_cards_keyboard(cards, [])
-            )
-            await callback.answer()
+        await callback.message.edit_text(
+            text, reply_markup=expedition_cards_keyboard(cards, [])
+        )
+        await callback.answer()
 
     except Exception as e:
         logger.exception(f"Ошибка exped_new_start: {e}")
@@ -211,15 +211,19 @@ async def exped_new_start(callback: CallbackQuery, state: FSMContext):
     F.data.startswith("exped_select_"), StateFilter(ExpeditionStates.choosing_cards)
 )
 async def exped_select_card(callback: CallbackQuery, state: FSMContext):
-    """Выбор/отмена выбора карты"""
+    """Выбор/отмена выбора карты (только по снимку из FSM)"""
     try:
         card_id = int(callback.data.split("_")[-1])
 
         # Получаем текущее состояние
         data = await state.get_data()
         selected = set(data.get("selected_cards", []))  # data.get("selected_cards", [])
+        cards = data.get("candidates", [])
 
         # Добавляем или удаляем
+        if card_id not in {c["id"] for c in cards}:
+            await callback.answer("❌ Карта недоступна", show_alert=True)
+            return
         if card_id in selected:
             selected.remove(card_id)
             action = "❌ Удалена"
@@ -233,12 +237,6 @@ async def exped_select_card(callback: CallbackQuery, state: FSMContext):
         # Сохраняем
         await state.update_data(selected_cards=list(selected))
 
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(
-                session, callback.from_user.id
-            )  # ПОЛУЧАЕМ user
-            cards = await ExpeditionManager.get_available_cards(session, user.id)
-
         await callback.message.edit_reply_markup(
             reply_markup=expedition_cards_keyboard(cards, list(selected))
         )
@@ -264,21 +262,19 @@ async def exped_confirm_cards(callback: CallbackQuery, state: FSMContext):
             await callback.answer("❌ Выберите хотя бы 1 карту!", show_alert=True)
             return
 
-        # Рассчитываем награды для показа
+        # Рассчитываем награды для показа по снимку (окончательно — при старте)
         duration_map = {"short": 30, "medium": 120, "long": 360}
-        async with AsyncSessionLocal() as session:
-            rewards = await ExpeditionManager.calculate_rewards(
-                session, selected, duration_map[duration]
-            )
-            await session.commit()
+        rewards = ExpeditionManager.preview_rewards(
+            data.get("candidates", []), selected, duration_map[duration]
+        )
 
-            duration_names = {
-                "short": "30 минут",
-                "medium": "2 часа",
-                "long": "6 часов",
-            }
+        duration_names = {
+            "short": "30 минут",
+            "medium": "2 часа",
+            "long": "6 часов",
+        }
 
-            text = f"""
+        text = f"""
     <b>🏕️ ПОДТВЕРЖДЕНИЕ ЭКСПЕДИЦИИ</b>
     
     📊 <b>Детали:</b>
@@ -293,12 +289,12 @@ async def exped_confirm_cards(callback: CallbackQuery, state: FSMContext):
     
     ✅ Отправляем в экспедицию?
     """
-            await state.set_state(ExpeditionStates.confirm)
+        await state.set_state(ExpeditionStates.confirm)
 
-            await callback.message.edit_text(
-                text, reply_markup=expedition_confirm_keyboard(duration, len(selected))
-            )
-            await callback.answer()
+        await callback.message.edit_text(
+            text, reply_markup=expedition_confirm_keyboard(duration, len(selected))
+        )
+        await callback.answer()
 
     except Exception as e:
         logger.exception(f"Ошибка exped_confirm_cards: {e}")
@@ -308,7 +304,12 @@ async def exped_confirm_cards(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(
     F.data.startswith("exped_start_"), StateFilter(ExpeditionStates.confirm)
 )
-async def exped_start_final(callback: CallbackQuery, state: FSMContext):
+async def exped_start_final(
+    callback: CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    db_user: ResolvedUser,
+):
     """Финальный старт экспедиции"""
     try:
         duration = callback.data.replace("exped_start_", "")
@@ -324,28 +325,28 @@ async def exped_start_final(callback: CallbackQuery, state: FSMContext):
             return
 
         # Запускаем экспедицию
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, callback.from_user.id)
-            logger.info(
-                f"👤 Пользователь: id={user.id}, telegram_id={callback.from_user.id}"
-            )
+        user = db_user
+        logger.info(
+            f"👤 Пользователь: id={user.id}, telegram_id={callback.from_user.id}"
+        )
 
-            expedition = await ExpeditionManager.start_expedition(
-                session, user.id, selected, duration
-            )
+        expedition = await ExpeditionManager.start_expedition(
+            session, user.id, selected, duration
+        )
 
-            logger.info(f"✅ Экспедиция создана: id={expedition.id}")
+        logger.info(f"✅ Экспедиция создана: id={expedition.id}")
 
-            await session.commit()
-            logger.info("✅ Коммит успешен")
+        await session.commit()
+        logger.info("✅ Коммит успешен")
+        expedition_scheduler.schedule(expedition.id, expedition.ends_at)
 
-            # Получаем время окончания
-            end_time = expedition.ends_at.strftime("%H:%M %d.%m.%Y")
-            time_left = expedition.ends_at - datetime.now()
-            hours = time_left.seconds // 3600
-            minutes = (time_left.seconds % 3600) // 60
+        # Получаем время окончания
+        end_time = expedition.ends_at.strftime("%H:%M %d.%m.%Y")
+        time_left = expedition.ends_at - datetime.now()
+        hours = time_left.seconds // 3600
+        minutes = (time_left.seconds % 3600) // 60
 
-            text = f"""
+        text = f"""
         <b>✅ ЭКСПЕДИЦИЯ НАЧАТА!</b>
         
         📊 <b>Информация:</b>
@@ -361,104 +362,105 @@ async def exped_start_final(callback: CallbackQuery, state: FSMContext):
         💡 <b>Совет:</b>
         Возвращайтесь через {hours}ч {minutes}м за наградой!
         """
-            # Очищаем состояние
-            await state.clear()
+        # Очищаем состояние
+        await state.clear()
 
-            await callback.message.edit_text(
-                text,
-                reply_markup=InlineKeyboardMarkup(
-                    inline_keyboard=[
-                        [
-                            InlineKeyboardButton(
-                                text="🏠 В меню экспедиций", callback_data="expedition"
-                            )
-                        ]
+        await callback.message.edit_text(
+            text,
+            reply_markup=InlineKeyboardMarkup(
+                inline_keyboard=[
+                    [
+                        InlineKeyboardButton(
+                            text="🏠 В меню экспедиций", callback_data="expedition"
+                        )
                     ]
-                ),
-            )
-            await callback.answer("Экспедиция начата! 🎉")
+                ]
+            ),
+        )
+        await callback.answer("Экспедиция начата! 🎉")
 
     except ValueError as e:
+        await session.rollback()
         await callback.answer(str(e), show_alert=True)
         await state.clear()
     except Exception as e:
+        await session.rollback()
         logger.exception(f"Ошибка exped_start_final: {e}")
         await callback.answer("❌ Произошла ошибка", show_alert=True)
         await state.clear()
 
 
 @router.callback_query(F.data == "exped_list", StateFilter("*"))
-async def exped_list(callback: CallbackQuery):
+async def exped_list(
+    callback: CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
     """Список активных экспедиций"""
     try:
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(
-                session, callback.from_user.id
-            )  # ПОЛУЧАЕМ user
-            active, uncollected = await ExpeditionManager.get_active_expeditions(
-                session, user.id
-            )
+        user = db_user
+        active, uncollected = await ExpeditionManager.get_active_expeditions(
+            session, user.id
+        )
 
-            if not active and not uncollected:
-                await callback.message.edit_text(
-                    "📋 <b>У вас нет активных экспедиций</b>\n\n"
-                    "Начните новую экспедицию!",
-                    reply_markup=InlineKeyboardMarkup(
-                        inline_keyboard=[
-                            [
-                                InlineKeyboardButton(
-                                    text="🏕️ Новая экспедиция",
-                                    callback_data="exped_new_short",
-                                )
-                            ],
-                            [
-                                InlineKeyboardButton(
-                                    text="« Назад", callback_data="expedition"
-                                )
-                            ],
-                        ]
-                    ),
-                )
-                await callback.answer()
-                return
+        if not active and not uncollected:
+            await callback.message.edit_text(
+                "📋 <b>У вас нет активных экспедиций</b>\n\n"
+                "Начните новую экспедицию!",
+                reply_markup=InlineKeyboardMarkup(
+                    inline_keyboard=[
+                        [
+                            InlineKeyboardButton(
+                                text="🏕️ Новая экспедиция",
+                                callback_data="exped_new_short",
+                            )
+                        ],
+                        [
+                            InlineKeyboardButton(
+                                text="« Назад", callback_data="expedition"
+                            )
+                        ],
+                    ]
+                ),
+            )
+            await callback.answer()
+            return
 
-            text = "<b>📋 МОИ ЭКСПЕДИЦИИ</b>\n\n"
-
-            # Сначала незабранные (готовые)
-            if uncollected:
-                text += f"<b>✅ ГОТОВО К ЗАБОРУ ({len(uncollected)}):</b>\n"
-                for exp in uncollected:
-                    text += f"• {exp.name} - {exp.reward_coins}💰 {exp.reward_dust}✨\n"
-                text += "\n"
-
-            # Потом активные
-            if active:
-                now = datetime.now()
-                text += f"<b> ⏳ АКТИВНЫЕ ({len(active)}): </b>\n"
-                for exp in active:
-                    time_left = exp.ends_at - now
-                    total_seconds = int(time_left.total_seconds())
-
-                    if total_seconds <= 0:
-                        status = "✅ Успешна!"
+        text = "<b>📋 МОИ ЭКСПЕДИЦИИ</b>\n\n"
+
+        # Сначала незабранные (готовые)
+        if uncollected:
+            text += f"<b>✅ ГОТОВО К ЗАБОРУ ({len(uncollected)}):</b>\n"
+            for exp in uncollected:
+                text += f"• {exp.name} - {exp.reward_coins}💰 {exp.reward_dust}✨\n"
+            text += "\n"
+
+        # Потом активные
+        if active:
+            now = datetime.now()
+            text += f"<b> ⏳ АКТИВНЫЕ ({len(active)}): </b>\n"
+            for exp in active:
+                time_left = exp.ends_at - now
+                total_seconds = int(time_left.total_seconds())
+
+                if total_seconds <= 0:
+                    status = "✅ Успешна!"
+                else:
+                    minutes = total_seconds // 60
+                    seconds = total_seconds % 60
+
+                    if minutes > 0:
+                        status = f"⏳ {minutes}м {seconds}с"
                     else:
-                        minutes = total_seconds // 60
-                        seconds = total_seconds % 60
+                        status = f"⏳ {seconds}с"
 
-                        if minutes > 0:
-                            status = f"⏳ {minutes}м {seconds}с"
-                        else:
-                            status = f"⏳ {seconds}с"
+                text += f"• {exp.name} - {status}\n"
 
-                    text += f"• {exp.name} - {status}\n"
-
-                await callback.message.edit_text(
-                    text,
-                    reply_markup=expedition_list_keyboard(
-                        active + uncollected, len(uncollected)
-                    ),
-                )
-                await callback.answer()
+            await callback.message.edit_text(
+                text,
+                reply_markup=expedition_list_keyboard(
+                    active + uncollected, len(uncollected)
+                ),
+            )
+            await callback.answer()
 
     except Exception as e:
         logger.exception(f"Ошибка exped_list: {e}")
@@ -466,75 +468,88 @@ async def exped_list(callback: CallbackQuery):
 
 
 @router.callback_query(F.data == "exped_claim_all", StateFilter("*"))
-async def exped_claim_all(callback: CallbackQuery):
+async def exped_claim_all(
+    callback: CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
     """Забрать награды всех экспедиций"""
     try:
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(
-                session, callback.from_user.id
-            )  # ПОЛУЧАЕМ user
-            rewards = await ExpeditionManager.claim_all_expeditions(session, user.id)
-            await session.commit()
-
-            if rewards["count"] == 0:
-                await callback.answer("Нет готовых экспедиций!", show_alert=True)
-                return
+        user = db_user
+        rewards = await ExpeditionManager.claim_all_expeditions(session, user.id)
+        await session.commit()
+
+        if rewards["count"] == 0:
+            await callback.answer("Нет готовых экспедиций!", show_alert=True)
+            return
 
-            text = f"""
+        text = f"""
 
 📊 <b>Экспедиций завершено:</b> {rewards["count"]}
 
 💰 <b>Монеты:</b> +{rewards["coins"]}
 ✨ <b>Пыль:</b> +{rewards["dust"]}
 """
-            # Если есть карты - отправляем их по одной с изображениями
-            if rewards["cards"]:
-                await callback.message.answer("<b>🎁 ПОЛУЧЕНЫ НАГРАДЫ!</b>")
-                for card in rewards["cards"]:
-                    emoji = {
-                        "E": "⚪",
-                        "D": "🟢",
-                        "C": "⚡",
-                        "B": "💫",
-                        "A": "🔮",
-                        "S": "⭐",
-                        "ASS": "✨",
-                        "SSS": "🏆",
-                    }.get(card.rarity, "🃏")
-
-                    await callback.message.answer_photo(
-                        photo=card.original_url,
+        # Если есть карты - ставим все фото в очередь разом:
+        # планировщик склеит их в альбом и соблюдёт лимиты Telegram
+        if rewards["cards"]:
+            await callback.message.answer("<b>🎁 ПОЛУЧЕНЫ НАГРАДЫ!</b>")
+            photos = []
+            for card in rewards["cards"]:
+                emoji = {
+                    "E": "⚪",
+                    "D": "🟢",
+                    "C": "⚡",
+                    "B": "💫",
+                    "A": "🔮",
+                    "S": "⭐",
+                    "ASS": "✨",
+                    "SSS": "🏆",
+                }.get(card.rarity, "🃏")
+
+                photos.append(
+                    callback.message.answer_photo(
+                        photo=card_file_ids.photo_for(card),
                         caption=f"{emoji} <b>{card.card_name}</b> [{card.rarity}]\n✨ Новая карта из экспедиции!\n {text}",
                     )
+                )
 
-            # Кнопка возврата
-            await callback.message.answer(
-                "🏠 Вернуться в меню: ",
-                reply_markup=InlineKeyboardMarkup(
-                    inline_keyboard=[
-                        [
-                            InlineKeyboardButton(
-                                text="🏕️ Экспедиций", callback_data="expedition"
-                            )
-                        ],
-                        [
-                            InlineKeyboardButton(
-                                text="🏠 Главное", callback_data="back_to_main"
-                            )
-                        ],
-                    ]
-                ),
-            )
+            with send_priority(Priority.NOTIFICATION):
+                sent = await asyncio.gather(*photos)
+            card_file_ids.remember_many(rewards["cards"], sent)
+
+        # Кнопка возврата
+        await callback.message.answer(
+            "🏠 Вернуться в меню: ",
+            reply_markup=InlineKeyboardMarkup(
+                inline_keyboard=[
+                    [
+                        InlineKeyboardButton(
+                            text="🏕️ Экспедиций", callback_data="expedition"
+                        )
+                    ],
+                    [
+                        InlineKeyboardButton(
+                            text="🏠 Главное", callback_data="back_to_main"
+                        )
+                    ],
+                ]
+            ),
+        )
 
-            await callback.answer()
+        await callback.answer()
 
     except Exception as e:
+        await session.rollback()
         logger.exception(f"Ошибка exped_claim_all: {e}")
         await callback.answer("❌ Произошла ошибка", show_alert=True)
 
 
 @router.callback_query(F.data == "exped_back_to_cards", StateFilter("*"))
-async def exped_back_to_cards(callback: CallbackQuery, state: FSMContext):
+async def exped_back_to_cards(
+    callback: CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    db_user: ResolvedUser,
+):
     """Вернуться к выбору карт"""
     try:
         data = await state.get_data()
@@ -542,13 +557,12 @@ async def exped_back_to_cards(callback: CallbackQuery, state: FSMContext):
 
         await state.set_state(ExpeditionStates.choosing_cards)
 
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(
-                session, callback.from_user.id
-            )  # ПОЛУЧАЕМ user
-            cards = await ExpeditionManager.get_available_cards(session, user.id)
+        cards = data.get("candidates")
+        if cards is None:
+            cards = await ExpeditionManager.snapshot_candidates(session, db_user.id)
+            await state.update_data(candidates=cards)
 
-            text = """
+        text = """
     <b>🏕️ ВЫБЕРИТЕ КАРТЫ</b>
     
     Можно выбрать от 1 до 3 карт.
@@ -556,10 +570,10 @@ async def exped_back_to_cards(callback: CallbackQuery, state: FSMContext):
     
     💡 <b>Бонус +50%</b> если все карты из одного аниме!
     """
-            await callback.message.edit_text(
-                text, reply_markup=expedition_cards_keyboard(cards, selected)
-            )
-            await callback.answer()
+        await callback.message.edit_text(
+            text, reply_markup=expedition_cards_keyboard(cards, selected)
+        )
+        await callback.answer()
 
     except Exception as e:
         logger.exception(f"Ошибка exped_back_to_cards: {e}")
@@ -5,16 +5,15 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from datetime import datetime
 import logging
-import aiohttp
-import io
-from PIL import Image
-from aiogram.types import BufferedInputFile
+from aiogram.exceptions import TelegramBadRequest
 
-from database.base import AsyncSessionLocal
-from database.crud import get_user_or_create
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.models.user import User
 from game.quiz_system import QuizManager
 from bot.states import QuizStates
+from bot.middlewares import ResolvedUser
+from services.quiz_images import quiz_images
+from services.quiz_pool import quiz_pool
 from bot.keyboards import (
     quiz_start_keyboard,
     quiz_options_keyboard,
@@ -27,29 +26,30 @@ logger = logging.getLogger(__name__)
 
 
 @router.message(Command("quiz"))
-async def cmd_quiz(message: types.Message):
+async def cmd_quiz(
+    message: types.Message, session: AsyncSession, db_user: ResolvedUser
+):
     """Команда /quiz - вход в викторину"""
     try:
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, message.from_user.id)
-
-            can_take, minutes_left = await QuizManager.can_take_quiz(user)
-
-            if not can_take:
-                await message.answer(
-                    f"⏳ <b>Викторина ещё недоступна!</b>\n\n"
-                    f"Следующая попытка через {minutes_left} минут.\n\n"
-                    f"Возвращайтесь позже!",
-                    reply_markup=InlineKeyboardMarkup(
-                        inline_keyboard=[
-                            [InlineKeyboardButton(text="« Назад", callback_data="back_to_main")]
-                        ]
-                    )
+        user = await session.get(User, db_user.id)
+
+        can_take, minutes_left = await QuizManager.can_take_quiz(user)
+
+        if not can_take:
+            await message.answer(
+                f"⏳ <b>Викторина ещё недоступна!</b>\n\n"
+                f"Следующая попытка через {minutes_left} минут.\n\n"
+                f"Возвращайтесь позже!",
+                reply_markup=InlineKeyboardMarkup(
+                    inline_keyboard=[
+                        [InlineKeyboardButton(text="« Назад", callback_data="back_to_main")]
+                    ]
                 )
-                return
+            )
+            return
 
-            # Показываем стартовое меню
-            text = """
+        # Показываем стартовое меню
+        text = """
 <b>🎯 ВИКТОРИНА "УГАДАЙ АНИМЕ"</b>
 
 <b>📋 Правила:</b>
@@ -64,13 +64,13 @@ async def cmd_quiz(message: types.Message):
 
 <b>🎮 Готовы проверить свои знания?</b>
 """.format(
-                coins=QuizManager.REWARDS["coins_per_correct"],
-                dust=QuizManager.REWARDS["dust_per_correct"],
-                bonus_coins=QuizManager.REWARDS["bonus_for_all_correct"]["coins"],
-                bonus_dust=QuizManager.REWARDS["bonus_for_all_correct"]["dust"]
-            )
+            coins=QuizManager.REWARDS["coins_per_correct"],
+            dust=QuizManager.REWARDS["dust_per_correct"],
+            bonus_coins=QuizManager.REWARDS["bonus_for_all_correct"]["coins"],
+            bonus_dust=QuizManager.REWARDS["bonus_for_all_correct"]["dust"]
+        )
 
-            await message.answer(text, reply_markup=quiz_start_keyboard())
+        await message.answer(text, reply_markup=quiz_start_keyboard())
 
     except Exception as e:
         logger.exception(f"Ошибка cmd_quiz: {e}")
@@ -78,51 +78,57 @@ async def cmd_quiz(message: types.Message):
 
 
 @router.callback_query(F.data == "quiz_menu")
-async def quiz_menu(callback: types.CallbackQuery):
+async def quiz_menu(
+    callback: types.CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
     """Меню викторины из главного меню"""
-    await cmd_quiz(callback.message)
+    await cmd_quiz(callback.message, session, db_user)
     await callback.answer()
 
 
 @router.callback_query(F.data == "quiz_start")
-async def quiz_start(callback: types.CallbackQuery, state: FSMContext):
+async def quiz_start(
+    callback: types.CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    db_user: ResolvedUser,
+):
     """Начать викторину"""
     try:
         
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, callback.from_user.id)
-
-            # Проверяем еще раз (на случай если прошли через меню)
-            can_take, minutes_left = await QuizManager.can_take_quiz(user)
-
-            if not can_take:
-                await callback.message.edit_text(
-                    f"⏳ <b>Викторина ещё недоступна!</b>\n\n"
-                    f"Следующая попытка через {minutes_left} минут.",
-                    reply_markup=InlineKeyboardMarkup(
-                        inline_keyboard=[
-                            [InlineKeyboardButton(text="« Назад", callback_data="back_to_main")]
-                        ]
-                    )
+        user = await session.get(User, db_user.id)
+
+        # Проверяем еще раз (на случай если прошли через меню)
+        can_take, minutes_left = await QuizManager.can_take_quiz(user)
+
+        if not can_take:
+            await callback.message.edit_text(
+                f"⏳ <b>Викторина ещё недоступна!</b>\n\n"
+                f"Следующая попытка через {minutes_left} минут.",
+                reply_markup=InlineKeyboardMarkup(
+                    inline_keyboard=[
+                        [InlineKeyboardButton(text="« Назад", callback_data="back_to_main")]
+                    ]
                 )
-                await callback.answer()
-                return
-
-            # Генерируем вопросы
-            questions = await QuizManager.generate_quiz(session)
-
-            # Сохраняем состояние
-            await state.update_data(
-                questions=questions,
-                current_question=0,
-                correct_answers=0,
-                message_ids=[]  # для хранения ID сообщений, чтобы не засорять чат
             )
-            await state.set_state(QuizStates.playing)
-
-            # Показываем первый вопрос
-            await show_question(callback.message, 0, questions, state)
             await callback.answer()
+            return
+
+        # Берём готовую викторину из пула, если пул пуст — генерируем
+        questions = quiz_pool.pop() or await QuizManager.generate_quiz(session)
+
+        # Сохраняем состояние
+        await state.update_data(
+            questions=questions,
+            current_question=0,
+            correct_answers=0,
+            message_ids=[]  # для хранения ID сообщений, чтобы не засорять чат
+        )
+        await state.set_state(QuizStates.playing)
+
+        # Показываем первый вопрос
+        await show_question(callback.message, 0, questions, state)
+        await callback.answer()
 
     except Exception as e:
         logger.exception(f"Ошибка quiz_start: {e}")
@@ -140,34 +146,31 @@ async def show_question(message: types.Message, index: int, questions: list, sta
     
     <b>❓ Из какого аниме этот персонаж?</b>
         """
-        # Скачиваем изображение
-        async with aiohttp.ClientSession() as session:
-            async with session.get(question['image_url']) as resp:
-                img_data = await resp.read()
-
-        # Открываем и обрезаем
-        img = Image.open(io.BytesIO(img_data))
-        width, height = img.size
-
-        # Обрезаем нижние 18% где обычно название аниме
-        crop_height = int(height * 0.82)
-        cropped = img.crop((0, 0, width, crop_height))
-
-        # Сохраняем в байты
-        bio = io.BytesIO()
-        cropped.save(bio, format='PNG')
-        bio.seek(0)
-
-        sent_msg = await message.answer_photo(
-            photo=BufferedInputFile(bio.read(), filename="quiz_card.png"),
-            caption=text,
-            reply_markup=quiz_options_keyboard(
-                question['options'],
-                index,
-                len(questions)
-            )
+        keyboard = quiz_options_keyboard(
+            question['options'],
+            index,
+            len(questions)
         )
-        
+
+        # Обрезанная картинка из кэша (или file_id, если уже отправляли)
+        card_id, image_url = question['card_id'], question['image_url']
+        photo = await quiz_images.photo_for(card_id, image_url)
+        try:
+            sent_msg = await message.answer_photo(
+                photo=photo, caption=text, reply_markup=keyboard
+            )
+        except TelegramBadRequest:
+            if not isinstance(photo, str):
+                raise
+            # file_id больше не действует — отправляем файл заново
+            quiz_images.forget(card_id, image_url)
+            sent_msg = await message.answer_photo(
+                photo=await quiz_images.photo_for(card_id, image_url),
+                caption=text,
+                reply_markup=keyboard
+            )
+        quiz_images.remember(card_id, image_url, sent_msg)
+
         # Сохраняем ID сообщения, чтобы потом удалить
         data = await state.get_data()
         message_ids = data.get("message_ids", [])
@@ -179,7 +182,12 @@ async def show_question(message: types.Message, index: int, questions: list, sta
 
 
 @router.callback_query(F.data.startswith("quiz_answer_"), QuizStates.playing)
-async def quiz_answer(callback: types.CallbackQuery, state: FSMContext):
+async def quiz_answer(
+    callback: types.CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    db_user: ResolvedUser,
+):
     """Обработка ответа на вопрос"""
     try:
         answer_index = int(callback.data.replace("quiz_answer_", ""))
@@ -213,7 +221,9 @@ async def quiz_answer(callback: types.CallbackQuery, state: FSMContext):
         # Если это был последний вопрос
         if current + 1 >= len(questions):
             # Показываем результат
-            await show_quiz_result(callback.message, correct_answers, len(questions), state)
+            await show_quiz_result(
+                callback.message, correct_answers, len(questions), state, session, db_user
+            )
         else:
             # Переходим к следующему вопросу
             await state.update_data(current_question=current + 1)
@@ -264,22 +274,28 @@ async def quiz_next(callback: types.CallbackQuery, state: FSMContext):
         await callback.answer("❌ Ошибка", show_alert=True)
 
 
-async def show_quiz_result(message: types.Message, correct: int, total: int, state: FSMContext):
+async def show_quiz_result(
+    message: types.Message,
+    correct: int,
+    total: int,
+    state: FSMContext,
+    session: AsyncSession,
+    db_user: ResolvedUser,
+):
     """Показать результат викторины"""
 
     # Рассчитываем награды
     rewards = QuizManager.calculate_rewards(correct)
 
     # Обновляем пользователя в БД
-    async with AsyncSessionLocal() as session:
-        user = await get_user_or_create(session, message.chat.id)
+    user = await session.get(User, db_user.id)
 
-        # Начисляем награды
-        user.coins += rewards["coins"]
-        user.dust += rewards["dust"]
-        user.last_quiz_time = datetime.now()
+    # Начисляем награды
+    user.coins += rewards["coins"]
+    user.dust += rewards["dust"]
+    user.last_quiz_time = datetime.now()
 
-        await session.commit()
+    await session.commit()
 
     # Формируем текст результата
     bonus_text = "🎉 <b>БОНУС ЗА ВСЕ ПРАВИЛЬНЫЕ!</b>\n" if rewards["bonus"] else ""
@@ -309,9 +325,14 @@ async def show_quiz_result(message: types.Message, correct: int, total: int, sta
 
 
 @router.callback_query(F.data == "quiz_restart")
-async def quiz_restart(callback: types.CallbackQuery, state: FSMContext):
+async def quiz_restart(
+    callback: types.CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    db_user: ResolvedUser,
+):
     """Перезапустить викторину (если можно)"""
-    await quiz_start(callback, state)
+    await quiz_start(callback, state, session, db_user)
 
 
 @router.callback_query(F.data == "quiz_again_locked")
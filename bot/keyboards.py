@@ -2,9 +2,7 @@
 from aiogram import Bot
 from aiogram.types import BotCommand, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from database.models.card import Card
-from database.models.user_card import UserCard
-from typing import List, Tuple
+from typing import List
 from datetime import datetime
 
 
@@ -84,28 +82,25 @@ def rarity_keyboard() -> InlineKeyboardMarkup:
 
 
 def collection_keyboard(
-    page: int, has_next: bool, rarity: str = None
+    prev_cursor: str = None, next_cursor: str = None, rarity: str = None
 ) -> InlineKeyboardMarkup:
-    """Клавиатура для пагинации коллекции с изображениями"""
+    """Клавиатура для пагинации коллекции с изображениями (курсоры из Page)"""
     buttons = []
+    suffix = f":{rarity}" if rarity else ""
 
     nav_row = []
-    if page > 0:
+    if prev_cursor:
         nav_row.append(
             InlineKeyboardButton(
                 text="⬅️ Назад",
-                callback_data=(
-                    f"col_page:{page-1}:{rarity}" if rarity else f"col_page:{page-1}"
-                ),
+                callback_data=f"col_page:{prev_cursor}{suffix}",
             )
         )
-    if has_next:
+    if next_cursor:
         nav_row.append(
             InlineKeyboardButton(
                 text="➡️ Вперёд",
-                callback_data=(
-                    f"col_page:{page+1}:{rarity}" if rarity else f"col_page:{page+1}"
-                ),
+                callback_data=f"col_page:{next_cursor}{suffix}",
             )
         )
 
@@ -160,26 +155,26 @@ def expedition_main_keyboard(
 
 
 def expedition_cards_keyboard(
-    cards: List[Tuple[UserCard, Card]], selected_ids: List[int]
+    cards: List[dict], selected_ids: List[int]
 ) -> InlineKeyboardMarkup:
-    """Клавиатура выбора карт для экспедиции"""
+    """Клавиатура выбора карт для экспедиции (cards — снимок snapshot_candidates)"""
     builder = InlineKeyboardBuilder()
 
-    for user_card, card in cards[:20]:  # Максимум 20 карт
-        card_id = user_card.id
+    for card in cards[:20]:  # Максимум 20 карт
+        card_id = card["id"]
         is_selected = card_id in selected_ids
 
         # Эмодзи статуса
         status = "✅ " if is_selected else ""
 
         # Обрезаем длинные названия
-        card_name = (
-            card.card_name[:20] + "..." if len(card.card_name) > 20 else card.card_name
-        )
+        card_name = card["name"] or ""
+        if len(card_name) > 20:
+            card_name = card_name[:20] + "..."
 
         builder.row(
             InlineKeyboardButton(
-                text=f"{status}{card_name} [{card.rarity}] Ур.{user_card.level}",
+                text=f"{status}{card_name} [{card['rarity']}] Ур.{card['level']}",
                 callback_data=f"exped_select_{card_id}",
             )
         )
@@ -328,11 +323,18 @@ def upgrade_card_keyboard(card_id: int) -> InlineKeyboardMarkup:
                     text="➕ Ещё +1", callback_data=f"upgrade_{card_id}"
                 ),
                 InlineKeyboardButton(
-                    text="✖️ ×5", callback_data=f"5x_upgrade_{card_id}"
+                    text="✖️ ×5", callback_data=f"upg_n5_{card_id}"
+                ),
+            ],
+            [
+                InlineKeyboardButton(
+                    text="🎯 До бонуса", callback_data=f"upg_bonus_{card_id}"
+                ),
+                InlineKeyboardButton(
+                    text="⏫ На всю пыль", callback_data=f"upg_max_{card_id}"
                 ),
             ],
             [
-                # InlineKeyboardButton(text="🎯 До бонуса", callback_data=f"upgrade_to_bonus_{card_id}"),
                 InlineKeyboardButton(
                     text="◀️ Назад", callback_data=f"view_card_{card_id}"
                 )
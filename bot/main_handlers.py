@@ -2,8 +2,10 @@
 from aiogram import Router, types, F
 from aiogram.filters import CommandStart, Command
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+from aiogram.exceptions import TelegramBadRequest
 from datetime import datetime
-from database.base import AsyncSessionLocal
+from collections import Counter
+from sqlalchemy.ext.asyncio import AsyncSession
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import StateFilter
 import logging
@@ -11,17 +13,25 @@ import logging
 from database.models.user import User
 from database.models.user_card import UserCard
 from database.models.card import Card
-from game.upgrade_calculator import get_upgrade_cost
+from game.upgrade_calculator import get_upgrade_cost, next_bonus_level
 from game.duplicate_system import check_for_duplicate, process_duplicate
 from game.expedition_system import ExpeditionManager
-from sqlalchemy import func, and_
+from sqlalchemy import and_
 
 from sqlalchemy import select
 from game.arena_ranks import get_rank_display, get_next_rank_progress
 from bot.handlers.quiz import cmd_quiz
-
+from services.file_id_cache import card_file_ids
+from services.anime_index import NO_ANIME, anime_index
+from bot.middlewares import ResolvedUser
+
+from database.crud_summary import (
+    apply_cards_added,
+    apply_card_upgraded,
+    get_summary,
+)
+from database.crud_cards import UPGRADE_EXACT, bulk_upgrade_user_card
 from database.crud import (
-    get_user_or_create,
     get_collection_stats,
     open_pack,
     get_user_cards_paginated,
@@ -40,22 +50,69 @@ WEBAPP_URL = "https://kamideckbot-production.up.railway.app/arena.html"
 router = Router()
 logger = logging.getLogger(__name__)
 
+
+# ===== ОТПРАВКА КАРТ =====
+# По file_id из кэша; если Telegram его не принял — забыть и повторить
+# по исходному URL, чтобы ошибка отправки не откатывала покупку
+
+
+async def answer_card_photo(message: types.Message, card: Card, caption: str):
+    photo = card_file_ids.photo_for(card)
+    try:
+        sent = await message.answer_photo(photo=photo, caption=caption)
+    except TelegramBadRequest as e:
+        if photo == card.original_url:
+            raise
+        logger.warning(f"file_id карты {card.id} не принят: {e}")
+        card_file_ids.forget(card.id)
+        sent = await message.answer_photo(photo=card.original_url, caption=caption)
+    card_file_ids.remember(card, sent)
+    return sent
+
+
+async def answer_card_album(message: types.Message, cards: list, captions: list):
+    photos = [card_file_ids.photo_for(card) for card in cards]
+    try:
+        sent = await message.answer_media_group(
+            [
+                types.InputMediaPhoto(media=photo, caption=caption)
+                for photo, caption in zip(photos, captions)
+            ]
+        )
+    except TelegramBadRequest as e:
+        # Какой file_id не принят, Telegram не говорит — забываем все
+        stale = [
+            card for card, photo in zip(cards, photos) if photo != card.original_url
+        ]
+        if not stale:
+            raise
+        logger.warning(f"file_id в альбоме не принят: {e}")
+        for card in stale:
+            card_file_ids.forget(card.id)
+        sent = await message.answer_media_group(
+            [
+                types.InputMediaPhoto(media=card.original_url, caption=caption)
+                for card, caption in zip(cards, captions)
+            ]
+        )
+    card_file_ids.remember_many(cards, sent)
+    return sent
+
+
 # 1. Команды (message handlers)
 
 
 # ===== START =====
 @router.message(CommandStart())
-async def cmd_start(message: types.Message, state: FSMContext):
+async def cmd_start(
+    message: types.Message,
+    state: FSMContext,
+    session: AsyncSession,
+    db_user: ResolvedUser,
+):
     await state.clear()
     try:
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(
-                session,
-                telegram_id=message.from_user.id,
-                username=message.from_user.username,
-                first_name=message.from_user.first_name,
-                last_name=message.from_user.last_name,
-            )
+        user = await session.get(User, db_user.id)
 
         uncollected = await ExpeditionManager.get_uncollected_expeditions_info(
             session, user.id
@@ -101,10 +158,11 @@ async def cmd_start(message: types.Message, state: FSMContext):
 
 # ===== PROFILE =====
 @router.message(Command("profile"))
-async def cmd_profile(message: types.Message):
+async def cmd_profile(
+    message: types.Message, session: AsyncSession, db_user: ResolvedUser
+):
     try:
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, message.from_user.id)
+        user = await session.get(User, db_user.id)
 
         uncollected = await ExpeditionManager.get_uncollected_expeditions_info(
             session, user.id
@@ -121,7 +179,7 @@ async def cmd_profile(message: types.Message):
 
         progress_bar = "█" * int(progress // 10) + "░" * (10 - int(progress // 10))
 
-        stats = await get_collection_stats(user.id)
+        stats = await get_collection_stats(user.id, session)
 
         profile_text = f"""
 <b>📊 ПРОФИЛЬ ИГРОКА</b>
@@ -163,19 +221,14 @@ ID: <code>{user.id}</code>
 
 # ===== COLLECTION =====
 @router.message(Command("collection"))
-async def cmd_collection(message: types.Message, user_id: int = None):
-
-    # Определяем какой ID использовать
-    if user_id:
-        tg_id = user_id
-    else:
-        tg_id = message.from_user.id
+async def cmd_collection(
+    message: types.Message, session: AsyncSession, db_user: ResolvedUser
+):
 
     try:
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, tg_id)
+        user = await session.get(User, db_user.id)
 
-        stats = await get_collection_stats(user.id)
+        stats = await get_collection_stats(user.id, session)
 
         collection_text = f"""
 <b>🃏 КОЛЛЕКЦИЯ КАРТ</b>
@@ -200,65 +253,61 @@ async def cmd_collection(message: types.Message, user_id: int = None):
 
 
 @router.message(Command("open_pack"))
-async def cmd_open_pack(message: types.Message):
+async def cmd_open_pack(
+    message: types.Message, session: AsyncSession, db_user: ResolvedUser
+):
     # Определяем какой ID использовать
 
     try:
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(
-                session,
-                message.from_user.id,
-                message.from_user.username,
-                message.from_user.first_name,
-                message.from_user.last_name,
+        user = await session.get(User, db_user.id)
+
+        if user.coins < 100:
+            await message.answer(
+                "❌ Недостаточно монет!\n"
+                "💰 Получите ежедневную награду: /daily\n"
+                "🏕️ Или отправьте персонажей в экспедицию: /expedition"
             )
+            return
 
-            if user.coins < 100:
-                await message.answer(
-                    "❌ Недостаточно монет!\n"
-                    "💰 Получите ежедневную награду: /daily\n"
-                    "🏕️ Или отправьте персонажей в экспедицию: /expedition"
+        cards, pack_open, new_card_ids = await open_pack(user.id, "common", session)
+
+        # Проверяем каждую карту на дубликат
+        new_cards = []
+        added = []
+        duplicates = []
+        total_dust = 0
+
+        for i, card in enumerate(cards):
+            # Проверяем, есть ли уже такая карта у пользователя
+            check = await check_for_duplicate(session, user.id, card.id)
+
+            if check["is_duplicate"]:
+                # Это дубликат - начисляем пыль
+                await process_duplicate(session, user.id, card.id, check["dust_earned"])
+                duplicates.append({"card": card, "dust": check["dust_earned"]})
+                total_dust += check["dust_earned"]
+            else:
+                # Это новая карта - добавляем в коллекцию
+                user_card = UserCard(
+                    user_id=user.id,
+                    card_id=card.id,
+                    level=1,
+                    current_power=card.base_power,
+                    current_health=card.base_health,
+                    current_attack=card.base_attack,
+                    current_defense=card.base_defense,
+                    source="pack",
                 )
-                return
-
-            cards, pack_open, new_card_ids = await open_pack(user.id, "common", session)
+                session.add(user_card)
+                new_cards.append(card)
+                added.append((user_card, card.rarity))
 
-            # Проверяем каждую карту на дубликат
-            new_cards = []
-            duplicates = []
-            total_dust = 0
+        # Обновляем счетчик карт пользователя
+        user.cards_opened = (user.cards_opened or 0) + len(new_cards)
+        await apply_cards_added(session, user.id, added)
 
-            for i, card in enumerate(cards):
-                # Проверяем, есть ли уже такая карта у пользователя
-                check = await check_for_duplicate(session, user.id, card.id)
-
-                if check["is_duplicate"]:
-                    # Это дубликат - начисляем пыль
-                    await process_duplicate(
-                        session, user.id, card.id, check["dust_earned"]
-                    )
-                    duplicates.append({"card": card, "dust": check["dust_earned"]})
-                    total_dust += check["dust_earned"]
-                else:
-                    # Это новая карта - добавляем в коллекцию
-                    user_card = UserCard(
-                        user_id=user.id,
-                        card_id=card.id,
-                        level=1,
-                        current_power=card.base_power,
-                        current_health=card.base_health,
-                        current_attack=card.base_attack,
-                        current_defense=card.base_defense,
-                        source="pack",
-                    )
-                    session.add(user_card)
-                    new_cards.append(card)
-
-            # Обновляем счетчик карт пользователя
-            user.cards_opened = (user.cards_opened or 0) + len(new_cards)
-
-            await session.commit()
-            await session.refresh(user)
+        await session.commit()
+        await session.refresh(user)
 
         # Формируем сообщение
         text = f"<b>📦 ВЫ ОТКРЫЛИ ПАЧКУ КАРТ!</b>\n\n💰 Потрачено: <code>100</code> монет\n💰 Осталось: <code>{user.coins}</code> монет\n\n"
@@ -306,59 +355,57 @@ async def cmd_open_pack(message: types.Message):
             else (duplicates[0]["card"] if duplicates else None)
         )
         if first_card:
-            await message.answer_photo(photo=first_card.original_url, caption=text)
+            await answer_card_photo(message, first_card, text)
 
         # Отправляем остальные карты
         all_cards = new_cards + [d["card"] for d in duplicates]
         if len(all_cards) > 1:
-            media_group = []
-            for card in all_cards[1:]:
-                is_new = card in new_cards
-                caption = f"{'✨ НОВАЯ' if is_new else '🔄 ДУБЛИКАТ'} {card.card_name} [{card.rarity}]"
-                media_group.append(
-                    types.InputMediaPhoto(media=card.original_url, caption=caption)
-                )
-
-            if media_group:
-                await message.answer_media_group(media_group)
+            captions = [
+                f"{'✨ НОВАЯ' if card in new_cards else '🔄 ДУБЛИКАТ'} {card.card_name} [{card.rarity}]"
+                for card in all_cards[1:]
+            ]
+            await answer_card_album(message, all_cards[1:], captions)
 
     except ValueError as e:
+        await session.rollback()
         await message.answer(f"❌ {e}")
     except Exception as e:
+        await session.rollback()
         logger.exception(f"Ошибка открытия пачки: {e}")
         await message.answer("❌ Произошла ошибка. Попробуйте позже.")
 
 
 # ===== DAILY =====
 @router.message(Command("daily"))
-async def cmd_daily(message: types.Message):
+async def cmd_daily(
+    message: types.Message, session: AsyncSession, db_user: ResolvedUser
+):
     # Определяем какой ID использовать
 
     try:
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, message.from_user.id)
-
-            if (
-                user.last_daily_tasks
-                and user.last_daily_tasks.date() == datetime.now().date()
-            ):
-                await message.answer(
-                    "❌ Вы уже получили ежедневную награду сегодня!\nЗаходите завтра в 00:00 по МСК"
-                )
-                return
+        user = await session.get(User, db_user.id)
+
+        if (
+            user.last_daily_tasks
+            and user.last_daily_tasks.date() == datetime.now().date()
+        ):
+            await message.answer(
+                "❌ Вы уже получили ежедневную награду сегодня!\nЗаходите завтра в 00:00 по МСК"
+            )
+            return
 
-            reward_coins = 100
-            reward_dust = 10
+        reward_coins = 100
+        reward_dust = 10
 
-            db_user = await session.get(User, user.id)
-            db_user.coins += reward_coins
-            db_user.dust += reward_dust
-            db_user.last_daily_tasks = datetime.now()
-            await session.commit()
+        db_user = await session.get(User, user.id)
+        db_user.coins += reward_coins
+        db_user.dust += reward_dust
+        db_user.last_daily_tasks = datetime.now()
+        await session.commit()
 
-            # Обновляем данные пользователя
-            user.coins = db_user.coins
-            user.dust = db_user.dust
+        # Обновляем данные пользователя
+        user.coins = db_user.coins
+        user.dust = db_user.dust
 
         text = f"""
 <b>🎁 ЕЖЕДНЕВНАЯ НАГРАДА</b>
@@ -374,6 +421,7 @@ async def cmd_daily(message: types.Message):
         await message.answer(text)
 
     except Exception as e:
+        await session.rollback()
         logger.exception(f"Ошибка cmd_daily: {e}")
         await message.answer("❌ Произошла ошибка. Попробуйте позже.")
 
@@ -461,22 +509,32 @@ async def collection_by_rarity(callback: types.CallbackQuery):
 
 
 @router.callback_query(F.data.startswith("rarity_"))
-async def show_rarity_collection(callback: types.CallbackQuery):
+async def show_rarity_collection(
+    callback: types.CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
     """Показать коллекцию карт по редкости"""
     try:
-        # Парсим callback_data: rarity_SSS_1 или rarity_SSS
-        parts = callback.data.split("_")
+        # Парсим callback_data: rarity_SSS_2_<курсор> или rarity_SSS
+        parts = callback.data.split("_", 3)
         rarity = parts[1].upper()
-        page = int(parts[2]) if len(parts) > 2 else 1
-
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, callback.from_user.id)
-            cards, total, total_pages = await get_user_collection(
-                user.id,
-                page=page,
-                page_size=5,  # Показываем по 5 карт на странице
-                rarity_filter=rarity,
-            )
+        cursor = parts[3] if len(parts) > 3 else None
+        page = int(parts[2]) if cursor else 1
+
+        user = db_user
+        page_size = 5  # Показываем по 5 карт на странице
+        collection_page = await get_user_collection(
+            user.id,
+            cursor=cursor,
+            page_size=page_size,
+            rarity_filter=rarity,
+            session=session,
+        )
+        cards = collection_page.items
+
+        # Всего карт — из сводки коллекции, без COUNT(*)
+        summary = await get_summary(session, user.id)
+        total = summary.rarity_counts().get(rarity, 0)
+        total_pages = max((total + page_size - 1) // page_size, page, 1)
 
         if not cards:
             await callback.message.edit_text(
@@ -531,10 +589,11 @@ async def show_rarity_collection(callback: types.CallbackQuery):
 
         # Кнопки навигации по страницам
         nav_buttons = []
-        if page > 1:
+        if collection_page.prev_cursor:
             nav_buttons.append(
                 InlineKeyboardButton(
-                    text="◀️", callback_data=f"rarity_{rarity}_{page-1}"
+                    text="◀️",
+                    callback_data=f"rarity_{rarity}_{page-1}_{collection_page.prev_cursor}",
                 )
             )
 
@@ -542,10 +601,11 @@ async def show_rarity_collection(callback: types.CallbackQuery):
             InlineKeyboardButton(text=f"{page}/{total_pages}", callback_data="noop")
         )
 
-        if page < total_pages:
+        if collection_page.next_cursor:
             nav_buttons.append(
                 InlineKeyboardButton(
-                    text="▶️", callback_data=f"rarity_{rarity}_{page+1}"
+                    text="▶️",
+                    callback_data=f"rarity_{rarity}_{page+1}_{collection_page.next_cursor}",
                 )
             )
 
@@ -585,57 +645,53 @@ async def show_rarity_collection(callback: types.CallbackQuery):
 
 
 @router.callback_query(F.data == "open_pack")
-async def cb_open_pack(callback: types.CallbackQuery):
+async def cb_open_pack(
+    callback: types.CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
 
     try:
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(
-                session,
-                callback.from_user.id,
-                callback.from_user.username,
-                callback.from_user.first_name,
-                callback.from_user.last_name,
-            )
-
-            if user.coins < 100:
-                await callback.answer("Недостаточно монет!", show_alert=True)
-                return
+        user = await session.get(User, db_user.id)
 
-            # Открываем пачку
-            cards, pack_open, new_card_ids = await open_pack(user.id, "common", session)
-
-            # Проверяем дубликаты
-            new_cards = []
-            duplicates = []
-            total_dust = 0
-
-            for card in cards:
-                check = await check_for_duplicate(session, user.id, card.id)
+        if user.coins < 100:
+            await callback.answer("Недостаточно монет!", show_alert=True)
+            return
 
-                if check["is_duplicate"]:
-                    await process_duplicate(
-                        session, user.id, card.id, check["dust_earned"]
-                    )
-                    duplicates.append({"card": card, "dust": check["dust_earned"]})
-                    total_dust += check["dust_earned"]
-                else:
-                    user_card = UserCard(
-                        user_id=user.id,
-                        card_id=card.id,
-                        level=1,
-                        current_power=card.base_power,
-                        current_health=card.base_health,
-                        current_attack=card.base_attack,
-                        current_defense=card.base_defense,
-                        source="pack",
-                    )
-                    session.add(user_card)
-                    new_cards.append(card)
+        # Открываем пачку
+        cards, pack_open, new_card_ids = await open_pack(user.id, "common", session)
+
+        # Проверяем дубликаты
+        new_cards = []
+        added = []
+        duplicates = []
+        total_dust = 0
+
+        for card in cards:
+            check = await check_for_duplicate(session, user.id, card.id)
+
+            if check["is_duplicate"]:
+                await process_duplicate(session, user.id, card.id, check["dust_earned"])
+                duplicates.append({"card": card, "dust": check["dust_earned"]})
+                total_dust += check["dust_earned"]
+            else:
+                user_card = UserCard(
+                    user_id=user.id,
+                    card_id=card.id,
+                    level=1,
+                    current_power=card.base_power,
+                    current_health=card.base_health,
+                    current_attack=card.base_attack,
+                    current_defense=card.base_defense,
+                    source="pack",
+                )
+                session.add(user_card)
+                new_cards.append(card)
+                added.append((user_card, card.rarity))
 
-            user.cards_opened = (user.cards_opened or 0) + len(new_cards)
+        user.cards_opened = (user.cards_opened or 0) + len(new_cards)
+        await apply_cards_added(session, user.id, added)
 
-            await session.commit()
-            await session.refresh(user)
+        await session.commit()
+        await session.refresh(user)
 
         # Формируем текст
         text = (
@@ -687,52 +743,49 @@ async def cb_open_pack(callback: types.CallbackQuery):
             else (duplicates[0]["card"] if duplicates else None)
         )
         if first_card:
-            await callback.message.answer_photo(
-                photo=first_card.original_url, caption=text
-            )
+            await answer_card_photo(callback.message, first_card, text)
 
         # Остальные карты
         all_cards = new_cards + [d["card"] for d in duplicates]
         if len(all_cards) > 1:
-            media_group = []
-            for card in all_cards[1:]:
-                is_new = card in new_cards
-                caption = f"{'✨ НОВАЯ' if is_new else '🔄 ДУБЛИКАТ'} {card.card_name} [{card.rarity}]"
-                media_group.append(
-                    types.InputMediaPhoto(media=card.original_url, caption=caption)
-                )
-
-            if media_group:
-                await callback.message.answer_media_group(media_group)
+            captions = [
+                f"{'✨ НОВАЯ' if card in new_cards else '🔄 ДУБЛИКАТ'} {card.card_name} [{card.rarity}]"
+                for card in all_cards[1:]
+            ]
+            await answer_card_album(callback.message, all_cards[1:], captions)
 
         await callback.answer()
 
     except ValueError as e:
+        await session.rollback()
         await callback.answer(str(e), show_alert=True)
     except Exception as e:
+        await session.rollback()
         logger.exception(f"Ошибка открытия пачки: {e}")
         await callback.answer("❌ Произошла ошибка. Попробуйте позже.", show_alert=True)
 
 
 @router.callback_query(F.data.startswith("col_page:"))
-async def cb_collection_page(callback: CallbackQuery):
+async def cb_collection_page(
+    callback: CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
 
     try:
+        # col_page:<курсор>:<редкость>, пустой курсор — первая карта
         data_parts = callback.data.split(":")
-        page = int(data_parts[1])
+        cursor = data_parts[1] or None
         rarity = data_parts[2] if len(data_parts) > 2 else None
 
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, callback.from_user.id)
-            cards, has_next = await get_user_cards_paginated(
-                session=session, user_id=user.id, page=page, rarity=rarity
-            )
+        user = db_user
+        cards_page = await get_user_cards_paginated(
+            session=session, user_id=user.id, cursor=cursor, page_size=1, rarity=rarity
+        )
 
-        if not cards:
+        if not cards_page.items:
             await callback.answer("Больше карт нет")
             return
 
-        card = cards[0]
+        card = cards_page.items[0]
 
         caption = (
             f"🃏 <b>{card.card.card_name}</b>\n"
@@ -740,10 +793,27 @@ async def cb_collection_page(callback: CallbackQuery):
             f"⚔️ {card.current_power}"
         )
 
-        await callback.message.edit_media(
-            media=types.InputMediaPhoto(media=card.card.original_url, caption=caption),
-            reply_markup=collection_keyboard(page, has_next, rarity),
+        keyboard = collection_keyboard(
+            cards_page.prev_cursor, cards_page.next_cursor, rarity
         )
+        photo = card_file_ids.photo_for(card.card)
+        try:
+            sent = await callback.message.edit_media(
+                media=types.InputMediaPhoto(media=photo, caption=caption),
+                reply_markup=keyboard,
+            )
+        except TelegramBadRequest as e:
+            if photo == card.card.original_url:
+                raise
+            logger.warning(f"file_id карты {card.card.id} не принят: {e}")
+            card_file_ids.forget(card.card.id)
+            sent = await callback.message.edit_media(
+                media=types.InputMediaPhoto(
+                    media=card.card.original_url, caption=caption
+                ),
+                reply_markup=keyboard,
+            )
+        card_file_ids.remember(card.card, sent)
 
         await callback.answer()
 
@@ -756,212 +826,201 @@ async def cb_collection_page(callback: CallbackQuery):
 
 
 @router.callback_query(F.data.startswith("favorite_"))
-async def toggle_favorite_handler(callback: types.CallbackQuery):
+async def toggle_favorite_handler(
+    callback: types.CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
     """Добавить/убрать из избранного (лимит 20)"""
     try:
         card_id = int(callback.data.replace("favorite_", ""))
         logger.info(f"Избранное: карта {card_id}")
 
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, callback.from_user.id)
+        user = db_user
 
-            result = await session.execute(
-                select(UserCard).where(
-                    and_(UserCard.id == card_id, UserCard.user_id == user.id)
-                )
+        result = await session.execute(
+            select(UserCard).where(
+                and_(UserCard.id == card_id, UserCard.user_id == user.id)
             )
-            user_card = result.scalar_one_or_none()
-
-            if not user_card:
-                await callback.answer("❌ Карта не найдена", show_alert=True)
-                return
-
-            # 🔥 Если добавляем в избранное — проверяем лимит
-            if not user_card.is_favorite:
-                favorite_count = (
-                    await session.scalar(
-                        select(func.count(UserCard.id)).where(
-                            and_(
-                                UserCard.user_id == user.id,
-                                UserCard.is_favorite == True,
-                            )
-                        )
-                    )
-                    or 0
-                )
-
-                if favorite_count >= 20:
-                    await callback.answer(
-                        "❌ Можно добавить не более 20 карт в избранное!",
-                        show_alert=True,
-                    )
-                    return
+        )
+        user_card = result.scalar_one_or_none()
 
-            # Переключаем состояние
-            user_card.is_favorite = not user_card.is_favorite
-            await session.commit()
+        if not user_card:
+            await callback.answer("❌ Карта не найдена", show_alert=True)
+            return
 
-            status = (
-                "⭐ добавлена в избранное"
-                if user_card.is_favorite
-                else "☆ убрана из избранного"
+        # 🔥 Если добавляем в избранное — проверяем лимит по сводке
+        summary = await get_summary(session, user.id, lock=True)
+        if not user_card.is_favorite and summary.favorite_count >= 20:
+            await callback.answer(
+                "❌ Можно добавить не более 20 карт в избранное!",
+                show_alert=True,
             )
+            return
+
+        # Переключаем состояние
+        user_card.is_favorite = not user_card.is_favorite
+        summary.favorite_count += 1 if user_card.is_favorite else -1
+        await session.commit()
 
-            await callback.answer(status, show_alert=False)
+        status = (
+            "⭐ добавлена в избранное"
+            if user_card.is_favorite
+            else "☆ убрана из избранного"
+        )
 
-            # Обновляем просмотр карты
-            await view_card_detail(callback)
+        await callback.answer(status, show_alert=False)
+
+        # Обновляем просмотр карты
+        await view_card_detail(callback, session, db_user)
 
     except Exception as e:
+        await session.rollback()
         logger.exception(f"Ошибка favorite: {e}")
         await callback.answer("❌ Ошибка", show_alert=True)
 
 
 @router.callback_query(F.data.startswith("deck_"))
-async def toggle_deck_handler(callback: types.CallbackQuery):
+async def toggle_deck_handler(
+    callback: types.CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
     """Добавить/убрать из колоды"""
     try:
         card_id = int(callback.data.replace("deck_", ""))
         logger.info(f"Колода: карта {card_id}")
 
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, callback.from_user.id)
+        user = db_user
 
-            # Проверяем количество карт в колоде
-            deck_count = await session.execute(
-                select(func.count())
-                .select_from(UserCard)
-                .where(and_(UserCard.user_id == user.id, UserCard.is_in_deck == True))
+        result = await session.execute(
+            select(UserCard).where(
+                and_(UserCard.id == card_id, UserCard.user_id == user.id)
             )
-            deck_count = deck_count.scalar()
-
-            result = await session.execute(
-                select(UserCard).where(
-                    and_(UserCard.id == card_id, UserCard.user_id == user.id)
-                )
-            )
-            user_card = result.scalar_one_or_none()
+        )
+        user_card = result.scalar_one_or_none()
 
-            if not user_card:
-                await callback.answer("❌ Карта не найдена", show_alert=True)
-                return
+        if not user_card:
+            await callback.answer("❌ Карта не найдена", show_alert=True)
+            return
 
-            # Если добавляем в колоду, проверяем лимит
-            if not user_card.is_in_deck and deck_count >= 5:
-                await callback.answer(
-                    "❌ В колоде может быть только 5 карт!", show_alert=True
-                )
-                return
+        # Если добавляем в колоду, проверяем лимит по сводке
+        summary = await get_summary(session, user.id, lock=True)
+        if not user_card.is_in_deck and summary.deck_count >= 5:
+            await callback.answer(
+                "❌ В колоде может быть только 5 карт!", show_alert=True
+            )
+            return
 
-            user_card.is_in_deck = not user_card.is_in_deck
+        user_card.is_in_deck = not user_card.is_in_deck
+        summary.deck_count += 1 if user_card.is_in_deck else -1
 
-            # 🔥 Синхронизируем JSON
-            from database.crud import sync_user_deck
+        # 🔥 Синхронизируем JSON
+        from database.crud import sync_user_deck
 
-            await sync_user_deck(session, user.id)
+        await sync_user_deck(session, user.id)
 
-            await session.commit()
+        await session.commit()
 
-            status = (
-                "⚔️ карта добавлена в колоду"
-                if user_card.is_in_deck
-                else "📦 карта убрана из колоды"
-            )
-            await callback.answer(status, show_alert=False)
+        status = (
+            "⚔️ карта добавлена в колоду"
+            if user_card.is_in_deck
+            else "📦 карта убрана из колоды"
+        )
+        await callback.answer(status, show_alert=False)
 
-            # Обновляем просмотр карты
-            await view_card_detail(callback)
+        # Обновляем просмотр карты
+        await view_card_detail(callback, session, db_user)
 
     except Exception as e:
+        await session.rollback()
         logger.exception(f"Ошибка deck: {e}")
         await callback.answer("❌ Ошибка", show_alert=True)
 
 
 @router.callback_query(F.data.startswith("upgrade_"))
-async def upgrade_card(callback: types.CallbackQuery):
+async def upgrade_card(
+    callback: types.CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
     """Улучшить карту"""
     try:
         card_id = int(callback.data.replace("upgrade_", ""))
         logger.info(f"Улучшение карты ID: {card_id}")
 
-        async with AsyncSessionLocal() as session:
-            # Получаем пользователя
-            user = await get_user_or_create(session, callback.from_user.id)
-            if not user:
-                await callback.answer("❌ Пользователь не найден", show_alert=True)
-                return
-
-            # Получаем карту
-            result = await session.execute(
-                select(UserCard, Card)
-                .join(Card, UserCard.card_id == Card.id)
-                .where(UserCard.id == card_id)
-            )
-            data = result.first()
-            if not data:
-                await callback.answer("Карта не найдена", show_alert=True)
-                return
-
-            user_card, card = data
-            if user_card.user_id != user.id:
-                await callback.answer("❌ Карта не принадлежит вам", show_alert=True)
-                return
-
-            if user_card.level >= 100:
-                await callback.answer(
-                    "Карта уже максимального уровня!", show_alert=True
-                )
-                return
-
-            # Сохраняем старые статы
-            old_stats = {
-                "power": user_card.current_power,
-                "health": user_card.current_health,
-                "attack": user_card.current_attack,
-                "defense": user_card.current_defense,
-                "level": user_card.level,
-            }
-
-            # Стоимость
-            from game.upgrade_calculator import (
-                get_upgrade_cost,
-                calculate_stats_for_level,
+        # Получаем пользователя
+        user = await session.get(User, db_user.id)
+        if not user:
+            await callback.answer("❌ Пользователь не найден", show_alert=True)
+            return
+
+        # Получаем карту
+        result = await session.execute(
+            select(UserCard, Card)
+            .join(Card, UserCard.card_id == Card.id)
+            .where(UserCard.id == card_id)
+        )
+        data = result.first()
+        if not data:
+            await callback.answer("Карта не найдена", show_alert=True)
+            return
+
+        user_card, card = data
+        if user_card.user_id != user.id:
+            await callback.answer("❌ Карта не принадлежит вам", show_alert=True)
+            return
+
+        if user_card.level >= 100:
+            await callback.answer("Карта уже максимального уровня!", show_alert=True)
+            return
+
+        # Сохраняем старые статы
+        old_stats = {
+            "power": user_card.current_power,
+            "health": user_card.current_health,
+            "attack": user_card.current_attack,
+            "defense": user_card.current_defense,
+            "level": user_card.level,
+        }
+
+        # Стоимость
+        from game.upgrade_calculator import (
+            get_upgrade_cost,
+            calculate_stats_for_level,
+        )
+
+        upgrade_cost = get_upgrade_cost(card, user_card.level)
+        if user.dust < upgrade_cost:
+            await callback.answer(
+                f"❌ Не хватает пыли ✨! Нужно: {upgrade_cost} ✨", show_alert=True
             )
+            return
 
-            upgrade_cost = get_upgrade_cost(card, user_card.level)
-            if user.dust < upgrade_cost:
-                await callback.answer(
-                    f"❌ Не хватает пыли ✨! Нужно: {upgrade_cost} ✨", show_alert=True
-                )
-                return
-
-            # Улучшаем
-            user.dust -= upgrade_cost
-            user_card.level += 1
-            user_card.times_upgraded += 1
-            user.total_cards_upgraded += 1
-
-            new_stats = calculate_stats_for_level(card, user_card.level)
-            user_card.current_power = new_stats["power"]
-            user_card.current_health = new_stats["health"]
-            user_card.current_attack = new_stats["attack"]
-            user_card.current_defense = new_stats["defense"]
-
-            await session.commit()
-
-            # Разница
-            diff_power = user_card.current_power - old_stats["power"]
-            diff_health = user_card.current_health - old_stats["health"]
-            diff_attack = user_card.current_attack - old_stats["attack"]
-            diff_defense = user_card.current_defense - old_stats["defense"]
-
-            # Прогресс до бонуса
-            next_ten_bonus = ((user_card.level // 10) + 1) * 10
-            levels_to_bonus = next_ten_bonus - user_card.level
-            ten_level_progress = user_card.level % 10 or 10
-            progress_bar = "█" * ten_level_progress + "░" * (10 - ten_level_progress)
-
-            text = f"""
+        # Улучшаем
+        user.dust -= upgrade_cost
+        user_card.level += 1
+        user_card.times_upgraded += 1
+        user.total_cards_upgraded += 1
+
+        new_stats = calculate_stats_for_level(card, user_card.level)
+        user_card.current_power = new_stats["power"]
+        user_card.current_health = new_stats["health"]
+        user_card.current_attack = new_stats["attack"]
+        user_card.current_defense = new_stats["defense"]
+        await apply_card_upgraded(
+            session, user.id, user_card, old_stats["power"], old_stats["level"]
+        )
+
+        await session.commit()
+
+        # Разница
+        diff_power = user_card.current_power - old_stats["power"]
+        diff_health = user_card.current_health - old_stats["health"]
+        diff_attack = user_card.current_attack - old_stats["attack"]
+        diff_defense = user_card.current_defense - old_stats["defense"]
+
+        # Прогресс до бонуса
+        # Бонус действует с 11, 21, 31... уровня — как у кнопки "До бонуса"
+        levels_to_bonus = next_bonus_level(user_card.level) - user_card.level
+        ten_level_progress = (user_card.level - 1) % 10
+        progress_bar = "█" * ten_level_progress + "░" * (10 - ten_level_progress)
+
+        text = f"""
 <b>✨ УЛУЧШЕНИЕ КАРТЫ</b>
 
 <b>{card.card_name}</b> [{card.rarity}]
@@ -982,27 +1041,29 @@ async def upgrade_card(callback: types.CallbackQuery):
 📦 Осталось пыли: {user.dust}✨
 """
 
-            # Кнопки вынесены в keyboards.py
-            from bot.keyboards import upgrade_card_keyboard
+        # Кнопки вынесены в keyboards.py
+        from bot.keyboards import upgrade_card_keyboard
 
-            keyboard = upgrade_card_keyboard(card_id)
+        keyboard = upgrade_card_keyboard(card_id)
 
-            await callback.message.edit_caption(caption=text, reply_markup=keyboard)
-            await callback.answer(
-                f"✨ Уровень повышен! (+{diff_power} силы)", show_alert=False
-            )
+        await callback.message.edit_caption(caption=text, reply_markup=keyboard)
+        await callback.answer(
+            f"✨ Уровень повышен! (+{diff_power} силы)", show_alert=False
+        )
 
     except Exception as e:
+        await session.rollback()
         logger.exception(f"Ошибка upgrade_card: {e}")
         await callback.answer("❌ Произошла ошибка", show_alert=True)
 
 
 @router.callback_query(F.data == "profile")
-async def callback_profile(callback: types.CallbackQuery):
+async def callback_profile(
+    callback: types.CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
 
     try:
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, callback.from_user.id)
+        user = await session.get(User, db_user.id)
 
         total_battles = user.arena_wins + user.arena_losses
         win_rate = (user.arena_wins / total_battles * 100) if total_battles > 0 else 0
@@ -1010,7 +1071,7 @@ async def callback_profile(callback: types.CallbackQuery):
         days = time_in_game.days
         hours = time_in_game.seconds // 3600
 
-        stats = await get_collection_stats(user.id)
+        stats = await get_collection_stats(user.id, session)
 
         profile_text = f"""
 <b>📊 ПРОФИЛЬ ИГРОКА</b>
@@ -1050,90 +1111,72 @@ ID: <code>{user.id}</code>
 
 
 @router.callback_query(F.data.startswith("5x_upgrade_"))
-async def upgrade_card_5x(callback: types.CallbackQuery):
+async def upgrade_card_5x(
+    callback: types.CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
     """Улучшить карту 5 раз"""
+    card_id = int(callback.data.replace("5x_upgrade_", ""))
+    await _bulk_upgrade(callback, session, db_user, card_id, UPGRADE_EXACT, 5)
+
+
+@router.callback_query(F.data.startswith("upg_"))
+async def upgrade_card_bulk(
+    callback: types.CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
+    """Массовое улучшение: upg_max_{id}, upg_bonus_{id}, upg_n{N}_{id}"""
     try:
-        card_id = int(callback.data.replace("5x_upgrade_", ""))
+        _, mode, card_id = callback.data.split("_")
+        card_id = int(card_id)
+        count = 1
+        if mode.startswith("n"):
+            mode, count = UPGRADE_EXACT, int(mode[1:])
+    except ValueError:
+        await callback.answer("❌ Ошибка", show_alert=True)
+        return
 
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, callback.from_user.id)
+    await _bulk_upgrade(callback, session, db_user, card_id, mode, count)
 
-            result = await session.execute(
-                select(UserCard, Card)
-                .join(Card, UserCard.card_id == Card.id)
-                .where(UserCard.id == card_id)
-            )
-            data = result.first()
-            if not data:
-                await callback.answer("❌ Карта не найдена", show_alert=True)
-                return
-
-            user_card, card = data
-
-            # Сохраняем старые статы
-            old_stats = {
-                "power": user_card.current_power,
-                "health": user_card.current_health,
-                "attack": user_card.current_attack,
-                "defense": user_card.current_defense,
-                "level": user_card.level,
-            }
-
-            # Рассчитываем стоимость 5 улучшений
-            total_cost = 0
-            from game.upgrade_calculator import (
-                get_upgrade_cost,
-                calculate_stats_for_level,
+
+async def _bulk_upgrade(
+    callback: types.CallbackQuery,
+    session: AsyncSession,
+    db_user: ResolvedUser,
+    card_id: int,
+    mode: str,
+    count: int = 1,
+):
+    try:
+        try:
+            upgrade = await bulk_upgrade_user_card(
+                card_id, db_user.id, mode, count, session=session
             )
+        except ValueError as e:
+            await callback.answer(f"❌ {e}", show_alert=True)
+            return
 
-            for i in range(5):
-                if user_card.level + i >= 100:
-                    break
-                total_cost += get_upgrade_cost(card, user_card.level + i)
+        await session.commit()
 
-            if user.dust < total_cost:
-                await callback.answer(
-                    f"❌ Не хватает пыли ✨! Нужно: {total_cost} ✨", show_alert=True
-                )
-                return
-
-            # Применяем улучшения
-            upgrades_done = 0
-            for _ in range(5):
-                if user_card.level >= 100:
-                    break
-                user.dust -= get_upgrade_cost(card, user_card.level)
-                user_card.level += 1
-                upgrades_done += 1
-                user.total_cards_upgraded += 1
-
-            # Пересчитываем финальные статы
-            new_stats = calculate_stats_for_level(card, user_card.level)
-            user_card.current_power = new_stats["power"]
-            user_card.current_health = new_stats["health"]
-            user_card.current_attack = new_stats["attack"]
-            user_card.current_defense = new_stats["defense"]
-            user_card.times_upgraded += upgrades_done
-
-            await session.commit()
-
-            # Разница
-            diff_power = user_card.current_power - old_stats["power"]
-            diff_health = user_card.current_health - old_stats["health"]
-            diff_attack = user_card.current_attack - old_stats["attack"]
-            diff_defense = user_card.current_defense - old_stats["defense"]
-
-            # Прогресс до бонуса
-            next_ten_bonus = ((user_card.level // 10) + 1) * 10
-            levels_to_bonus = next_ten_bonus - user_card.level
-            ten_level_progress = user_card.level % 10 or 10
-            progress_bar = "█" * ten_level_progress + "░" * (10 - ten_level_progress)
-
-            text = f"""
+        user_card, card = upgrade["user_card"], upgrade["card"]
+        old_stats = upgrade["old_stats"]
+        upgrades_done = upgrade["levels"]
+
+        # Разница
+        diff_power = user_card.current_power - old_stats["power"]
+        diff_health = user_card.current_health - old_stats["health"]
+        diff_attack = user_card.current_attack - old_stats["attack"]
+        diff_defense = user_card.current_defense - old_stats["defense"]
+
+        # Прогресс до бонуса
+        # Бонус действует с 11, 21, 31... уровня — как у кнопки "До бонуса"
+        levels_to_bonus = next_bonus_level(user_card.level) - user_card.level
+        ten_level_progress = (user_card.level - 1) % 10
+        progress_bar = "█" * ten_level_progress + "░" * (10 - ten_level_progress)
+
+        text = f"""
 <b>✨ УЛУЧШЕНИЕ КАРТЫ ×{upgrades_done}</b>
 
 <b>{card.card_name}</b> [{card.rarity}]
-📈 <b>Уровень:</b> {old_stats['level']} → {user_card.level} (+{upgrades_done})
+📈 <b>Уровень:</b> {upgrade['from_level']} → {user_card.level} (+{upgrades_done})
 
 <b>⚔️ ИЗМЕНЕНИЕ ХАРАКТЕРИСТИК:</b>
 💪 Сила:     {old_stats['power']} → {user_card.current_power} (+{diff_power})
@@ -1146,80 +1189,85 @@ async def upgrade_card_5x(callback: types.CallbackQuery):
 [{progress_bar}] {ten_level_progress}/10
 {levels_to_bonus} ур. до следующего бонуса
 
-💰 Потрачено пыли: {total_cost}✨
-📦 Осталось пыли: {user.dust}✨
+💰 Потрачено пыли: {upgrade['cost']}✨
+📦 Осталось пыли: {upgrade['dust_left']}✨
 """
 
-            from bot.keyboards import upgrade_card_keyboard
+        from bot.keyboards import upgrade_card_keyboard
 
-            keyboard = upgrade_card_keyboard(card_id)
+        keyboard = upgrade_card_keyboard(card_id)
 
-            await callback.message.edit_caption(caption=text, reply_markup=keyboard)
-            await callback.answer(
-                f"✨ Карта улучшена {upgrades_done} раз!", show_alert=False
-            )
+        await callback.message.edit_caption(caption=text, reply_markup=keyboard)
+        await callback.answer(
+            f"✨ Карта улучшена {upgrades_done} раз!", show_alert=False
+        )
 
     except Exception as e:
-        logger.exception(f"Ошибка upgrade_5x: {e}")
+        await session.rollback()
+        logger.exception(f"Ошибка массового улучшения: {e}")
         await callback.answer("❌ Ошибка", show_alert=True)
 
 
 @router.callback_query(F.data == "collection_by_anime")
-async def collection_by_anime(callback: types.CallbackQuery):
+async def collection_by_anime(
+    callback: types.CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
     """Показать коллекцию, сгруппированную по аниме"""
     try:
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, callback.from_user.id)
-
-            # Получаем все карты пользователя с группировкой по аниме
-            result = await session.execute(
-                select(Card.anime_name, func.count(UserCard.id))
-                .join(UserCard, Card.id == UserCard.card_id)
-                .where(UserCard.user_id == user.id)
-                .group_by(Card.anime_name)
-                .order_by(func.count(UserCard.id).desc())
-                .limit(20)
-            )
-            anime_stats = result.all()
-
-            if not anime_stats:
-                await callback.message.edit_text(
-                    "📭 <b>У вас пока нет карт</b>\n\nОткройте пачку: /open_pack",
-                    reply_markup=InlineKeyboardMarkup(
-                        inline_keyboard=[
-                            [
-                                InlineKeyboardButton(
-                                    text="« Назад",
-                                    callback_data="back_to_collection_menu",
-                                )
-                            ]
-                        ]
-                    ),
-                )
-                await callback.answer()
-                return
-
-            text = "<b>🎌 КОЛЛЕКЦИЯ ПО АНИМЕ</b>\n\n"
-            for anime, count in anime_stats:
-                anime_name = (
-                    anime[:30] + "..."
-                    if anime and len(anime) > 30
-                    else (anime or "Без аниме")
-                )
-                text += f"📺 <b>{anime_name}</b> — {count} карт\n"
+        user = db_user
 
-            keyboard = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [
-                        InlineKeyboardButton(
-                            text="« Назад", callback_data="back_to_collection_menu"
-                        )
+        # Только card_id карт пользователя, группировка — по индексу аниме
+        result = await session.execute(
+            select(UserCard.card_id).where(UserCard.user_id == user.id)
+        )
+        await anime_index.ensure_loaded(session)
+        # Карта не в индексе — тоже «Без аниме», считаем вместе с NO_ANIME
+        anime_counts = Counter(
+            anime_index.anime_of(card_id) or NO_ANIME for card_id in result.scalars()
+        )
+        anime_stats = [
+            (anime_index.name(anime_id), count)
+            for anime_id, count in anime_counts.most_common(20)
+        ]
+
+        if not anime_stats:
+            await callback.message.edit_text(
+                "📭 <b>У вас пока нет карт</b>\n\nОткройте пачку: /open_pack",
+                reply_markup=InlineKeyboardMarkup(
+                    inline_keyboard=[
+                        [
+                            InlineKeyboardButton(
+                                text="« Назад",
+                                callback_data="back_to_collection_menu",
+                            )
+                        ]
                     ]
-                ]
+                ),
             )
-
-            await callback.message.edit_text(text, reply_markup=keyboard)
             await callback.answer()
+            return
+
+        text = "<b>🎌 КОЛЛЕКЦИЯ ПО АНИМЕ</b>\n\n"
+        for anime, count in anime_stats:
+            anime_name = (
+                anime[:30] + "..."
+                if anime and len(anime) > 30
+                else (anime or "Без аниме")
+            )
+            text += f"📺 <b>{anime_name}</b> — {count} карт\n"
+
+        keyboard = InlineKeyboardMarkup(
+            inline_keyboard=[
+                [
+                    InlineKeyboardButton(
+                        text="« Назад", callback_data="back_to_collection_menu"
+                    )
+                ]
+            ]
+        )
+
+        await callback.message.edit_text(text, reply_markup=keyboard)
+        await callback.answer()
 
     except Exception as e:
         logger.exception(f"Ошибка collection_by_anime: {e}")
@@ -1227,70 +1275,71 @@ async def collection_by_anime(callback: types.CallbackQuery):
 
 
 @router.callback_query(F.data == "collection_favorites")
-async def collection_favorites(callback: types.CallbackQuery):
+async def collection_favorites(
+    callback: types.CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
     """Показать избранные карты"""
     try:
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, callback.from_user.id)
-
-            result = await session.execute(
-                select(UserCard, Card)
-                .join(Card, UserCard.card_id == Card.id)
-                .where(and_(UserCard.user_id == user.id, UserCard.is_favorite == True))
-                .order_by(Card.rarity.desc())
-                .limit(20)
-            )
-            cards = result.all()
-
-            if not cards:
-                await callback.message.edit_text(
-                    "⭐ <b>У вас нет избранных карт</b>\n\n"
-                    "Добавьте карты в избранное при просмотре",
-                    reply_markup=InlineKeyboardMarkup(
-                        inline_keyboard=[
-                            [
-                                InlineKeyboardButton(
-                                    text="« Назад", callback_data="back_to_collection"
-                                )
-                            ]
+        user = db_user
+
+        result = await session.execute(
+            select(UserCard, Card)
+            .join(Card, UserCard.card_id == Card.id)
+            .where(and_(UserCard.user_id == user.id, UserCard.is_favorite == True))
+            .order_by(Card.rarity.desc())
+            .limit(20)
+        )
+        cards = result.all()
+
+        if not cards:
+            await callback.message.edit_text(
+                "⭐ <b>У вас нет избранных карт</b>\n\n"
+                "Добавьте карты в избранное при просмотре",
+                reply_markup=InlineKeyboardMarkup(
+                    inline_keyboard=[
+                        [
+                            InlineKeyboardButton(
+                                text="« Назад", callback_data="back_to_collection"
+                            )
                         ]
-                    ),
-                )
-                await callback.answer()
-                return
-
-            text = "<b>⭐ ИЗБРАННЫЕ КАРТЫ</b>\n\n"
-            card_ids = []
-
-            for i, (user_card, card) in enumerate(cards[:10], 1):
-                text += f"{i}. <b>{card.card_name}</b> [{card.rarity}] Ур.{user_card.level}\n"
-                text += f"   💪 {user_card.current_power}\n"
-                card_ids.append(user_card.id)
-
-            # Кнопки просмотра
-            keyboard = []
-            view_row = []
-            for idx, cid in enumerate(card_ids, 1):
-                view_row.append(
-                    InlineKeyboardButton(
-                        text=f"🔍 {idx}", callback_data=f"view_card_{cid}"
-                    )
-                )
-            if view_row:
-                keyboard.append(view_row)
+                    ]
+                ),
+            )
+            await callback.answer()
+            return
 
-            keyboard.append(
-                [
-                    InlineKeyboardButton(
-                        text="« Назад", callback_data="back_to_collection_menu"
-                    )
-                ]
+        text = "<b>⭐ ИЗБРАННЫЕ КАРТЫ</b>\n\n"
+        card_ids = []
+
+        for i, (user_card, card) in enumerate(cards[:10], 1):
+            text += (
+                f"{i}. <b>{card.card_name}</b> [{card.rarity}] Ур.{user_card.level}\n"
             )
+            text += f"   💪 {user_card.current_power}\n"
+            card_ids.append(user_card.id)
 
-            await callback.message.edit_text(
-                text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+        # Кнопки просмотра
+        keyboard = []
+        view_row = []
+        for idx, cid in enumerate(card_ids, 1):
+            view_row.append(
+                InlineKeyboardButton(text=f"🔍 {idx}", callback_data=f"view_card_{cid}")
             )
-            await callback.answer()
+        if view_row:
+            keyboard.append(view_row)
+
+        keyboard.append(
+            [
+                InlineKeyboardButton(
+                    text="« Назад", callback_data="back_to_collection_menu"
+                )
+            ]
+        )
+
+        await callback.message.edit_text(
+            text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+        )
+        await callback.answer()
 
     except Exception as e:
         logger.exception(f"Ошибка collection_favorites: {e}")
@@ -1298,70 +1347,71 @@ async def collection_favorites(callback: types.CallbackQuery):
 
 
 @router.callback_query(F.data == "collection_in_deck")
-async def collection_in_deck(callback: types.CallbackQuery):
+async def collection_in_deck(
+    callback: types.CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
     """Показать карты в колоде"""
     try:
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, callback.from_user.id)
-
-            result = await session.execute(
-                select(UserCard, Card)
-                .join(Card, UserCard.card_id == Card.id)
-                .where(and_(UserCard.user_id == user.id, UserCard.is_in_deck == True))
-                .order_by(Card.rarity.desc())
-            )
-            cards = result.all()
-
-            if not cards:
-                await callback.message.edit_text(
-                    "⚔️ <b>В вашей колоде нет карт</b>\n\n"
-                    "Добавьте карты в колоду при просмотре",
-                    reply_markup=InlineKeyboardMarkup(
-                        inline_keyboard=[
-                            [
-                                InlineKeyboardButton(
-                                    text="« Назад",
-                                    callback_data="back_to_collection_menu",
-                                )
-                            ]
-                        ]
-                    ),
-                )
-                await callback.answer()
-                return
-
-            text = "<b>⚔️ КАРТЫ В КОЛОДЕ</b>\n\n"
-            card_ids = []
-
-            for i, (user_card, card) in enumerate(cards[:5], 1):
-                text += f"{i}. <b>{card.card_name}</b> [{card.rarity}] Ур.{user_card.level}\n"
-                text += f"   💪 {user_card.current_power} | ⚔️ {user_card.current_attack} | 🛡️ {user_card.current_defense}\n\n"
-                card_ids.append(user_card.id)
-
-            # Кнопки просмотра
-            keyboard = []
-            view_row = []
-            for idx, cid in enumerate(card_ids, 1):
-                view_row.append(
-                    InlineKeyboardButton(
-                        text=f"🔍 {idx}", callback_data=f"view_card_{cid}"
-                    )
-                )
-            if view_row:
-                keyboard.append(view_row)
+        user = db_user
 
-            keyboard.append(
-                [
-                    InlineKeyboardButton(
-                        text="« Назад", callback_data="back_to_collection_menu"
-                    )
-                ]
-            )
+        result = await session.execute(
+            select(UserCard, Card)
+            .join(Card, UserCard.card_id == Card.id)
+            .where(and_(UserCard.user_id == user.id, UserCard.is_in_deck == True))
+            .order_by(Card.rarity.desc())
+        )
+        cards = result.all()
 
+        if not cards:
             await callback.message.edit_text(
-                text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+                "⚔️ <b>В вашей колоде нет карт</b>\n\n"
+                "Добавьте карты в колоду при просмотре",
+                reply_markup=InlineKeyboardMarkup(
+                    inline_keyboard=[
+                        [
+                            InlineKeyboardButton(
+                                text="« Назад",
+                                callback_data="back_to_collection_menu",
+                            )
+                        ]
+                    ]
+                ),
             )
             await callback.answer()
+            return
+
+        text = "<b>⚔️ КАРТЫ В КОЛОДЕ</b>\n\n"
+        card_ids = []
+
+        for i, (user_card, card) in enumerate(cards[:5], 1):
+            text += (
+                f"{i}. <b>{card.card_name}</b> [{card.rarity}] Ур.{user_card.level}\n"
+            )
+            text += f"   💪 {user_card.current_power} | ⚔️ {user_card.current_attack} | 🛡️ {user_card.current_defense}\n\n"
+            card_ids.append(user_card.id)
+
+        # Кнопки просмотра
+        keyboard = []
+        view_row = []
+        for idx, cid in enumerate(card_ids, 1):
+            view_row.append(
+                InlineKeyboardButton(text=f"🔍 {idx}", callback_data=f"view_card_{cid}")
+            )
+        if view_row:
+            keyboard.append(view_row)
+
+        keyboard.append(
+            [
+                InlineKeyboardButton(
+                    text="« Назад", callback_data="back_to_collection_menu"
+                )
+            ]
+        )
+
+        await callback.message.edit_text(
+            text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+        )
+        await callback.answer()
 
     except Exception as e:
         logger.exception(f"Ошибка collection_in_deck: {e}")
@@ -1369,56 +1419,27 @@ async def collection_in_deck(callback: types.CallbackQuery):
 
 
 @router.callback_query(F.data == "collection_stats")
-async def collection_stats(callback: types.CallbackQuery):
+async def collection_stats(
+    callback: types.CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
     """Показать расширенную статистику коллекции"""
     try:
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, callback.from_user.id)
-
-            # Общая статистика
-            total_cards = user.cards_opened or 0
-
-            # Статистика по редкостям
-            rarity_stats = await get_collection_stats(user.id)
+        user = await session.get(User, db_user.id)
 
-            # Подсчет общей силы
-            result = await session.execute(
-                select(func.sum(UserCard.current_power)).where(
-                    UserCard.user_id == user.id
-                )
-            )
-            total_power = result.scalar() or 0
+        # Общая статистика
+        total_cards = user.cards_opened or 0
 
-            # Средний уровень
-            result = await session.execute(
-                select(func.avg(UserCard.level)).where(UserCard.user_id == user.id)
-            )
-            avg_level = result.scalar() or 0
+        # Сводка коллекции: одно чтение по первичному ключу
+        summary = await get_summary(session, user.id)
+        rarity_stats = summary.rarity_counts()
+        total_power = summary.total_power
+        avg_level = summary.avg_level
+        favorite_count = summary.favorite_count
+        deck_count = summary.deck_count
 
-            # ⭐ Избранные
-            favorite_count = (
-                await session.scalar(
-                    select(func.count(UserCard.id)).where(
-                        UserCard.user_id == user.id, UserCard.is_favorite == True
-                    )
-                )
-                or 0
-            )
-
-            # ⚔️ В колоде
-            deck_count = len(user.selected_deck or [])
-            # deck_count = await session.scalar(
-            #     select(func.count(UserCard.id))
-            #     .where(
-            #         UserCard.user_id == user.id,
-            #         UserCard.is_in_deck == True
-            #     )
-            # ) or 0
-            logger.info(
-                f"Collection user: tg_id={callback.from_user.id}, db_id={user.id}"
-            )
+        logger.info(f"Collection user: tg_id={callback.from_user.id}, db_id={user.id}")
 
-            text = f"""
+        text = f"""
 <b>📊 СТАТИСТИКА КОЛЛЕКЦИИ</b>
 
 <b>📈 Общая информация:</b>
@@ -1441,95 +1462,93 @@ async def collection_stats(callback: types.CallbackQuery):
 ⭐ В избранном: {favorite_count}
 ⚔️ В колоде: {deck_count}
 """
+        await callback.message.edit_text(
+            text,
+            reply_markup=InlineKeyboardMarkup(
+                inline_keyboard=[
+                    [
+                        InlineKeyboardButton(
+                            text="« Назад", callback_data="back_to_collection_menu"
+                        )
+                    ]
+                ]
+            ),
+        )
+        await callback.answer()
+
+    except Exception as e:
+        logger.exception(f"Ошибка collection_stats: {e}")
+        await callback.answer("❌ Ошибка", show_alert=True)
+
+
+@router.callback_query(F.data == "collection_strongest")
+async def collection_strongest(
+    callback: types.CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
+    """Показать самые сильные карты"""
+    try:
+        user = db_user
+
+        # Топ по силе хранится в сводке — читаем только эти карты
+        summary = await get_summary(session, user.id)
+        top_ids = [card_id for card_id, _ in summary.top_cards or []]
+
+        result = await session.execute(
+            select(UserCard, Card)
+            .join(Card, UserCard.card_id == Card.id)
+            .where(UserCard.user_id == user.id, UserCard.id.in_(top_ids))
+            .order_by(UserCard.current_power.desc(), UserCard.id)
+        )
+        cards = result.all()
+
+        if not cards:
             await callback.message.edit_text(
-                text,
+                "📭 <b>У вас пока нет карт</b>",
                 reply_markup=InlineKeyboardMarkup(
                     inline_keyboard=[
                         [
                             InlineKeyboardButton(
-                                text="« Назад", callback_data="back_to_collection_menu"
+                                text="« Назад",
+                                callback_data="back_to_collection_menu",
                             )
                         ]
                     ]
                 ),
             )
             await callback.answer()
+            return
 
-    except Exception as e:
-        logger.exception(f"Ошибка collection_stats: {e}")
-        await callback.answer("❌ Ошибка", show_alert=True)
+        text = "<b>🔝 САМЫЕ СИЛЬНЫЕ КАРТЫ</b>\n\n"
+        card_ids = []
 
+        for i, (user_card, card) in enumerate(cards[:5], 1):
+            medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"{i}."
+            text += f"{medal} <b>{card.card_name}</b> [{card.rarity}]\n"
+            text += f"   💪 Сила: {user_card.current_power} | Ур.{user_card.level}\n"
+            card_ids.append(user_card.id)
 
-@router.callback_query(F.data == "collection_strongest")
-async def collection_strongest(callback: types.CallbackQuery):
-    """Показать самые сильные карты"""
-    try:
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, callback.from_user.id)
-
-            result = await session.execute(
-                select(UserCard, Card)
-                .join(Card, UserCard.card_id == Card.id)
-                .where(UserCard.user_id == user.id)
-                .order_by(UserCard.current_power.desc())
-                .limit(10)
+        # Кнопки просмотра
+        keyboard = []
+        view_row = []
+        for idx, cid in enumerate(card_ids, 1):
+            view_row.append(
+                InlineKeyboardButton(text=f"🔍 {idx}", callback_data=f"view_card_{cid}")
             )
-            cards = result.all()
-
-            if not cards:
-                await callback.message.edit_text(
-                    "📭 <b>У вас пока нет карт</b>",
-                    reply_markup=InlineKeyboardMarkup(
-                        inline_keyboard=[
-                            [
-                                InlineKeyboardButton(
-                                    text="« Назад",
-                                    callback_data="back_to_collection_menu",
-                                )
-                            ]
-                        ]
-                    ),
-                )
-                await callback.answer()
-                return
-
-            text = "<b>🔝 САМЫЕ СИЛЬНЫЕ КАРТЫ</b>\n\n"
-            card_ids = []
-
-            for i, (user_card, card) in enumerate(cards[:5], 1):
-                medal = (
-                    "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"{i}."
-                )
-                text += f"{medal} <b>{card.card_name}</b> [{card.rarity}]\n"
-                text += (
-                    f"   💪 Сила: {user_card.current_power} | Ур.{user_card.level}\n"
-                )
-                card_ids.append(user_card.id)
+        if view_row:
+            keyboard.append(view_row)
 
-            # Кнопки просмотра
-            keyboard = []
-            view_row = []
-            for idx, cid in enumerate(card_ids, 1):
-                view_row.append(
-                    InlineKeyboardButton(
-                        text=f"🔍 {idx}", callback_data=f"view_card_{cid}"
-                    )
+        keyboard.append(
+            [
+                InlineKeyboardButton(
+                    text="« Назад", callback_data="back_to_collection_menu"
                 )
-            if view_row:
-                keyboard.append(view_row)
-
-            keyboard.append(
-                [
-                    InlineKeyboardButton(
-                        text="« Назад", callback_data="back_to_collection_menu"
-                    )
-                ]
-            )
+            ]
+        )
 
-            await callback.message.edit_text(
-                text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
-            )
-            await callback.answer()
+        await callback.message.edit_text(
+            text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+        )
+        await callback.answer()
 
     except Exception as e:
         logger.exception(f"Ошибка collection_strongest: {e}")
@@ -1544,7 +1563,9 @@ async def collection_strongest(callback: types.CallbackQuery):
 
 
 @router.callback_query(F.data.startswith("view_card_"))
-async def view_card_detail(callback: types.CallbackQuery):
+async def view_card_detail(
+    callback: types.CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
     """Просмотр детальной информации о карте с изображением"""
     try:
         # Проверяем что это точно view_card_, а не что-то другое
@@ -1554,34 +1575,33 @@ async def view_card_detail(callback: types.CallbackQuery):
         card_id = int(callback.data.replace("view_card_", ""))
         logger.info(f"Просмотр карты ID: {card_id}")
 
-        async with AsyncSessionLocal() as session:
-            user = await get_user_or_create(session, callback.from_user.id)
+        user = await session.get(User, db_user.id)
 
-            result = await session.execute(
-                select(UserCard, Card)
-                .join(Card, UserCard.card_id == Card.id)
-                .where(UserCard.id == card_id)
-            )
-            data = result.first()
+        result = await session.execute(
+            select(UserCard, Card)
+            .join(Card, UserCard.card_id == Card.id)
+            .where(UserCard.id == card_id)
+        )
+        data = result.first()
 
-            if not data:
-                await callback.answer("Карта не найдена", show_alert=True)
-                return
+        if not data:
+            await callback.answer("Карта не найдена", show_alert=True)
+            return
 
-            user_card, card = data
+        user_card, card = data
 
-            if user_card.user_id != user.id:
-                await callback.answer("Эта карта вам не принадлежит", show_alert=True)
-                return
+        if user_card.user_id != user.id:
+            await callback.answer("Эта карта вам не принадлежит", show_alert=True)
+            return
 
-            # Рассчитываем стоимость улучшения с вашими формулами
-            from game.upgrade_calculator import get_upgrade_cost
+        # Рассчитываем стоимость улучшения с вашими формулами
+        from game.upgrade_calculator import get_upgrade_cost
 
-            upgrade_cost = get_upgrade_cost(card, user_card.level)
-            can_upgrade = user_card.level < 100 and user.dust >= upgrade_cost
+        upgrade_cost = get_upgrade_cost(card, user_card.level)
+        can_upgrade = user_card.level < 100 and user.dust >= upgrade_cost
 
-            # Статистика карты
-            text = f"""
+        # Статистика карты
+        text = f"""
 <b>✨ {card.card_name}</b>
 
 <b>📋 Информация:</b>
@@ -1622,16 +1642,20 @@ async def view_card_detail(callback: types.CallbackQuery):
 
         try:
             # Обновляем существующее сообщение
-            await callback.message.edit_media(
-                media=types.InputMediaPhoto(media=card.original_url, caption=text),
+            sent = await callback.message.edit_media(
+                media=types.InputMediaPhoto(
+                    media=card_file_ids.photo_for(card), caption=text
+                ),
                 reply_markup=keyboard,
             )
         except Exception as e:
             logger.warning(f"Не удалось обновить сообщение: {e}")
-            # Если не получилось — отправляем новое
-            await callback.message.answer_photo(
+            # Если не получилось — отправляем новое (file_id мог устареть)
+            card_file_ids.forget(card.id)
+            sent = await callback.message.answer_photo(
                 photo=card.original_url, caption=text, reply_markup=keyboard
             )
+        card_file_ids.remember(card, sent)
 
         await callback.answer()
 
@@ -1670,10 +1694,12 @@ async def cb_back_collection(callback: CallbackQuery):
 
 
 @router.callback_query(F.data == "back_to_collection")
-async def back_to_collection(callback: types.CallbackQuery):
+async def back_to_collection(
+    callback: types.CallbackQuery, session: AsyncSession, db_user: ResolvedUser
+):
 
     try:
-        await cmd_collection(callback.message, callback.from_user.id)
+        await cmd_collection(callback.message, session, db_user)
         await callback.answer()
     except Exception as e:
         logger.exception(f"Ошибка back_to_collection: {e}")
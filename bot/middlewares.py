@@ -0,0 +1,178 @@
+# bot/middlewares.py
+"""
+Middleware бота.
+
+DbSessionMiddleware открывает одну сессию БД на апдейт и передаёт её в
+хендлеры как session. Соединение берётся из пула только при первом запросе,
+коммит или откат делается один раз в конце апдейта.
+
+UserMiddleware один раз на апдейт определяет пользователя БД по telegram_id
+и кладёт его в data["db_user"]. Соответствие telegram_id → user_id и редко
+меняющиеся поля кэшируются в памяти процесса и в Redis (если подключён),
+поэтому нажатие кнопки не стоит отдельного SELECT по users.
+"""
+
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User as TelegramUser
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.base import AsyncSessionLocal
+from database.crud import get_user_or_create
+from database.routing import has_pending_writes, replica_router, session_wrote
+from services.activity_tracker import activity
+from services.redis_client import battle_storage
+
+logger = logging.getLogger(__name__)
+
+MEMORY_TTL = 600  # секунд в памяти процесса
+REDIS_TTL = 86400  # секунд в Redis
+MEMORY_LIMIT = 50_000
+
+
+# ===== СЕССИЯ НА АПДЕЙТ =====
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Одна сессия (и не больше одного соединения из пула) на апдейт"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with AsyncSessionLocal() as session:
+            data["session"] = session
+            try:
+                result = await handler(event, data)
+            except Exception:
+                await session.rollback()
+                raise
+            if has_pending_writes(session):
+                await session.commit()
+            if session_wrote(session):
+                # Свои чтения игрока — из основной БД, пока реплика догоняет
+                db_user = data.get("db_user")
+                replica_router.mark_write(db_user.id if db_user else None)
+            return result
+
+
+# ===== ПОЛЬЗОВАТЕЛЬ =====
+
+
+@dataclass(frozen=True)
+class ResolvedUser:
+    """Пользователь БД, известный на время апдейта (без баланса и статистики)"""
+
+    id: int
+    telegram_id: int
+    first_name: Optional[str] = None
+    username: Optional[str] = None
+
+
+class UserCache:
+    """telegram_id → ResolvedUser: память процесса, затем Redis, затем БД"""
+
+    def __init__(self):
+        self._memory: Dict[int, tuple] = {}
+
+    async def resolve(
+        self, tg_user: TelegramUser, session: AsyncSession = None
+    ) -> ResolvedUser:
+        telegram_id = tg_user.id
+        now = time.monotonic()
+
+        cached = self._memory.get(telegram_id)
+        if cached and cached[1] > now:
+            return cached[0]
+
+        resolved = await self._from_redis(telegram_id)
+        if resolved is None:
+            resolved = await self._from_db(tg_user, session)
+            await self._to_redis(resolved)
+
+        self._remember(resolved, now)
+        return resolved
+
+    def forget(self, telegram_id: int):
+        self._memory.pop(telegram_id, None)
+
+    def _remember(self, resolved: ResolvedUser, now: float):
+        if len(self._memory) >= MEMORY_LIMIT:
+            for key in [k for k, (_, exp) in self._memory.items() if exp <= now]:
+                del self._memory[key]
+            if len(self._memory) >= MEMORY_LIMIT:
+                self._memory.clear()
+        self._memory[resolved.telegram_id] = (resolved, now + MEMORY_TTL)
+
+    async def _from_db(
+        self, tg_user: TelegramUser, session: AsyncSession = None
+    ) -> ResolvedUser:
+        if session is None:
+            async with AsyncSessionLocal() as session:
+                return await self._from_db(tg_user, session)
+
+        user = await get_user_or_create(
+            session,
+            telegram_id=tg_user.id,
+            username=tg_user.username,
+            first_name=tg_user.first_name,
+            last_name=tg_user.last_name,
+        )
+        # Новый пользователь должен сохраниться, даже если хендлер упадёт
+        if has_pending_writes(session):
+            await session.commit()
+        return ResolvedUser(
+            id=user.id,
+            telegram_id=user.telegram_id,
+            first_name=user.first_name,
+            username=user.username,
+        )
+
+    async def _from_redis(self, telegram_id: int) -> Optional[ResolvedUser]:
+        if not battle_storage.redis:
+            return None
+        try:
+            raw = await battle_storage.redis.get(f"user:tg:{telegram_id}")
+            return ResolvedUser(**json.loads(raw)) if raw else None
+        except Exception as e:
+            logger.warning(f"⚠️ Кэш пользователя в Redis недоступен: {e}")
+            return None
+
+    async def _to_redis(self, resolved: ResolvedUser):
+        if not battle_storage.redis:
+            return
+        try:
+            await battle_storage.redis.setex(
+                f"user:tg:{resolved.telegram_id}",
+                REDIS_TTL,
+                json.dumps(asdict(resolved)),
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить пользователя в Redis: {e}")
+
+
+user_cache = UserCache()
+
+
+class UserMiddleware(BaseMiddleware):
+    """Кладёт в data["db_user"] пользователя БД (ResolvedUser)"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        tg_user = data.get("event_from_user")
+        if tg_user is not None and not tg_user.is_bot:
+            db_user = await user_cache.resolve(tg_user, data.get("session"))
+            activity.touch(db_user.id)
+            data["db_user"] = db_user
+        return await handler(event, data)
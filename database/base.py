@@ -7,6 +7,7 @@ from sqlalchemy.ext.asyncio import (
 )
 from sqlalchemy.orm import declarative_base
 import os
+from typing import Optional
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -28,4 +29,27 @@ AsyncSessionLocal = async_sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
+# Реплика для чтения (необязательна). Без DB_REPLICA_URL всё идёт в основную
+# БД; какие запросы уходят на реплику — решает database/routing.py
+DB_REPLICA_URL = os.getenv("DB_REPLICA_URL")
+
+replica_engine: Optional[AsyncEngine] = None
+ReplicaSessionLocal: Optional[async_sessionmaker] = None
+
+if DB_REPLICA_URL:
+    replica_engine = create_async_engine(
+        DB_REPLICA_URL,
+        echo=False,
+        future=True,
+        pool_size=5,
+        max_overflow=10,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        # Запись на реплике должна падать, даже если это обычный сервер
+        connect_args={"server_settings": {"default_transaction_read_only": "on"}},
+    )
+    ReplicaSessionLocal = async_sessionmaker(
+        replica_engine, class_=AsyncSession, expire_on_commit=False
+    )
+
 Base = declarative_base()
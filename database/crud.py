@@ -1,7 +1,7 @@
 # database/crud.py
 import random
 from datetime import datetime, timedelta
-from sqlalchemy import select, and_, func
+from sqlalchemy import select, and_, func, case
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from typing import List, Optional, Tuple
@@ -13,7 +13,20 @@ from database.models.pack_opening import PackOpening
 from database.models.expedition import Expedition, ExpeditionType, ExpeditionStatus
 from database.models.daily_task import DailyTask, TaskType
 from database.base import AsyncSessionLocal
-from game.pack_system import PACK_SETTINGS
+from database.routing import read_only
+from database.crud_summary import apply_cards_added, find_summary, get_summary
+from database.models.user_collection_summary import RARITIES
+from database.pagination import (
+    Cursor,
+    Page,
+    apply_keyset,
+    from_micros,
+    make_page,
+    to_micros,
+)
+from game.pack_system import PACK_SETTINGS, roll_pack_rarities
+from services.anime_index import anime_index
+from services.card_search import card_search
 import logging
 
 logger = logging.getLogger(__name__)
@@ -33,7 +46,7 @@ async def get_user_or_create(
     user = result.scalar_one_or_none()
 
     if user:
-        user.last_active = datetime.now()
+        # last_active пишет services.activity_tracker пачками, чтобы чтение не было записью
         return user
 
     new_user = User(
@@ -65,6 +78,7 @@ async def give_starting_cards(user_id: int, session: AsyncSession):
     )
     cards = result.scalars().all()
 
+    added = []
     for card in cards:
         user_card = UserCard(
             user_id=user_id,
@@ -76,7 +90,9 @@ async def give_starting_cards(user_id: int, session: AsyncSession):
             current_defense=card.base_defense,
         )
         session.add(user_card)
+        added.append((user_card, card.rarity))
 
+    await apply_cards_added(session, user_id, added)
     await session.commit()
 
     # Обновляем счетчик карт
@@ -116,57 +132,143 @@ async def update_user_collection_size(user_id: int, session: AsyncSession = None
 # ===== КОЛЛЕКЦИЯ =====
 
 
-async def get_user_collection(
-    user_id: int, page: int = 1, page_size: int = 10, rarity_filter: str = None
-) -> Tuple[List[Tuple[UserCard, Card]], int, int]:
-    """Получить коллекцию пользователя с пагинацией"""
-    async with AsyncSessionLocal() as session:
-        query = (
-            select(UserCard, Card)
-            .join(Card, UserCard.card_id == Card.id)
-            .where(UserCard.user_id == user_id)
-        )
+def _rarity_weight():
+    """Вес редкости для сортировки: SSS — больший, неизвестная — 0"""
+    return case(
+        {rarity: len(RARITIES) - i for i, rarity in enumerate(RARITIES)},
+        value=Card.rarity,
+        else_=0,
+    )
 
-        if rarity_filter:
-            query = query.where(Card.rarity == rarity_filter.upper())
 
-        count_query = select(func.count()).select_from(query.subquery())
-        total = await session.scalar(count_query)
+def _collection_keyset(query, cursor: Optional[Cursor], by_rarity: bool, limit: int):
+    """Сортировка коллекции: (редкость,) время получения, id — по убыванию"""
+    columns = [UserCard.obtained_at, UserCard.id]
+    values = None
+    if cursor is not None:
+        *rank, micros, card_id = cursor.key
+        values = [*rank, from_micros(micros), card_id]
+    if by_rarity:
+        columns.insert(0, _rarity_weight())
+    return apply_keyset(
+        query, columns, values, cursor is not None and cursor.backward, limit
+    )
 
-        query = (
-            query.order_by(UserCard.obtained_at.desc(), Card.rarity.desc())
-            .offset((page - 1) * page_size)
-            .limit(page_size)
+
+def _collection_key(user_card: UserCard, card: Card, by_rarity: bool) -> tuple:
+    key = (to_micros(user_card.obtained_at), user_card.id)
+    if by_rarity:
+        weight = (
+            len(RARITIES) - RARITIES.index(card.rarity)
+            if card.rarity in RARITIES
+            else 0
         )
+        key = (weight,) + key
+    return key
 
-        result = await session.execute(query)
-        items = result.all()
 
-        total_pages = (total + page_size - 1) // page_size if total > 0 else 1
+@read_only()
+async def get_user_collection(
+    user_id: int,
+    cursor: Optional[str] = None,
+    page_size: int = 10,
+    rarity_filter: str = None,
+    session: AsyncSession = None,
+) -> Page:
+    """Страница коллекции пользователя: Page из (UserCard, Card)"""
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            return await get_user_collection(
+                user_id, cursor, page_size, rarity_filter, session=session
+            )
 
-        return items, total, total_pages
+    position = Cursor.decode(cursor)
+    query = (
+        select(UserCard, Card)
+        .join(Card, UserCard.card_id == Card.id)
+        .where(UserCard.user_id == user_id)
+    )
 
+    if rarity_filter:
+        query = query.where(Card.rarity == rarity_filter.upper())
+
+    by_rarity = not rarity_filter
+    result = await session.execute(
+        _collection_keyset(query, position, by_rarity, page_size)
+    )
+    return make_page(
+        result.all(),
+        page_size,
+        position,
+        lambda row: _collection_key(row[0], row[1], by_rarity),
+    )
 
-async def get_collection_stats(user_id: int) -> dict:
-    """Получить статистику коллекции по редкостям"""
-    async with AsyncSessionLocal() as session:
-        # Группировка по редкости
-        result = await session.execute(
-            select(Card.rarity, func.count(UserCard.id))
-            .join(UserCard, Card.id == UserCard.card_id)
-            .where(UserCard.user_id == user_id)
-            .group_by(Card.rarity)
-        )
 
-        stats = {rarity: count for rarity, count in result.all()}
+@read_only()
+async def _stored_collection_stats(
+    user_id: int, session: AsyncSession = None
+) -> Optional[dict]:
+    """Статистика из готовой сводки или None (только SELECT — можно с реплики)"""
+    summary = await find_summary(session, user_id)
+    return summary.rarity_counts() if summary is not None else None
 
-        # Добавляем нули для отсутствующих редкостей
-        for rarity in ["SSS", "ASS", "S", "A", "B", "C", "D", "E"]:
-            if rarity not in stats:
-                stats[rarity] = 0
 
+async def get_collection_stats(user_id: int, session: AsyncSession = None) -> dict:
+    """Получить статистику коллекции по редкостям (из сводки)"""
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            stats = await get_collection_stats(user_id, session=session)
+            await session.commit()  # сводка могла быть построена впервые
+            return stats
+
+    stats = await _stored_collection_stats(user_id, session=session)
+    if stats is not None:
         return stats
 
+    # Сводки ещё нет — строим в основной БД, в переданной сессии
+    summary = await get_summary(session, user_id)
+    return summary.rarity_counts()
+
+
+# ===== АРЕНА =====
+
+
+@read_only(user_arg=None)
+async def get_arena_leaderboard(
+    limit: int = 10, deck_cards: int = 5, session: AsyncSession = None
+) -> List[Tuple[User, List[Tuple[str, str]]]]:
+    """Топ арены: [(игрок, [(название, редкость) первых карт колоды])]"""
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            return await get_arena_leaderboard(limit, deck_cards, session=session)
+
+    result = await session.execute(
+        select(User)
+        .where(User.arena_wins + User.arena_losses > 0)  # Игроки с боями
+        .order_by(User.arena_rating.desc())
+        .limit(limit)
+    )
+    players = result.scalars().all()
+
+    # Карты колод всех игроков топа — одним запросом
+    deck_ids = {
+        player.id: (player.selected_deck or [])[:deck_cards] for player in players
+    }
+    all_ids = {card_id for ids in deck_ids.values() for card_id in ids}
+    cards = {}
+    if all_ids:
+        rows = await session.execute(
+            select(UserCard.id, Card.card_name, Card.rarity)
+            .join(Card, UserCard.card_id == Card.id)
+            .where(UserCard.id.in_(all_ids))
+        )
+        cards = {row.id: (row.card_name, row.rarity) for row in rows}
+
+    return [
+        (player, [cards[i] for i in deck_ids[player.id] if i in cards])
+        for player in players
+    ]
+
 
 # ===== ОТКРЫТИЕ ПАЧЕК =====
 
@@ -187,9 +289,6 @@ async def _open_pack_transaction(user_id: int, pack_type: str, session: AsyncSes
     if not settings:
         raise ValueError("Неизвестный тип пака")
 
-    pity_a_max = settings.get("pity_a", 10)
-    pity_s_max = settings.get("pity_s", 50)
-
     user = await session.get(User, user_id)
     if user.coins < settings["price"]:
         raise ValueError("Недостаточно монет")
@@ -206,29 +305,17 @@ async def _open_pack_transaction(user_id: int, pack_type: str, session: AsyncSes
     pity_a = (last_open.packs_since_last_a or 0) + 1 if last_open else 0
     pity_s = (last_open.packs_since_last_s or 0) + 1 if last_open else 0
 
+    rolled, pity_a, pity_s, guaranteed_rarity = roll_pack_rarities(
+        settings, pity_a, pity_s
+    )
+
     cards = []
     rarities = []
-    guaranteed_rarity = None
 
     # Временно храним ID карт, которые будем добавлять
     new_card_ids = []
 
-    for _ in range(settings["cards_count"]):
-        # Pity
-        if pity_a >= pity_a_max:
-            rarity = "A"
-            guaranteed_rarity = "A"
-            pity_a = 0
-        elif pity_s >= pity_s_max:
-            rarity = "S"
-            guaranteed_rarity = "S"
-            pity_s = 0
-        else:
-            rarity = random.choices(
-                list(settings["rarity_weights"].keys()),
-                weights=list(settings["rarity_weights"].values()),
-            )[0]
-
+    for rarity in rolled:
         result = await session.execute(
             select(Card).where(Card.rarity == rarity).order_by(func.random()).limit(1)
         )
@@ -243,15 +330,6 @@ async def _open_pack_transaction(user_id: int, pack_type: str, session: AsyncSes
         # 🔥 Увеличиваем счётчик открытых карт
         user.cards_opened += 1
 
-        # обновляем pity
-        if rarity == "A":
-            pity_a = 0
-        if rarity in ["S", "ASS", "SSS"]:
-            pity_s = 0
-        else:
-            pity_a += 1
-            pity_s += 1
-
     pack_open = PackOpening(
         user_id=user_id,
         pack_type=pack_type,
@@ -298,12 +376,9 @@ async def start_expedition(
 
         duration = duration_map[expedition_type]
 
-        # Проверяем бонус за одно аниме
-        cards = await session.execute(select(Card).where(Card.id.in_(card_ids)))
-        cards_list = cards.scalars().all()
-
-        anime_names = set(c.anime_name for c in cards_list)
-        anime_bonus = len(anime_names) == 1
+        # Проверяем бонус за одно аниме (по индексу в памяти)
+        await anime_index.ensure_loaded(session)
+        anime_bonus = anime_index.same_anime(card_ids)
 
         # Рассчитываем награды
         base_coins = duration // 5  # 30 мин = 6 монет, 2ч = 24 монеты, 6ч = 72 монеты
@@ -391,6 +466,7 @@ async def claim_expedition(expedition_id: int) -> dict:
                     user_id=user.id, card_id=card.id, level=1, source="expedition"
                 )
                 session.add(user_card)
+                await apply_cards_added(session, user.id, [(user_card, card.rarity)])
                 rewards["card"] = card
 
         # Освобождаем карты
@@ -408,14 +484,17 @@ async def claim_expedition(expedition_id: int) -> dict:
         return rewards
 
 
+@read_only()
 async def get_user_cards_paginated(
     session,
     user_id: int,
-    page: int = 0,
+    cursor: Optional[str] = None,
     page_size: int = 6,
     rarity: str | None = None,
     search: str | None = None,
-):
+) -> Page:
+    """Страница карт (UserCard с загруженной card) по курсору"""
+    position = Cursor.decode(cursor)
     query = (
         select(UserCard)
         .join(Card, UserCard.card_id == Card.id)
@@ -427,15 +506,25 @@ async def get_user_cards_paginated(
         query = query.where(Card.rarity == rarity)
 
     if search:
-        query = query.where(Card.card_name.ilike(f"%{search}%"))
-
-    query = query.offset(page * page_size).limit(page_size + 1)
-
-    result = await session.execute(query)
-    cards = result.scalars().all()
+        # Триграммный поиск по картам игрока вместо ILIKE по всему каталогу
+        owned = await session.execute(
+            select(UserCard.card_id).where(UserCard.user_id == user_id)
+        )
+        card_ids = await card_search.matching_ids(
+            search, within=owned.scalars().all(), session=session
+        )
+        query = query.where(Card.id.in_(card_ids))
 
-    has_next = len(cards) > page_size
-    return cards[:page_size], has_next
+    by_rarity = not rarity
+    result = await session.execute(
+        _collection_keyset(query, position, by_rarity, page_size)
+    )
+    return make_page(
+        result.scalars().all(),
+        page_size,
+        position,
+        lambda uc: _collection_key(uc, uc.card, by_rarity),
+    )
 
 
 async def claim_daily_reward(user_id: int, session: AsyncSession) -> dict:
@@ -462,33 +551,40 @@ async def claim_daily_reward(user_id: int, session: AsyncSession) -> dict:
     }
 
 
-async def get_user_by_telegram_id(telegram_id: int) -> Optional[User]:
+async def get_user_by_telegram_id(
+    telegram_id: int, session: AsyncSession = None
+) -> Optional[User]:
     """Получить пользователя по telegram_id"""
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
-        )
-        return result.scalar_one_or_none()
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            return await get_user_by_telegram_id(telegram_id, session=session)
+
+    result = await session.execute(select(User).where(User.telegram_id == telegram_id))
+    return result.scalar_one_or_none()
 
 
-async def get_user_cards_count(user_id: int, rarity: str = None) -> int:
+@read_only()
+async def get_user_cards_count(
+    user_id: int, rarity: str = None, session: AsyncSession = None
+) -> int:
     """Получить количество карт пользователя"""
-    async with AsyncSessionLocal() as session:
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            return await get_user_cards_count(user_id, rarity, session=session)
+
+    query = (
+        select(func.count()).select_from(UserCard).where(UserCard.user_id == user_id)
+    )
+
+    if rarity:
         query = (
             select(func.count())
             .select_from(UserCard)
-            .where(UserCard.user_id == user_id)
+            .join(Card, UserCard.card_id == Card.id)
+            .where(UserCard.user_id == user_id, Card.rarity == rarity)
         )
 
-        if rarity:
-            query = (
-                select(func.count())
-                .select_from(UserCard)
-                .join(Card, UserCard.card_id == Card.id)
-                .where(UserCard.user_id == user_id, Card.rarity == rarity)
-            )
-
-        return await session.scalar(query)
+    return await session.scalar(query)
 
 
 async def sync_user_deck(session, user_id: int):
@@ -1,6 +1,7 @@
 #database/crud_cards.py
-from sqlalchemy import select, and_
+from sqlalchemy import select, and_, exists, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 from typing import Optional, Tuple
 import logging
 
@@ -8,129 +9,305 @@ from database.models.user_card import UserCard
 from database.models.card import Card
 from database.models.user import User
 from database.base import AsyncSessionLocal
+from database.crud_summary import apply_card_upgraded, get_summary
 from game.constants import DUST_PER_RARITY, UPGRADE_COST_PER_LEVEL, MAX_CARD_LEVEL
 
 logger = logging.getLogger(__name__)
 
 
 async def get_user_card_detail(
-    user_card_id: int, user_id: int
+    user_card_id: int, user_id: int, session: AsyncSession = None
 ) -> Optional[Tuple[UserCard, Card]]:
     """Получить детальную информацию о карте пользователя"""
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(UserCard, Card)
-            .join(Card, UserCard.card_id == Card.id)
-            .where(and_(UserCard.id == user_card_id, UserCard.user_id == user_id))
-        )
-        return result.first()
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            return await get_user_card_detail(user_card_id, user_id, session=session)
+
+    result = await session.execute(
+        select(UserCard, Card)
+        .join(Card, UserCard.card_id == Card.id)
+        .where(and_(UserCard.id == user_card_id, UserCard.user_id == user_id))
+    )
+    return result.first()
 
 
-async def upgrade_user_card(user_card_id: int, user_id: int) -> Optional[UserCard]:
+async def upgrade_user_card(
+    user_card_id: int, user_id: int, session: AsyncSession = None
+) -> Optional[UserCard]:
     """Улучшить карту на 1 уровень"""
-    async with AsyncSessionLocal() as session:
-        # Получаем карту с проверкой принадлежности пользователю
-        result = await session.execute(
-            select(UserCard, Card)
-            .join(Card, UserCard.card_id == Card.id)
-            .where(and_(UserCard.id == user_card_id, UserCard.user_id == user_id))
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            return await upgrade_user_card(user_card_id, user_id, session=session)
+
+    # Получаем карту с проверкой принадлежности пользователю
+    result = await session.execute(
+        select(UserCard, Card)
+        .join(Card, UserCard.card_id == Card.id)
+        .where(and_(UserCard.id == user_card_id, UserCard.user_id == user_id))
+    )
+    data = result.first()
+
+    if not data:
+        raise ValueError("Карта не найдена или не принадлежит вам")
+
+    user_card, card = data
+
+    # Проверка максимального уровня
+    if user_card.level >= MAX_CARD_LEVEL:
+        raise ValueError(
+            f"Карта уже достигла максимального уровня {MAX_CARD_LEVEL}"
         )
-        data = result.first()
 
-        if not data:
-            raise ValueError("Карта не найдена или не принадлежит вам")
+    # Расчет стоимости улучшения
+    rarity_multiplier = DUST_PER_RARITY.get(card.rarity, 10)
+    upgrade_cost = UPGRADE_COST_PER_LEVEL * rarity_multiplier
 
-        user_card, card = data
+    # Получаем пользователя для проверки пыли
+    user = await session.get(User, user_id)
+    if user.dust < upgrade_cost:
+        raise ValueError(
+            f"Недостаточно пыли! Нужно: {upgrade_cost}, у вас: {user.dust}"
+        )
 
-        # Проверка максимального уровня
-        if user_card.level >= MAX_CARD_LEVEL:
-            raise ValueError(
-                f"Карта уже достигла максимального уровня {MAX_CARD_LEVEL}"
-            )
+    old_power, old_level = user_card.current_power, user_card.level
+
+    # Снимаем пыль
+    user.dust -= upgrade_cost
+    user.total_cards_upgraded += 1
+
+    # Увеличиваем уровень
+    user_card.level += 1
+    user_card.times_upgraded += 1
+
+    # Пересчитываем характеристики
+    from game.upgrade_calculator import calculate_stats_for_level
+
+    new_stats = calculate_stats_for_level(card, user_card.level)
+
+    user_card.current_power = new_stats["power"]
+    user_card.current_health = new_stats["health"]
+    user_card.current_attack = new_stats["attack"]
+    user_card.current_defense = new_stats["defense"]
+    await apply_card_upgraded(session, user_id, user_card, old_power, old_level)
+
+    await session.commit()
+    await session.refresh(user_card)
+
+    logger.info(f"✅ Карта {card.card_name} улучшена до {user_card.level} уровня")
+
+    return user_card
+
+
+# ===== МАССОВОЕ УЛУЧШЕНИЕ =====
+
+UPGRADE_MAX = "max"  # насколько хватит пыли
+UPGRADE_BONUS = "bonus"  # до следующего бонуса за 10 уровней
+UPGRADE_EXACT = "exact"  # ровно на count уровней
 
-        # Расчет стоимости улучшения
-        rarity_multiplier = DUST_PER_RARITY.get(card.rarity, 10)
-        upgrade_cost = UPGRADE_COST_PER_LEVEL * rarity_multiplier
 
-        # Получаем пользователя для проверки пыли
-        user = await session.get(User, user_id)
-        if user.dust < upgrade_cost:
-            raise ValueError(
-                f"Недостаточно пыли! Нужно: {upgrade_cost}, у вас: {user.dust}"
+def bulk_upgrade_target(
+    card: Card, level: int, dust: int, mode: str, count: int = 1
+) -> int:
+    """Целевой уровень для режима массового улучшения"""
+    from game.upgrade_calculator import max_affordable_level, next_bonus_level
+
+    if mode == UPGRADE_MAX:
+        return max_affordable_level(card, level, dust)
+    if mode == UPGRADE_BONUS:
+        return next_bonus_level(level)
+    if mode == UPGRADE_EXACT:
+        return min(level + max(count, 1), MAX_CARD_LEVEL)
+    raise ValueError(f"Неизвестный режим улучшения: {mode}")
+
+
+async def bulk_upgrade_user_card(
+    user_card_id: int,
+    user_id: int,
+    mode: str,
+    count: int = 1,
+    session: AsyncSession = None,
+) -> dict:
+    """
+    Улучшить карту сразу на несколько уровней.
+
+    Целевой уровень и цена считаются по префиксным суммам стоимости,
+    а списание пыли и запись уровня со статами — один UPDATE: CTE
+    списывает пыль только при dust >= cost, карта обновляется только
+    если списание прошло и уровень не изменился с момента чтения.
+    """
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            upgrade = await bulk_upgrade_user_card(
+                user_card_id, user_id, mode, count, session=session
             )
+            await session.commit()
+            return upgrade
 
-        # Снимаем пыль
-        user.dust -= upgrade_cost
-        user.total_cards_upgraded += 1
+    from game.upgrade_calculator import (
+        calculate_stats_for_level,
+        upgrade_cost_between,
+    )
 
-        # Увеличиваем уровень
-        user_card.level += 1
-        user_card.times_upgraded += 1
+    data = await get_user_card_detail(user_card_id, user_id, session=session)
+    if not data:
+        raise ValueError("Карта не найдена или не принадлежит вам")
+    user_card, card = data
 
-        # Пересчитываем характеристики
-        from game.upgrade_calculator import calculate_stats_for_level
+    if user_card.level >= MAX_CARD_LEVEL:
+        raise ValueError(
+            f"Карта уже достигла максимального уровня {MAX_CARD_LEVEL}"
+        )
 
-        new_stats = calculate_stats_for_level(card, user_card.level)
+    user = await session.get(User, user_id)
+    from_level = user_card.level
+    to_level = bulk_upgrade_target(card, from_level, user.dust, mode, count)
+    cost = upgrade_cost_between(card, from_level, to_level)
+    if to_level <= from_level or user.dust < cost:
+        needed = cost or upgrade_cost_between(card, from_level, from_level + 1)
+        raise ValueError(
+            f"Недостаточно пыли! Нужно: {needed}, у вас: {user.dust}"
+        )
 
-        user_card.current_power = new_stats["power"]
-        user_card.current_health = new_stats["health"]
-        user_card.current_attack = new_stats["attack"]
-        user_card.current_defense = new_stats["defense"]
+    levels = to_level - from_level
+    stats = calculate_stats_for_level(card, to_level)
+    old_stats = {
+        "power": user_card.current_power,
+        "health": user_card.current_health,
+        "attack": user_card.current_attack,
+        "defense": user_card.current_defense,
+    }
 
-        await session.commit()
-        await session.refresh(user_card)
+    debit = (
+        update(User)
+        .where(User.id == user_id, User.dust >= cost)
+        .values(
+            dust=User.dust - cost,
+            total_cards_upgraded=User.total_cards_upgraded + levels,
+        )
+        .returning(User.id, User.dust, User.total_cards_upgraded)
+        .cte("debit")
+    )
+    result = await session.execute(
+        update(UserCard)
+        .where(
+            UserCard.id == user_card.id,
+            UserCard.user_id == user_id,
+            UserCard.level == from_level,
+            exists(select(debit.c.id)),
+        )
+        .values(
+            level=to_level,
+            times_upgraded=UserCard.times_upgraded + levels,
+            current_power=stats["power"],
+            current_health=stats["health"],
+            current_attack=stats["attack"],
+            current_defense=stats["defense"],
+        )
+        .returning(
+            UserCard.times_upgraded,
+            select(debit.c.dust).scalar_subquery(),
+            select(debit.c.total_cards_upgraded).scalar_subquery(),
+        )
+        .add_cte(debit)
+        .execution_options(synchronize_session=False)
+    )
+    row = result.first()
+    if row is None:
+        # Пыль успели потратить или карту улучшили параллельно — списание
+        # в CTE откатится вместе с транзакцией
+        await session.rollback()
+        raise ValueError("Недостаточно пыли или карта уже изменилась")
 
-        logger.info(f"✅ Карта {card.card_name} улучшена до {user_card.level} уровня")
+    times_upgraded, dust_left, total_upgraded = row
 
-        return user_card
+    # UPDATE прошёл мимо identity map — синхронизируем загруженные объекты
+    for attr, value in (
+        ("level", to_level),
+        ("times_upgraded", times_upgraded),
+        ("current_power", stats["power"]),
+        ("current_health", stats["health"]),
+        ("current_attack", stats["attack"]),
+        ("current_defense", stats["defense"]),
+    ):
+        set_committed_value(user_card, attr, value)
+    set_committed_value(user, "dust", dust_left)
+    set_committed_value(user, "total_cards_upgraded", total_upgraded)
 
+    await apply_card_upgraded(
+        session, user_id, user_card, old_stats["power"], from_level
+    )
 
-async def toggle_favorite(user_card_id: int, user_id: int) -> bool:
+    logger.info(
+        f"✅ Карта {card.card_name} улучшена {from_level} → {to_level} "
+        f"за {cost} пыли"
+    )
+
+    return {
+        "user_card": user_card,
+        "card": card,
+        "from_level": from_level,
+        "to_level": to_level,
+        "levels": levels,
+        "cost": cost,
+        "dust_left": dust_left,
+        "old_stats": old_stats,
+    }
+
+
+async def toggle_favorite(
+    user_card_id: int, user_id: int, session: AsyncSession = None
+) -> bool:
     """Добавить/убрать карту из избранного"""
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(UserCard).where(
-                and_(UserCard.id == user_card_id, UserCard.user_id == user_id)
-            )
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            return await toggle_favorite(user_card_id, user_id, session=session)
+
+    result = await session.execute(
+        select(UserCard).where(
+            and_(UserCard.id == user_card_id, UserCard.user_id == user_id)
         )
-        user_card = result.scalar_one_or_none()
+    )
+    user_card = result.scalar_one_or_none()
 
-        if not user_card:
-            raise ValueError("Карта не найдена")
+    if not user_card:
+        raise ValueError("Карта не найдена")
 
-        user_card.is_favorite = not user_card.is_favorite
-        await session.commit()
+    summary = await get_summary(session, user_id, lock=True)
+    user_card.is_favorite = not user_card.is_favorite
+    summary.favorite_count += 1 if user_card.is_favorite else -1
+    await session.commit()
 
-        return user_card.is_favorite
+    return user_card.is_favorite
 
 
-async def toggle_in_deck(user_card_id: int, user_id: int) -> bool:
+async def toggle_in_deck(
+    user_card_id: int, user_id: int, session: AsyncSession = None
+) -> bool:
     """Добавить/убрать карту из колоды"""
-    async with AsyncSessionLocal() as session:
-        # Проверяем сколько карт уже в колоде
-        result = await session.execute(
-            select(UserCard).where(
-                and_(UserCard.user_id == user_id, UserCard.is_in_deck == True)
-            )
-        )
-        deck_cards = result.scalars().all()
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            return await toggle_in_deck(user_card_id, user_id, session=session)
 
-        result = await session.execute(
-            select(UserCard).where(
-                and_(UserCard.id == user_card_id, UserCard.user_id == user_id)
-            )
+    result = await session.execute(
+        select(UserCard).where(
+            and_(UserCard.id == user_card_id, UserCard.user_id == user_id)
         )
-        user_card = result.scalar_one_or_none()
+    )
+    user_card = result.scalar_one_or_none()
+
+    if not user_card:
+        raise ValueError("Карта не найдена")
 
-        if not user_card:
-            raise ValueError("Карта не найдена")
+    # Сколько карт уже в колоде — из сводки (строка блокируется до коммита)
+    summary = await get_summary(session, user_id, lock=True)
 
-        # Если добавляем в колоду
-        if not user_card.is_in_deck:
-            if len(deck_cards) >= 5:  # Максимум 5 карт в колоде
-                raise ValueError("В колоде может быть только 5 карт")
+    # Если добавляем в колоду
+    if not user_card.is_in_deck:
+        if summary.deck_count >= 5:  # Максимум 5 карт в колоде
+            raise ValueError("В колоде может быть только 5 карт")
 
-        user_card.is_in_deck = not user_card.is_in_deck
-        await session.commit()
+    user_card.is_in_deck = not user_card.is_in_deck
+    summary.deck_count += 1 if user_card.is_in_deck else -1
+    await session.commit()
 
-        return user_card.is_in_deck
+    return user_card.is_in_deck
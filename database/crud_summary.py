@@ -0,0 +1,247 @@
+# database/crud_summary.py
+"""
+Сводка коллекции (user_collection_summary).
+
+Строка сводки меняется в той же транзакции, что и карты: apply_* берут её
+с SELECT ... FOR UPDATE и прибавляют дельты. Если строки ещё нет, она
+строится из user_cards целиком (к этому моменту изменения уже сброшены
+autoflush'ем, поэтому дельта не нужна). Флаги избранного и колоды
+обработчики меняют в сводке сами: она нужна им заблокированной ещё до
+изменения карты — для проверки лимита. reconcile_summaries исправляет
+возможный дрейф пачкой INSERT ... SELECT ... ON CONFLICT.
+"""
+
+from typing import Iterable, List, Optional, Sequence, Tuple
+import logging
+
+from sqlalchemy import select, func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models.card import Card
+from database.models.user_card import UserCard
+from database.models.user_collection_summary import (
+    UserCollectionSummary,
+    RARITIES,
+    TOP_CARDS_LIMIT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# ===== ЧТЕНИЕ =====
+
+
+async def get_summary(
+    session: AsyncSession, user_id: int, lock: bool = False
+) -> UserCollectionSummary:
+    """Сводка игрока (одно чтение по первичному ключу)"""
+    summary, _ = await _load(session, user_id, lock)
+    return summary
+
+
+async def find_summary(
+    session: AsyncSession, user_id: int, lock: bool = False
+) -> Optional[UserCollectionSummary]:
+    """Сводка игрока или None, если её ещё нет (только SELECT)"""
+    query = select(UserCollectionSummary).where(
+        UserCollectionSummary.user_id == user_id
+    )
+    if lock:
+        query = query.with_for_update()
+    return (await session.execute(query)).scalar_one_or_none()
+
+
+async def _load(
+    session: AsyncSession, user_id: int, lock: bool
+) -> Tuple[UserCollectionSummary, bool]:
+    """(сводка, была_ли_перестроена)"""
+    summary = await find_summary(session, user_id, lock)
+    if summary is not None:
+        return summary, False
+
+    return await rebuild_summary(session, user_id), True
+
+
+async def rebuild_summary(session: AsyncSession, user_id: int) -> UserCollectionSummary:
+    """Пересчитать сводку игрока из user_cards"""
+    values = await _aggregate(session, user_id)
+
+    stmt = insert(UserCollectionSummary).values(user_id=user_id, **values)
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[UserCollectionSummary.user_id],
+            set_={**values, "updated_at": func.now()},
+        )
+    )
+
+    result = await session.execute(
+        select(UserCollectionSummary)
+        .where(UserCollectionSummary.user_id == user_id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    return result.scalar_one()
+
+
+async def _aggregate(session: AsyncSession, user_id: int) -> dict:
+    columns = [
+        func.count(UserCard.id)
+        .filter(Card.rarity == rarity)
+        .label(UserCollectionSummary.rarity_column(rarity))
+        for rarity in RARITIES
+    ]
+    result = await session.execute(
+        select(
+            *columns,
+            func.count(UserCard.id).label("total_cards"),
+            func.coalesce(func.sum(UserCard.current_power), 0).label("total_power"),
+            func.coalesce(func.sum(UserCard.level), 0).label("level_sum"),
+            func.count(UserCard.id)
+            .filter(UserCard.is_favorite == True)
+            .label("favorite_count"),
+            func.count(UserCard.id)
+            .filter(UserCard.is_in_deck == True)
+            .label("deck_count"),
+        )
+        .select_from(UserCard)
+        .join(Card, UserCard.card_id == Card.id)
+        .where(UserCard.user_id == user_id)
+    )
+    values = dict(result.one()._mapping)
+
+    top = await session.execute(
+        select(UserCard.id, UserCard.current_power)
+        .where(UserCard.user_id == user_id)
+        .order_by(UserCard.current_power.desc(), UserCard.id)
+        .limit(TOP_CARDS_LIMIT)
+    )
+    values["top_cards"] = [[card_id, power or 0] for card_id, power in top.all()]
+    return values
+
+
+# ===== ИЗМЕНЕНИЯ =====
+
+
+async def apply_cards_added(
+    session: AsyncSession, user_id: int, cards: Iterable[Tuple[UserCard, str]]
+):
+    """Новые карты: [(user_card, rarity), ...] — уже добавлены в сессию"""
+    cards = list(cards)
+    if not cards:
+        return
+
+    await session.flush()  # нужны id новых карт
+    summary, rebuilt = await _load(session, user_id, lock=True)
+    if rebuilt:
+        return
+
+    for user_card, rarity in cards:
+        column = UserCollectionSummary.rarity_column(rarity)
+        setattr(summary, column, getattr(summary, column) + 1)
+        summary.total_cards += 1
+        summary.total_power += user_card.current_power or 0
+        summary.level_sum += user_card.level or 0
+        summary.favorite_count += 1 if user_card.is_favorite else 0
+        summary.deck_count += 1 if user_card.is_in_deck else 0
+
+    summary.top_cards = _merge_top(
+        summary.top_cards, [(uc.id, uc.current_power or 0) for uc, _ in cards]
+    )
+
+
+async def apply_card_upgraded(
+    session: AsyncSession,
+    user_id: int,
+    user_card: UserCard,
+    old_power: int,
+    old_level: int,
+):
+    """Карта улучшена (уровень и сила выросли)"""
+    summary, rebuilt = await _load(session, user_id, lock=True)
+    if rebuilt:
+        return
+
+    summary.total_power += (user_card.current_power or 0) - (old_power or 0)
+    summary.level_sum += (user_card.level or 0) - (old_level or 0)
+    summary.top_cards = _merge_top(
+        summary.top_cards, [(user_card.id, user_card.current_power or 0)]
+    )
+
+
+def _merge_top(top: Optional[list], entries: Sequence[Tuple[int, int]]) -> List[list]:
+    """Слить новые значения силы в топ (новый список — JSONB видит изменение)"""
+    powers = {card_id: power for card_id, power in (top or [])}
+    powers.update(entries)
+    ranked = sorted(powers.items(), key=lambda item: (-item[1], item[0]))
+    return [[card_id, power] for card_id, power in ranked[:TOP_CARDS_LIMIT]]
+
+
+# ===== СВЕРКА =====
+
+_RECONCILE_SQL = text(f"""
+    INSERT INTO user_collection_summary (
+        user_id, {", ".join(f"count_{r.lower()}" for r in RARITIES)},
+        total_cards, total_power, level_sum, favorite_count, deck_count,
+        top_cards, updated_at
+    )
+    SELECT
+        u.id,
+        {", ".join(
+            f"COUNT(uc.id) FILTER (WHERE c.rarity = '{r}')" for r in RARITIES
+        )},
+        COUNT(uc.id),
+        COALESCE(SUM(uc.current_power), 0),
+        COALESCE(SUM(uc.level), 0),
+        COUNT(uc.id) FILTER (WHERE uc.is_favorite),
+        COUNT(uc.id) FILTER (WHERE uc.is_in_deck),
+        COALESCE((
+            SELECT jsonb_agg(jsonb_build_array(t.id, COALESCE(t.current_power, 0))
+                             ORDER BY t.current_power DESC NULLS LAST, t.id)
+            FROM (
+                SELECT id, current_power FROM user_cards
+                WHERE user_id = u.id
+                ORDER BY current_power DESC NULLS LAST, id
+                LIMIT {TOP_CARDS_LIMIT}
+            ) t
+        ), '[]'::jsonb),
+        now()
+    FROM users u
+    LEFT JOIN user_cards uc ON uc.user_id = u.id
+    LEFT JOIN cards c ON c.id = uc.card_id
+    WHERE u.id > :after_id AND u.id <= :until_id
+    GROUP BY u.id
+    ON CONFLICT (user_id) DO UPDATE SET
+        {", ".join(f"count_{r.lower()} = EXCLUDED.count_{r.lower()}" for r in RARITIES)},
+        total_cards = EXCLUDED.total_cards,
+        total_power = EXCLUDED.total_power,
+        level_sum = EXCLUDED.level_sum,
+        favorite_count = EXCLUDED.favorite_count,
+        deck_count = EXCLUDED.deck_count,
+        top_cards = EXCLUDED.top_cards,
+        updated_at = now()
+    """)
+
+
+async def reconcile_summaries(
+    session: AsyncSession, after_id: int, until_id: int
+) -> int:
+    """Пересчитать сводки игроков с after_id < id <= until_id"""
+    # Сначала блокируем сводки пачки: транзакции, которые уже прибавили к
+    # ним дельты, успеют закоммититься, и пересчёт (новый снимок в READ
+    # COMMITTED) увидит их карты. Иначе ON CONFLICT перезапишет их
+    # прибавки счётчиками из снимка до коммита. Следующие apply_* ждут
+    # коммита сверки и прибавляют уже к пересчитанным значениям.
+    await session.execute(
+        select(UserCollectionSummary.user_id)
+        .where(
+            UserCollectionSummary.user_id > after_id,
+            UserCollectionSummary.user_id <= until_id,
+        )
+        .order_by(UserCollectionSummary.user_id)
+        .with_for_update()
+    )
+    result = await session.execute(
+        _RECONCILE_SQL, {"after_id": after_id, "until_id": until_id}
+    )
+    return result.rowcount or 0
@@ -7,6 +7,7 @@ from database.models.expedition import Expedition, ExpeditionType, ExpeditionSta
 from database.models.daily_task import DailyTask, TaskType
 from database.models.arena_battle import ArenaBattle
 from database.models.trade import Trade, TradeStatus
+from database.models.user_collection_summary import UserCollectionSummary
 
 __all__ = [
     "User",
@@ -21,4 +22,5 @@ __all__ = [
     "ArenaBattle",
     "Trade",
     "TradeStatus",
+    "UserCollectionSummary",
 ]
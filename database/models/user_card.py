@@ -1,5 +1,5 @@
 #database/models/user_card.py
-from sqlalchemy import Column, Integer, ForeignKey, DateTime, Boolean, String
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, Boolean, String, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database.base import Base
@@ -9,6 +9,11 @@ class UserCard(Base):
     """Связь пользователь-карточка (инвентарь)"""
 
     __tablename__ = "user_cards"
+    __table_args__ = (
+        # ДОБАВИТЬ В БД: индекс для keyset-пагинации коллекции
+        # CREATE INDEX ix_user_cards_user_obtained ON user_cards (user_id, obtained_at, id);
+        Index("ix_user_cards_user_obtained", "user_id", "obtained_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
@@ -0,0 +1,56 @@
+# database/models/user_collection_summary.py
+# ДОБАВИТЬ В БД (создаётся при старте через create(checkfirst=True))
+from sqlalchemy import Column, Integer, BigInteger, ForeignKey, DateTime
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func, text
+from database.base import Base
+
+RARITIES = ["SSS", "ASS", "S", "A", "B", "C", "D", "E"]
+TOP_CARDS_LIMIT = 10
+
+
+class UserCollectionSummary(Base):
+    """Сводка коллекции игрока (поддерживается инкрементально)"""
+
+    __tablename__ = "user_collection_summary"
+
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+
+    # Количество карт по редкостям
+    count_sss = Column(Integer, default=0, nullable=False)
+    count_ass = Column(Integer, default=0, nullable=False)
+    count_s = Column(Integer, default=0, nullable=False)
+    count_a = Column(Integer, default=0, nullable=False)
+    count_b = Column(Integer, default=0, nullable=False)
+    count_c = Column(Integer, default=0, nullable=False)
+    count_d = Column(Integer, default=0, nullable=False)
+    count_e = Column(Integer, default=0, nullable=False)
+
+    # Общие показатели
+    total_cards = Column(Integer, default=0, nullable=False)
+    total_power = Column(BigInteger, default=0, nullable=False)
+    level_sum = Column(BigInteger, default=0, nullable=False)
+    favorite_count = Column(Integer, default=0, nullable=False)
+    deck_count = Column(Integer, default=0, nullable=False)
+
+    # Топ карт по силе: [[user_card_id, power], ...] по убыванию силы
+    top_cards = Column(JSONB, default=list, server_default=text("'[]'::jsonb"))
+
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    @staticmethod
+    def rarity_column(rarity: str) -> str:
+        return f"count_{rarity.lower()}"
+
+    def rarity_counts(self) -> dict:
+        """{"SSS": 0, "ASS": 1, ...} — как get_collection_stats"""
+        return {r: getattr(self, self.rarity_column(r)) or 0 for r in RARITIES}
+
+    @property
+    def avg_level(self) -> float:
+        return self.level_sum / self.total_cards if self.total_cards else 0
+
+    def __repr__(self):
+        return f"<UserCollectionSummary user={self.user_id} cards={self.total_cards}>"
@@ -0,0 +1,118 @@
+# database/pagination.py
+"""
+Keyset-пагинация (вместо OFFSET).
+
+Страница запрашивается не номером, а позицией: ключом сортировки крайней
+показанной строки. Запрос "строки после ключа" идёт по индексу и стоит
+одинаково на первой и на сотой странице.
+
+Курсор — ключ из целых чисел в base36 с буквой направления впереди
+("n" — дальше, "p" — назад), чтобы влезать в 64 байта callback_data:
+например n1z141z7kq8.4fq — карты, полученные раньше (obtained_at, id).
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import tuple_
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+_EPOCH = datetime(1970, 1, 1)
+_MICRO = timedelta(microseconds=1)
+
+
+def _b36(value: int) -> str:
+    if value < 0:
+        raise ValueError("Ключ курсора не может быть отрицательным")
+    digits = ""
+    while True:
+        value, rest = divmod(value, 36)
+        digits = _DIGITS[rest] + digits
+        if not value:
+            return digits
+
+
+def to_micros(moment: datetime) -> int:
+    """datetime → целое число микросекунд (без потери точности)"""
+    return (moment - _EPOCH) // _MICRO
+
+
+def from_micros(micros: int) -> datetime:
+    return _EPOCH + micros * _MICRO
+
+
+@dataclass(frozen=True)
+class Cursor:
+    """Позиция в выборке: ключ сортировки и направление"""
+
+    key: Tuple[int, ...]
+    backward: bool = False
+
+    def encode(self) -> str:
+        return ("p" if self.backward else "n") + ".".join(_b36(k) for k in self.key)
+
+    @classmethod
+    def decode(cls, token: Optional[str]) -> Optional["Cursor"]:
+        """Разобрать курсор из callback_data (None/"" — первая страница)"""
+        if not token:
+            return None
+        if token[0] not in "np":
+            raise ValueError(f"Неверный курсор: {token}")
+        key = tuple(int(part, 36) for part in token[1:].split("."))
+        return cls(key=key, backward=token[0] == "p")
+
+
+@dataclass
+class Page:
+    """Страница выборки и курсоры соседних страниц"""
+
+    items: List[Any] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+
+def apply_keyset(
+    query, columns: Sequence, values: Optional[Sequence], backward: bool, limit: int
+):
+    """
+    Добавить к запросу условие и сортировку по ключу.
+    Все колонки сортируются по убыванию; берётся limit + 1 строка,
+    чтобы узнать, есть ли ещё.
+    """
+    if values is not None:
+        position = tuple_(*columns)
+        query = query.where(
+            position > tuple_(*values) if backward else position < tuple_(*values)
+        )
+    order = [c.asc() if backward else c.desc() for c in columns]
+    return query.order_by(*order).limit(limit + 1)
+
+
+def make_page(
+    rows: Sequence,
+    limit: int,
+    cursor: Optional[Cursor],
+    key_of: Callable[[Any], Tuple[int, ...]],
+) -> Page:
+    """Собрать Page из результата apply_keyset"""
+    rows = list(rows)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    backward = cursor is not None and cursor.backward
+    if backward:
+        rows.reverse()
+    if not rows:
+        return Page()
+
+    has_next = True if backward else has_more
+    has_prev = has_more if backward else cursor is not None
+
+    return Page(
+        items=rows,
+        next_cursor=Cursor(key_of(rows[-1])).encode() if has_next else None,
+        prev_cursor=(
+            Cursor(key_of(rows[0]), backward=True).encode() if has_prev else None
+        ),
+    )
@@ -0,0 +1,259 @@
+# database/routing.py
+"""
+Чтение с реплики.
+
+Функции CRUD, помеченные @read_only, выполняются в сессии реплики
+(DB_REPLICA_URL в database/base.py), если для данных игрока это
+безопасно. Иначе — как раньше, в переданной сессии основной БД:
+
+* в переданной сессии уже что-то записано (в том числе закоммичено
+  раньше в этом же апдейте) — читаем там же;
+* игрок сам писал в БД меньше чем STICKY_SECONDS назад (или чем текущее
+  отставание реплики, если оно больше) — его чтения идут в основную БД;
+* реплика отстаёт больше MAX_LAG или недоступна — всё идёт в основную БД;
+* запрос на реплике упал (нет соединения, конфликт с восстановлением) —
+  повтор в основной БД.
+
+Функция с @read_only не должна писать: если чтению может понадобиться
+запись (например, построить отсутствующую сводку), помечается только
+чистый SELECT, а запись делается явно в сессии основной БД.
+
+Записи игрока отмечает DbSessionMiddleware после коммита; другие места
+записи могут вызывать replica_router.mark_write сами. Окно хранится в
+памяти процесса.
+
+Отставание проверяется на реплике не чаще раза в LAG_CHECK_INTERVAL,
+в фоновой задаче — чтение проверку не ждёт.
+
+Модуль не импортирует движки и метрики при загрузке: им пользуются
+индексы каталога, которые game/ импортирует без БД и бота.
+
+Проверка на двух локальных Postgres: DB_URL — основная, DB_REPLICA_URL —
+вторая с копией данных. Сессии реплики открываются read-only, поэтому
+случайная запись падает так же, как на настоящем standby.
+"""
+
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+STICKY_SECONDS = float(os.getenv("DB_REPLICA_STICKY_SECONDS", "5"))
+MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "30"))
+LAG_CHECK_INTERVAL = 5.0
+WRITES_LIMIT = 100_000  # игроков в окне записи
+
+# На standby — время с последней применённой транзакции, если WAL ещё
+# применяется; на основной БД и логической реплике — 0
+LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END
+    """)
+
+
+# ===== ЗАПИСИ В СЕССИИ =====
+
+# Одни слушатели на обе отметки: has_writes — незакоммиченные записи
+# текущей транзакции (по ней DbSessionMiddleware решает, коммитить ли),
+# wrote — записи за всё время сессии (коммит её не сбрасывает)
+_WRITES_KEY = "has_writes"
+_WROTE_KEY = "wrote"
+_REPLICA_KEY = "replica"  # сессия уже открыта на реплике
+
+# Повтор после ошибки реплики: вложенные @read_only тоже в основную БД
+_primary_only: ContextVar[bool] = ContextVar("primary_only", default=False)
+
+
+def _mark_writes(session):
+    session.info[_WRITES_KEY] = True
+    session.info[_WROTE_KEY] = True
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flush(session, flush_context):
+    _mark_writes(session)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_dml(orm_execute_state):
+    if (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or orm_execute_state.is_delete
+    ):
+        _mark_writes(orm_execute_state.session)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _clear_writes(session):
+    session.info.pop(_WRITES_KEY, None)
+
+
+def _has_unflushed(session) -> bool:
+    return bool(session.new or session.dirty or session.deleted)
+
+
+def has_pending_writes(session) -> bool:
+    """Есть ли в текущей транзакции незакоммиченные изменения"""
+    return bool(session.info.get(_WRITES_KEY)) or _has_unflushed(session)
+
+
+def session_wrote(session) -> bool:
+    """Писала ли сессия в БД за всё время (или есть несохранённые изменения)"""
+    return bool(session.info.get(_WROTE_KEY)) or _has_unflushed(session)
+
+
+# ===== МАРШРУТИЗАЦИЯ =====
+
+
+def _count(target: str):
+    # Метрики тянут aiogram — импорт только при первом чтении
+    from services.metrics import DB_READ_ROUTING
+
+    DB_READ_ROUTING.labels(target).inc()
+
+
+class ReplicaRouter:
+    """Решает, можно ли читать с реплики"""
+
+    def __init__(self):
+        self._writes: Dict[int, float] = {}  # user_id → monotonic время записи
+        self.lag = 0.0
+        self._lag_checked_at = 0.0
+        self._lag_task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        from database.base import ReplicaSessionLocal
+
+        return ReplicaSessionLocal is not None
+
+    def window(self) -> float:
+        """Сколько секунд после записи игрок читает из основной БД"""
+        return max(STICKY_SECONDS, self.lag)
+
+    def mark_write(self, user_id: Optional[int]):
+        if user_id is None or not self.enabled:
+            return
+        now = time.monotonic()
+        if len(self._writes) >= WRITES_LIMIT:
+            window = self.window()
+            for key in [k for k, at in self._writes.items() if now - at > window]:
+                del self._writes[key]
+        self._writes[user_id] = now
+
+    def use_replica(self, user_id: Optional[int] = None, session=None) -> bool:
+        if not self.enabled:
+            return False
+        self._check_lag()
+        if self.lag > MAX_LAG:
+            return False
+        if session is not None and session_wrote(session):
+            return False
+        if user_id is not None:
+            wrote_at = self._writes.get(user_id)
+            if wrote_at is not None and time.monotonic() - wrote_at < self.window():
+                return False
+        return True
+
+    # ===== ОТСТАВАНИЕ =====
+
+    def _check_lag(self):
+        now = time.monotonic()
+        if now - self._lag_checked_at < LAG_CHECK_INTERVAL:
+            return
+        if self._lag_task and not self._lag_task.done():
+            return
+        self._lag_checked_at = now
+        self._lag_task = asyncio.create_task(self.measure_lag(), name="replica-lag")
+
+    async def measure_lag(self) -> float:
+        from database.base import ReplicaSessionLocal
+        from services.metrics import DB_REPLICA_LAG
+
+        try:
+            async with ReplicaSessionLocal() as session:
+                lag = float((await session.execute(LAG_QUERY)).scalar() or 0.0)
+        except Exception as e:
+            if self.lag != float("inf"):
+                logger.warning(f"⚠️ Реплика недоступна, чтение из основной БД: {e}")
+            lag = float("inf")
+        else:
+            if lag > MAX_LAG >= self.lag:
+                logger.warning(
+                    f"⚠️ Реплика отстаёт на {lag:.1f}с — чтение из основной БД"
+                )
+            elif self.lag > MAX_LAG >= lag:
+                logger.info(f"✅ Реплика снова доступна (отставание {lag:.1f}с)")
+        self.lag = lag
+        DB_REPLICA_LAG.set(lag)
+        return lag
+
+
+replica_router = ReplicaRouter()
+
+
+def read_only(user_arg: Optional[str] = "user_id"):
+    """
+    Функция только читает: выполнять её с сессией реплики, когда можно.
+    user_arg — аргумент с id игрока, чьи данные читаются (None — общие
+    данные, например каталог). У функции должен быть аргумент session.
+    """
+
+    def decorate(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if not replica_router.enabled or _primary_only.get():
+                return await fn(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            session = bound.arguments.get("session")
+            if session is not None and session.info.get(_REPLICA_KEY):
+                return await fn(*args, **kwargs)  # вложенный вызов
+            user_id = bound.arguments.get(user_arg) if user_arg else None
+            if not replica_router.use_replica(user_id, session):
+                _count("primary")
+                return await fn(*args, **kwargs)
+
+            from database.base import ReplicaSessionLocal
+
+            try:
+                async with ReplicaSessionLocal() as replica_session:
+                    replica_session.info[_REPLICA_KEY] = True
+                    bound.arguments["session"] = replica_session
+                    result = await fn(*bound.args, **bound.kwargs)
+            except (DBAPIError, OSError, asyncio.TimeoutError) as e:
+                logger.warning(
+                    f"⚠️ {fn.__qualname__} на реплике: {e!r} — " f"повтор в основной БД"
+                )
+                _count("fallback")
+                token = _primary_only.set(True)
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    _primary_only.reset(token)
+            _count("replica")
+            return result
+
+        wrapper.read_only = True
+        return wrapper
+
+    return decorate
@@ -1,9 +1,12 @@
 # game/arena_battle_system.py
 import random
 import math
+from collections import Counter
 from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass, asdict
 
+from services.anime_index import anime_index
+
 
 @dataclass
 class BattleCard:
@@ -32,6 +35,25 @@ class BattleCard:
     def is_alive(self) -> bool:
         return self.health > 0
 
+    @classmethod
+    def from_dict(cls, data: dict) -> "BattleCard":
+        """Восстановление из to_dict (состояние боя хранится в Redis)"""
+        return cls(
+            id=data["id"],
+            user_card_id=data.get("user_card_id", -data["id"]),
+            name=data["name"],
+            rarity=data.get("rarity", "E"),
+            anime=data.get("anime", ""),
+            power=data["power"],
+            health=data["health"],
+            max_health=data["max_health"],
+            attack=data["attack"],
+            defense=data["defense"],
+            level=data.get("level", 1),
+            image_url=data.get("image_url", ""),
+            position=data.get("position", 0),
+        )
+
     def to_dict(self) -> dict:
         """Конвертация в словарь для API"""
         return {
@@ -81,17 +103,17 @@ class ArenaBattle:
 
     def _check_synergies(self, cards: List[BattleCard]) -> Dict[str, int]:
         """Проверяет синергии в колоде (карты из одного аниме)"""
-        anime_counts = {}
-        for card in cards:
-            if card.anime:
-                anime_counts[card.anime] = anime_counts.get(card.anime, 0) + 1
+        # Считаем по целым anime_id, а не по строкам
+        anime_counts = Counter(
+            anime_index.intern(card.anime) for card in cards if card.anime
+        )
 
         synergies = {}
-        for anime, count in anime_counts.items():
+        for anime_id, count in anime_counts.items():
             if count >= 3:
-                synergies[anime] = 15  # +15% к статам
+                synergies[anime_index.name(anime_id)] = 15  # +15% к статам
             elif count >= 2:
-                synergies[anime] = 10  # +10% к статам
+                synergies[anime_index.name(anime_id)] = 10  # +10% к статам
 
         return synergies
 
@@ -4,7 +4,8 @@ import random
 from datetime import datetime, timedelta
 import math
 from typing import List, Tuple, Optional
-from sqlalchemy import select, and_, func
+from sqlalchemy import select, and_, or_, func, update, any_, bindparam, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.models.user import User
@@ -12,6 +13,8 @@ from database.models.card import Card
 from database.models.user_card import UserCard
 from database.models.expedition import Expedition, ExpeditionType, ExpeditionStatus
 from database.base import AsyncSessionLocal
+from database.crud_summary import apply_cards_added
+from services.anime_index import anime_index
 import logging
 
 logger = logging.getLogger(__name__)
@@ -56,30 +59,49 @@ class ExpeditionManager:
 
         return cards
 
+    @staticmethod
+    async def snapshot_candidates(session: AsyncSession, user_id: int) -> List[dict]:
+        """
+        Снимок карт для выбора (кладётся в FSM на время выбора).
+        Нажатия и предпросмотр наград считаются по снимку без запросов к БД,
+        актуальность карт проверяет start_expedition.
+        """
+        cards = await ExpeditionManager.get_available_cards(session, user_id)
+        await anime_index.ensure_loaded(session)
+        return [
+            {
+                "id": user_card.id,
+                "name": card.card_name,
+                "rarity": card.rarity,
+                "level": user_card.level,
+                "anime": anime_index.anime_of(card.id),
+            }
+            for user_card, card in cards
+        ]
+
+    @staticmethod
+    def preview_rewards(
+        candidates: List[dict], selected: List[int], duration_minutes: int
+    ) -> dict:
+        """Награды для выбранных карт по снимку"""
+        anime = {c["anime"] for c in candidates if c["id"] in selected}
+        anime_bonus = len(selected) >= 2 and len(anime) == 1 and None not in anime
+        return ExpeditionManager.rewards_for(
+            duration_minutes, len(selected), anime_bonus
+        )
+
     @staticmethod
     async def get_active_expeditions(
         session: AsyncSession, user_id: int
     ) -> Tuple[List[Expedition], List[Expedition]]:
-        """Получить активные и завершенные экспедиции"""
+        """
+        Получить активные и завершенные экспедиции (только чтение).
+        Статус COMPLETED проставляет services/expedition_scheduler.py;
+        экспедиция, срок которой уже вышел, считается завершённой, даже
+        если планировщик до неё ещё не дошёл.
+        """
         logger.info(f"🔍 get_active_expeditions для user_id={user_id}")
-
-        # Проверяем завершенные
         now = datetime.now()
-        result = await session.execute(
-            Expedition.__table__.update()
-            .where(
-                and_(
-                    Expedition.user_id == user_id,
-                    Expedition.status == ExpeditionStatus.ACTIVE,
-                    Expedition.ends_at <= now,
-                )
-            )
-            .values(status=ExpeditionStatus.COMPLETED)
-            .returning(Expedition.id)
-        )
-        updated = result.rowcount
-        if updated > 0:
-            logger.info(f"✅ Завершено экспедиций: {updated}")
 
         # Получаем активные
         result = await session.execute(
@@ -88,6 +110,7 @@ class ExpeditionManager:
                 and_(
                     Expedition.user_id == user_id,
                     Expedition.status == ExpeditionStatus.ACTIVE,
+                    Expedition.ends_at > now,
                 )
             )
             .order_by(Expedition.ends_at)
@@ -100,8 +123,14 @@ class ExpeditionManager:
             select(Expedition).where(
                 and_(
                     Expedition.user_id == user_id,
-                    Expedition.status == ExpeditionStatus.COMPLETED,
                     Expedition.collected == False,
+                    or_(
+                        Expedition.status == ExpeditionStatus.COMPLETED,
+                        and_(
+                            Expedition.status == ExpeditionStatus.ACTIVE,
+                            Expedition.ends_at <= now,
+                        ),
+                    ),
                 )
             )
         )
@@ -127,33 +156,46 @@ class ExpeditionManager:
 
     @staticmethod
     async def calculate_rewards(
-        session: AsyncSession, card_ids: List[int], duration_minutes: int
+        session: AsyncSession,
+        card_ids: List[int],
+        duration_minutes: int,
+        catalog_card_ids: Optional[List[int]] = None,
     ) -> dict:
-        """Рассчитать награды за экспедицию"""
-        base_coins = duration_minutes // 5
-        base_dust = duration_minutes // 20
-
-        # Множитель за количество карт (1x, 2x, 3x)
-        card_multiplier = len(card_ids)
+        """Рассчитать награды за экспедицию
 
+        card_ids — id UserCard; catalog_card_ids — соответствующие Card.id,
+        если они уже известны (тогда в БД не ходим вовсе).
+        """
         # Проверяем бонус за одно аниме (только если карт >= 2)
         anime_bonus = False
         if len(card_ids) >= 2:
-            cards_result = await session.execute(
-                select(Card)
-                .join(UserCard, UserCard.card_id == Card.id)
-                .where(UserCard.id.in_(card_ids))
-            )
-            cards = cards_result.scalars().all()
-            anime_set = set(c.anime_name for c in cards)
-            anime_bonus = len(anime_set) == 1
+            if catalog_card_ids is None:
+                result = await session.execute(
+                    select(UserCard.card_id).where(UserCard.id.in_(card_ids))
+                )
+                catalog_card_ids = list(result.scalars().all())
+            await anime_index.ensure_loaded(session)
+            anime_bonus = anime_index.same_anime(catalog_card_ids)
+
+        return ExpeditionManager.rewards_for(
+            duration_minutes, len(card_ids), anime_bonus
+        )
+
+    @staticmethod
+    def rewards_for(duration_minutes: int, card_count: int, anime_bonus: bool) -> dict:
+        """Награды по длительности, числу карт и бонусу аниме (без БД)"""
+        base_coins = duration_minutes // 5
+        base_dust = duration_minutes // 20
+
+        # Множитель за количество карт (1x, 2x, 3x)
+        card_multiplier = card_count
 
         # Применяем бонус только если карт >= 2 и они из одного аниме
         if anime_bonus:
             card_multiplier = int(card_multiplier * 1.5)
 
         # Шанс на карту
-        card_chance = min((duration_minutes // 60) * len(card_ids) * 20, 100)
+        card_chance = min((duration_minutes // 60) * card_count * 20, 100)
 
         # Редкость карты
         if duration_minutes <= 30:
@@ -188,9 +230,6 @@ class ExpeditionManager:
         duration_map = {"short": 30, "medium": 120, "long": 360}  # 30,  # 120,  # 360
         duration = duration_map[duration_type]
 
-        # Расчет наград
-        rewards = await ExpeditionManager.calculate_rewards(session, card_ids, duration)
-
         # Создание экспедиции
         # Проверяем слоты
         user = await session.get(User, user_id)
@@ -210,6 +249,7 @@ class ExpeditionManager:
             .where(UserCard.id.in_(card_ids))
             .where(UserCard.user_id == user_id)
             .where(UserCard.is_in_expedition == False)
+            .where(UserCard.is_in_deck == False)
         )
 
         valid_cards = cards_check.scalars().all()
@@ -232,6 +272,11 @@ class ExpeditionManager:
                     logger.error(f"❌ Карта {card_id} не найдена")
             raise ValueError("Некоторые карты уже используются в экспедиции или колоде")
 
+        # Расчет наград (Card.id уже известны из проверки выше)
+        rewards = await ExpeditionManager.calculate_rewards(
+            session, card_ids, duration, [uc.card_id for uc in valid_cards]
+        )
+
         # Округляем время начала до текущего момента
         now = datetime.now()
         ends_at = now + timedelta(minutes=duration)
@@ -327,6 +372,7 @@ class ExpeditionManager:
                     user_id=user.id, card_id=card.id, level=1, source="expedition"
                 )
                 session.add(user_card)
+                await apply_cards_added(session, user.id, [(user_card, card.rarity)])
                 rewards["card"] = card
                 rewards["card_data"] = {
                     "id": card.id,
@@ -352,21 +398,104 @@ class ExpeditionManager:
 
     @staticmethod
     async def claim_all_expeditions(session: AsyncSession, user_id: int) -> dict:
-        """Забрать награды всех завершенных экспедиций"""
-        _, uncollected = await ExpeditionManager.get_active_expeditions(
-            session, user_id
+        """
+        Забрать награды всех завершенных экспедиций.
+        Число запросов не зависит от числа экспедиций: награды считаются в
+        памяти, затем одно начисление, одна вставка карт, одно освобождение
+        карт и одна отметка collected.
+        """
+        now = datetime.now()
+        expeditions = Expedition.__table__
+
+        # Незабранные экспедиции (строки блокируются от двойного получения)
+        result = await session.execute(
+            select(
+                expeditions.c.id,
+                expeditions.c.reward_coins,
+                expeditions.c.reward_dust,
+                expeditions.c.reward_card_rarity,
+                expeditions.c.reward_card_chance,
+                expeditions.c.card_ids,
+            )
+            .where(
+                expeditions.c.user_id == user_id,
+                expeditions.c.collected == False,
+                or_(
+                    expeditions.c.status == ExpeditionStatus.COMPLETED,
+                    and_(
+                        expeditions.c.status == ExpeditionStatus.ACTIVE,
+                        expeditions.c.ends_at <= now,
+                    ),
+                ),
+            )
+            .with_for_update()
         )
+        uncollected = result.all()
+        if not uncollected:
+            return {"coins": 0, "dust": 0, "cards": [], "count": 0}
+
+        # Награды в памяти
+        await anime_index.ensure_loaded(session)
+        total_coins = sum(row.reward_coins or 0 for row in uncollected)
+        total_dust = sum(row.reward_dust or 0 for row in uncollected)
+        won_ids = []
+        for row in uncollected:
+            if row.reward_card_rarity and random.randint(1, 100) <= (
+                row.reward_card_chance or 0
+            ):
+                card_id = anime_index.random_card(row.reward_card_rarity)
+                if card_id is not None:
+                    won_ids.append(card_id)
 
-        total_coins = 0
-        total_dust = 0
         cards_won = []
+        if won_ids:
+            result = await session.execute(
+                select(Card).where(Card.id.in_(set(won_ids)))
+            )
+            catalog = {card.id: card for card in result.scalars().all()}
+            cards_won = [catalog[card_id] for card_id in won_ids if card_id in catalog]
+
+            # Одна многострочная вставка (insertmanyvalues при flush)
+            new_cards = [
+                UserCard(user_id=user_id, card_id=card.id, level=1, source="expedition")
+                for card in cards_won
+            ]
+            session.add_all(new_cards)
+            await apply_cards_added(
+                session,
+                user_id,
+                [(uc, card.rarity) for uc, card in zip(new_cards, cards_won)],
+            )
 
-        for expedition in uncollected:
-            rewards = await ExpeditionManager.claim_expedition(session, expedition.id)
-            total_coins += rewards["coins"]
-            total_dust += rewards["dust"]
-            if rewards["card"]:
-                cards_won.append(rewards["card"])
+        # Одно начисление монет, пыли и счётчика карт
+        await session.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(
+                coins=User.coins + total_coins,
+                dust=User.dust + total_dust,
+                cards_opened=func.coalesce(User.cards_opened, 0) + len(cards_won),
+            )
+        )
+
+        # Освобождаем карты всех экспедиций одним UPDATE ... = ANY(...)
+        card_ids = [cid for row in uncollected for cid in (row.card_ids or [])]
+        if card_ids:
+            await session.execute(
+                update(UserCard)
+                .where(UserCard.id == any_(_int_array("card_ids", card_ids)))
+                .values(is_in_expedition=False, expedition_end_time=None)
+            )
+
+        # Отмечаем все экспедиции собранными
+        await session.execute(
+            update(Expedition)
+            .where(
+                Expedition.id
+                == any_(_int_array("expedition_ids", [row.id for row in uncollected]))
+            )
+            .values(status=ExpeditionStatus.COMPLETED, collected=True, completed_at=now)
+        )
 
         return {
             "coins": total_coins,
@@ -374,3 +503,8 @@ class ExpeditionManager:
             "cards": cards_won,
             "count": len(uncollected),
         }
+
+
+def _int_array(name: str, values: List[int]):
+    """Список id одним параметром-массивом (для = ANY(...))"""
+    return bindparam(name, values, type_=ARRAY(Integer))
@@ -0,0 +1,300 @@
+# game/pack_simulator.py
+"""
+Симулятор выпадений из пачек с pity (NumPy).
+
+Пачки каждого игрока зависят друг от друга через счётчики pity, поэтому
+векторизация идёт по игрокам: N независимых аккаунтов открывают пачки
+"в ногу", каждый слот карты — несколько операций над массивами длины N.
+Правила те же, что в roll_pack_rarities и _open_pack_transaction:
+* первая пачка аккаунта начинается со счётчиков 0, каждая следующая —
+  с сохранённых значений + 1;
+* pity_a (гарантия A) проверяется раньше pity_s (гарантия S);
+* A обнуляет pity_a, S/ASS/SSS обнуляют pity_s, любая другая карта
+  (включая A) увеличивает оба счётчика на 1.
+
+Отчёт: фактические доли редкостей против весов, как часто срабатывает
+pity, сколько пачек в среднем до первой карты каждой редкости и в
+установившемся режиме, сколько монет стоит одна S.
+
+cross_check() прогоняет те же случайные числа через живой
+roll_pack_rarities и требует точного совпадения редкостей.
+
+    python -m game.pack_simulator --players 200000 --packs 100
+    python -m game.pack_simulator --weight S=3.5 --pity-s 40
+"""
+
+import argparse
+import random
+import time
+from dataclasses import dataclass, field
+from itertools import accumulate
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from game.pack_system import PACK_SETTINGS, S_TIER, roll_pack_rarities
+
+
+@dataclass
+class SimulationResult:
+    settings: dict
+    players: int
+    packs: int  # пачек на игрока
+    rarity_counts: Dict[str, int]
+    pity_a_fired: int  # пачек, где сработала гарантия A
+    pity_s_fired: int
+    packs_with: Dict[str, int]  # пачек, где была хотя бы одна карта редкости
+    first_pack: Dict[str, Optional[float]]  # средний номер пачки до первой карты
+    seconds: float
+    rarities: Optional[np.ndarray] = field(default=None, repr=False)
+    uniforms: Optional[np.ndarray] = field(default=None, repr=False)
+    guaranteed: Optional[np.ndarray] = field(default=None, repr=False)
+
+    @property
+    def total_packs(self) -> int:
+        return self.players * self.packs
+
+    @property
+    def total_cards(self) -> int:
+        return sum(self.rarity_counts.values())
+
+
+def _tables(settings: dict):
+    names = list(settings["rarity_weights"].keys())
+    # Гарантии дают A и S, даже если их нет в весах
+    for extra in ("A", "S"):
+        if extra not in names:
+            names.append(extra)
+    weights = [settings["rarity_weights"].get(name, 0) for name in names]
+    cum_weights = np.array(list(accumulate(weights)), dtype=np.float64)
+    return names, cum_weights
+
+
+def simulate(
+    settings: dict,
+    players: int = 100_000,
+    packs: int = 100,
+    seed: Optional[int] = None,
+    keep_draws: bool = False,
+) -> SimulationResult:
+    """
+    players аккаунтов открывают по packs пачек с нуля.
+    keep_draws — сохранить случайные числа и результаты (для cross_check).
+    """
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    names, cum_weights = _tables(settings)
+    weighted = len(settings["rarity_weights"])
+    total = cum_weights[weighted - 1]
+    code_a, code_s = names.index("A"), names.index("S")
+    s_tier = np.array([name in S_TIER for name in names])
+    pity_a_max = settings.get("pity_a", 10)
+    pity_s_max = settings.get("pity_s", 50)
+    cards_count = settings["cards_count"]
+
+    pity_a = np.zeros(players, dtype=np.int64)
+    pity_s = np.zeros(players, dtype=np.int64)
+    counts = np.zeros(len(names), dtype=np.int64)
+    packs_with = np.zeros(len(names), dtype=np.int64)
+    first_pack = np.full((len(names), players), -1, dtype=np.int64)
+    fired_a = fired_s = 0
+
+    if keep_draws:
+        all_rarities = np.empty((packs, cards_count, players), dtype=np.int64)
+        all_uniforms = np.empty((packs, cards_count, players))
+        all_guaranteed = np.empty((packs, cards_count, players), dtype=bool)
+
+    for pack in range(packs):
+        if pack:  # следующая пачка начинается с сохранённых значений + 1
+            pity_a += 1
+            pity_s += 1
+        in_pack = np.zeros((len(names), players), dtype=bool)
+        pack_fired_a = np.zeros(players, dtype=bool)
+        pack_fired_s = np.zeros(players, dtype=bool)
+
+        for slot in range(cards_count):
+            uniforms = rng.random(players)
+            # random.choices: bisect_right(cum_weights, random() * total)
+            rolled = np.searchsorted(
+                cum_weights[:weighted], uniforms * total, side="right"
+            )
+            rolled = np.minimum(rolled, weighted - 1)
+
+            guaranteed_a = pity_a >= pity_a_max
+            guaranteed_s = ~guaranteed_a & (pity_s >= pity_s_max)
+            rarity = np.where(
+                guaranteed_a, code_a, np.where(guaranteed_s, code_s, rolled)
+            )
+            pack_fired_a |= guaranteed_a
+            pack_fired_s |= guaranteed_s
+
+            is_a = rarity == code_a
+            is_s_tier = s_tier[rarity]
+            pity_a = np.where(is_a | guaranteed_a, 0, pity_a)
+            pity_s = np.where(is_s_tier, 0, pity_s)
+            pity_a += ~is_s_tier
+            pity_s += ~is_s_tier
+
+            counts += np.bincount(rarity, minlength=len(names))
+            in_pack[rarity, np.arange(players)] = True
+            if keep_draws:
+                all_rarities[pack, slot] = rarity
+                all_uniforms[pack, slot] = uniforms
+                all_guaranteed[pack, slot] = guaranteed_a | guaranteed_s
+
+        fired_a += int(pack_fired_a.sum())
+        fired_s += int(pack_fired_s.sum())
+        packs_with += in_pack.sum(axis=1)
+        first_pack[(first_pack < 0) & in_pack] = pack + 1
+
+    first_means = {}
+    for code, name in enumerate(names):
+        seen = first_pack[code][first_pack[code] > 0]
+        first_means[name] = float(seen.mean()) if seen.size else None
+
+    result = SimulationResult(
+        settings=settings,
+        players=players,
+        packs=packs,
+        rarity_counts={name: int(counts[i]) for i, name in enumerate(names)},
+        pity_a_fired=fired_a,
+        pity_s_fired=fired_s,
+        packs_with={name: int(packs_with[i]) for i, name in enumerate(names)},
+        first_pack=first_means,
+        seconds=time.perf_counter() - started,
+    )
+    if keep_draws:
+        result.rarities = all_rarities
+        result.uniforms = all_uniforms
+        result.guaranteed = all_guaranteed
+    return result
+
+
+# ===== СВЕРКА С ЖИВЫМ КОДОМ =====
+
+
+class _ReplayRandom(random.Random):
+    """random() отдаёт заранее заданные числа по порядку"""
+
+    def __init__(self, values: List[float]):
+        super().__init__()
+        self._values = iter(values)
+
+    def random(self) -> float:
+        return next(self._values)
+
+
+def cross_check(
+    settings: dict, players: int = 200, packs: int = 200, seed: int = 0
+) -> int:
+    """
+    Прогнать те же случайные числа через roll_pack_rarities и сравнить
+    редкости карта в карту. Возвращает число проверенных карт, при
+    расхождении — AssertionError.
+    """
+    result = simulate(settings, players, packs, seed=seed, keep_draws=True)
+    names, _ = _tables(settings)
+    checked = 0
+
+    for player in range(players):
+        # Гарантированные слоты живой код не разыгрывает — их числа пропускаем
+        used = ~result.guaranteed[:, :, player]
+        replay = _ReplayRandom(result.uniforms[:, :, player][used].tolist())
+        pity_a = pity_s = 0
+        for pack in range(packs):
+            if pack:
+                pity_a += 1
+                pity_s += 1
+            rolled, pity_a, pity_s, _ = roll_pack_rarities(
+                settings, pity_a, pity_s, rng=replay
+            )
+            expected = [names[code] for code in result.rarities[pack, :, player]]
+            if rolled != expected:
+                raise AssertionError(
+                    f"Расхождение: игрок {player}, пачка {pack + 1}: "
+                    f"живой код {rolled}, симулятор {expected}"
+                )
+            checked += len(rolled)
+    return checked
+
+
+# ===== ОТЧЁТ =====
+
+
+def report(result: SimulationResult) -> str:
+    settings = result.settings
+    weights = settings["rarity_weights"]
+    total_weight = sum(weights.values())
+    lines = [
+        f"📦 {result.total_packs:,} пачек ({result.players:,} игроков × "
+        f"{result.packs}) за {result.seconds:.2f}с — "
+        f"{result.total_packs / result.seconds:,.0f} пачек/с",
+        "",
+        f"{'редкость':<9}{'вес':>8}{'факт':>9}{'пачек до 1-й':>14}"
+        f"{'пачек на 1':>12}",
+    ]
+    for name, count in result.rarity_counts.items():
+        nominal = weights.get(name, 0) / total_weight
+        actual = count / result.total_cards
+        first = result.first_pack[name]
+        with_it = result.packs_with[name]
+        lines.append(
+            f"{name:<9}{nominal:>8.2%}{actual:>9.2%}"
+            f"{(f'{first:.1f}' if first else '—'):>14}"
+            f"{(f'{result.total_packs / with_it:.1f}' if with_it else '—'):>12}"
+        )
+
+    s_cards = result.rarity_counts.get("S", 0)
+    s_tier_cards = sum(result.rarity_counts.get(name, 0) for name in S_TIER)
+    coins = result.total_packs * settings["price"]
+    lines += [
+        "",
+        f"🎯 pity A: {result.pity_a_fired / result.total_packs:.2%} пачек, "
+        f"pity S: {result.pity_s_fired / result.total_packs:.2%} пачек",
+        f"💰 монет за одну S: {coins / s_cards:,.0f}" if s_cards else "💰 S не выпало",
+        (f"💰 монет за S/ASS/SSS: {coins / s_tier_cards:,.0f}" if s_tier_cards else ""),
+    ]
+    return "\n".join(line for line in lines if line is not None)
+
+
+def _parse_weights(pairs: List[str]) -> Dict[str, float]:
+    weights = {}
+    for pair in pairs:
+        name, value = pair.split("=")
+        weights[name] = float(value)
+    return weights
+
+
+def main(args: argparse.Namespace):
+    settings = dict(PACK_SETTINGS[args.pack])
+    settings["rarity_weights"] = {
+        **settings["rarity_weights"],
+        **_parse_weights(args.weight or []),
+    }
+    if args.pity_a is not None:
+        settings["pity_a"] = args.pity_a
+    if args.pity_s is not None:
+        settings["pity_s"] = args.pity_s
+
+    if not args.no_check:
+        checked = cross_check(settings, seed=args.seed or 0)
+        print(f"✅ Сверка с roll_pack_rarities: {checked:,} карт совпали\n")
+
+    print(report(simulate(settings, args.players, args.packs, seed=args.seed)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Симулятор выпадений из пачек")
+    parser.add_argument("--pack", default="common", choices=list(PACK_SETTINGS))
+    parser.add_argument("--players", type=int, default=100_000)
+    parser.add_argument("--packs", type=int, default=100, help="пачек на игрока")
+    parser.add_argument(
+        "--weight", nargs="*", help="переопределить веса: S=3.5 SSS=0.3"
+    )
+    parser.add_argument("--pity-a", type=int)
+    parser.add_argument("--pity-s", type=int)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument(
+        "--no-check", action="store_true", help="без сверки с живым кодом"
+    )
+    main(parser.parse_args())
@@ -1,4 +1,7 @@
 # game/pack_system.py
+import random
+from typing import List, Optional, Tuple
+
 PACK_SETTINGS = {
     "common": {
         "price": 100,
@@ -16,3 +19,45 @@ PACK_SETTINGS = {
         "pity_s": 50,
     }
 }
+
+S_TIER = ("S", "ASS", "SSS")  # сбрасывают pity_s
+
+
+def roll_pack_rarities(
+    settings: dict, pity_a: int, pity_s: int, rng=random
+) -> Tuple[List[str], int, int, Optional[str]]:
+    """
+    Редкости карт одной пачки с учётом pity.
+    Возвращает (редкости, pity_a, pity_s, гарантированная редкость или None).
+    """
+    pity_a_max = settings.get("pity_a", 10)
+    pity_s_max = settings.get("pity_s", 50)
+    names = list(settings["rarity_weights"].keys())
+    weights = list(settings["rarity_weights"].values())
+
+    rarities = []
+    guaranteed_rarity = None
+    for _ in range(settings["cards_count"]):
+        # Pity
+        if pity_a >= pity_a_max:
+            rarity = "A"
+            guaranteed_rarity = "A"
+            pity_a = 0
+        elif pity_s >= pity_s_max:
+            rarity = "S"
+            guaranteed_rarity = "S"
+            pity_s = 0
+        else:
+            rarity = rng.choices(names, weights=weights)[0]
+        rarities.append(rarity)
+
+        # обновляем pity
+        if rarity == "A":
+            pity_a = 0
+        if rarity in S_TIER:
+            pity_s = 0
+        else:
+            pity_a += 1
+            pity_s += 1
+
+    return rarities, pity_a, pity_s, guaranteed_rarity
@@ -7,6 +7,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.models.card import Card
 from database.models.user import User
+from database.routing import read_only
+from services.anime_index import anime_index
 
 class QuizManager:
     """Менеджер викторины"""
@@ -43,6 +45,7 @@ class QuizManager:
             return False, int(minutes_left)
 
     @staticmethod
+    @read_only(user_arg=None)  # случайные карты каталога — с реплики
     async def generate_quiz(session: AsyncSession) -> List[Dict]:
         """Сгенерировать вопросы для викторины"""
 
@@ -65,52 +68,58 @@ class QuizManager:
             )
             cards = result.scalars().all()
 
+        # Варианты ответа берутся из индекса аниме в памяти
+        await anime_index.ensure_loaded(session)
+
+        return QuizManager.build_questions(
+            [QuizManager.card_to_question_source(card) for card in cards]
+        )
+
+    @staticmethod
+    def card_to_question_source(card: Card) -> Dict:
+        """Данные карты, нужные для вопроса"""
+        return {
+            "card_id": card.id,
+            "card_name": card.card_name,
+            "character_name": card.character_name,
+            "image_url": card.original_url,
+            "anime_name": card.anime_name,
+        }
+
+    @staticmethod
+    def build_questions(cards: List[Dict]) -> List[Dict]:
+        """Собрать вопросы из готовых данных (без обращений к БД)"""
         questions = []
         for card in cards:
             # Получаем 3 случайных аниме для вариантов ответа
-            wrong_answers = await QuizManager._get_random_anime_names(
-                session, 
-                exclude=card.anime_name,
+            wrong_answers = QuizManager.pick_wrong_answers(
+                exclude=card["anime_name"],
                 count=QuizManager.OPTIONS_COUNT - 1
             )
 
             # Формируем варианты ответа
-            options = [card.anime_name] + wrong_answers
+            options = [card["anime_name"]] + wrong_answers
             random.shuffle(options)  # Перемешиваем, чтобы правильный не был первым
 
             # Находим индекс правильного ответа
-            correct_index = options.index(card.anime_name)
+            correct_index = options.index(card["anime_name"])
 
             questions.append({
-                "card_id": card.id,
-                "card_name": card.card_name,
-                "character_name": card.character_name,
-                "image_url": card.original_url,
+                "card_id": card["card_id"],
+                "card_name": card["card_name"],
+                "character_name": card["character_name"],
+                "image_url": card["image_url"],
                 "options": options,
                 "correct_index": correct_index,
-                "anime_name": card.anime_name  # для проверки
+                "anime_name": card["anime_name"]  # для проверки
             })
 
         return questions
 
     @staticmethod
-    async def _get_random_anime_names(session: AsyncSession, exclude: str, count: int) -> List[str]:
-        """Получить случайные названия аниме"""
-        # Получаем уникальные названия аниме из базы
-        result = await session.execute(
-            select(Card.anime_name)
-            .where(Card.anime_name.isnot(None))
-            .where(Card.anime_name != exclude)
-            .distinct()
-        )
-        
-        all_names = [row[0] for row in result.all() if row[0]]
-
-        # Перемешиваем на Python стороне
-        random.shuffle(all_names)
-
-        # Берем нужное количество
-        names = all_names[:count]
+    def pick_wrong_answers(exclude: str, count: int) -> List[str]:
+        """Случайные названия аниме, кроме правильного"""
+        names = anime_index.random_distractors(exclude, count)
 
         # Если недостаточно уникальных, добираем заглушками
         while len(names) < count:
@@ -1,4 +1,19 @@
 # game/upgrade_calculator.py
+"""
+Характеристики и стоимость прокачки карт.
+
+Степени множителей роста и стоимости уровней для 1..MAX_CARD_LEVEL
+считаются один раз при импорте из game.constants. calculate_stats_for_level
+и get_upgrade_cost берут готовые значения из таблиц (порядок операций тот
+же, что и в прямой формуле, поэтому результаты совпадают до единицы), а
+upgrade_cost_between отвечает на "сколько стоит с уровня a до b" разностью
+префиксных сумм, а max_affordable_level — бинарным поиском по ним.
+"""
+
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Dict, List, Tuple
+
 from database.models.card import Card
 from game.constants import (
     POWER_GROWTH,
@@ -10,11 +25,93 @@ from game.constants import (
     TEN_LEVEL_BONUS,
     DUST_PER_RARITY,
     UPGRADE_COST_PER_LEVEL,
+    MAX_CARD_LEVEL,
 )
 
+DEFAULT_RARITY_COST = 15  # стоимость для редкости не из DUST_PER_RARITY
+
+# ===== ТАБЛИЦЫ =====
+# Индекс — уровень; элемент [0] не используется (уровни начинаются с 1)
+
+_LEVELS = range(MAX_CARD_LEVEL + 1)
+
+
+def _powers(base: float) -> List[float]:
+    return [base ** (level - 1) for level in _LEVELS]
+
+
+_GROWTH = {
+    "power": _powers(POWER_GROWTH),
+    "health": _powers(HEALTH_GROWTH),
+    "attack": _powers(ATTACK_GROWTH),
+    "defense": _powers(DEFENSE_GROWTH),
+}
+_RARITY_GROWTH: Dict[str, List[float]] = {
+    rarity: _powers(growth) for rarity, growth in RARITY_GROWTH_BONUS.items()
+}
+_TEN_LEVEL = [TEN_LEVEL_BONUS ** max((level - 1) // 10, 0) for level in _LEVELS]
+
+
+def _level_cost(rarity_cost: int, current_level: int) -> int:
+    cost = rarity_cost * (current_level + 1) * UPGRADE_COST_PER_LEVEL
+
+    # Первые 10 уровней дешевле (приятный UX)
+    if current_level < 10:
+        cost = int(cost * 0.5)
+
+    return cost
+
+
+# _COST[rarity][l] — цена улучшения с уровня l на l + 1
+# _COST_PREFIX[rarity][l] — суммарная цена улучшений с 0 до уровня l
+_COST: Dict[str, List[int]] = {
+    rarity: [_level_cost(rarity_cost, level) for level in _LEVELS]
+    for rarity, rarity_cost in DUST_PER_RARITY.items()
+}
+_COST_PREFIX: Dict[str, List[int]] = {
+    rarity: list(accumulate(costs, initial=0)) for rarity, costs in _COST.items()
+}
+
+
+def stat_tables() -> Tuple[Dict[str, List[float]], Dict[str, List[float]], List[float]]:
+    """Множители по уровням (рост статов, рост по редкости, бонус за 10 уровней)"""
+    return _GROWTH, _RARITY_GROWTH, _TEN_LEVEL
+
+
+# ===== ХАРАКТЕРИСТИКИ =====
+
 
 def calculate_stats_for_level(card: Card, level: int) -> dict:
     """Рассчитать характеристики карты для указанного уровня"""
+    if not 1 <= level <= MAX_CARD_LEVEL:
+        return _calculate_stats_direct(card, level)
+
+    # Базовые характеристики
+    bases = {
+        "power": card.base_power or 100,
+        "health": card.base_health or 100,
+        "attack": card.base_attack or 10,
+        "defense": card.base_defense or 10,
+    }
+
+    rarity_growth = _RARITY_GROWTH.get(card.rarity)
+    rarity_growth = rarity_growth[level] if rarity_growth else 1.0
+    ten_level = _TEN_LEVEL[level]
+    rarity_mult = RARITY_BONUS.get(card.rarity, 1.0)
+
+    stats = {}
+    for stat, base in bases.items():
+        # Тот же порядок операций, что и в прямой формуле
+        value = int(base * _GROWTH[stat][level])
+        value *= rarity_growth
+        if level > 10:
+            value *= ten_level
+        stats[stat] = int(value * rarity_mult)
+    return stats
+
+
+def _calculate_stats_direct(card: Card, level: int) -> dict:
+    """Прямая формула (для уровней вне таблиц)"""
 
     # Базовые характеристики
     base_power = card.base_power or 100
@@ -59,13 +156,52 @@ def calculate_stats_for_level(card: Card, level: int) -> dict:
     }
 
 
+# ===== СТОИМОСТЬ =====
+
+
 def get_upgrade_cost(card: Card, current_level: int) -> int:
     """Получить стоимость улучшения карты"""
-    rarity_cost = DUST_PER_RARITY.get(card.rarity, 15)
-    cost = rarity_cost * (current_level + 1) * UPGRADE_COST_PER_LEVEL
+    costs = _COST.get(card.rarity)
+    if costs and 0 <= current_level <= MAX_CARD_LEVEL:
+        return costs[current_level]
+    return _level_cost(
+        DUST_PER_RARITY.get(card.rarity, DEFAULT_RARITY_COST), current_level
+    )
 
-    # Первые 10 уровней дешевле (приятный UX)
-    if current_level < 10:
-        cost = int(cost * 0.5)
 
-    return cost
+def upgrade_cost_between(card: Card, from_level: int, to_level: int) -> int:
+    """Стоимость улучшения с from_level до to_level (O(1) по префиксным суммам)"""
+    if to_level <= from_level:
+        return 0
+    prefix = _COST_PREFIX.get(card.rarity)
+    if prefix and 0 <= from_level and to_level <= MAX_CARD_LEVEL + 1:
+        return prefix[to_level] - prefix[from_level]
+    return sum(get_upgrade_cost(card, level) for level in range(from_level, to_level))
+
+
+def max_affordable_level(
+    card: Card, current_level: int, dust: int, max_level: int = MAX_CARD_LEVEL
+) -> int:
+    """Максимальный уровень, до которого хватит dust пыли (не выше max_level)"""
+    if current_level >= max_level:
+        return current_level
+    prefix = _COST_PREFIX.get(card.rarity)
+    if prefix and 0 <= current_level and max_level <= MAX_CARD_LEVEL + 1:
+        budget = prefix[current_level] + dust
+        reachable = bisect_right(prefix, budget, lo=current_level, hi=max_level + 1) - 1
+        return max(current_level, reachable)
+
+    level = current_level
+    while level < max_level:
+        cost = get_upgrade_cost(card, level)
+        if cost > dust:
+            break
+        dust -= cost
+        level += 1
+    return level
+
+
+def next_bonus_level(current_level: int) -> int:
+    """Уровень, на котором начнёт действовать следующий бонус за 10 уровней"""
+    # Бонус считается по (level - 1) // 10: первый — на 11 уровне, далее 21, 31...
+    return min(((current_level - 1) // 10 + 1) * 10 + 1, MAX_CARD_LEVEL)
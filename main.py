@@ -1,11 +1,13 @@
 # main.py
+from services.startup import startup  # первым: засекает время импорта
+
 import os
 import logging
 from datetime import datetime
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from dotenv import load_dotenv
 
 from aiogram import Bot, Dispatcher
@@ -13,20 +15,36 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import Update
 from aiogram.client.default import DefaultBotProperties
 
-from database.base import engine, AsyncSessionLocal
+from database.base import engine, replica_engine, AsyncSessionLocal
 from bot.handlers.expedition import router as expedition_router
 from bot.main_handlers import router as main_router
 from bot.handlers.arena import router as arena_router
 from bot.handlers.quiz import router as quiz_router
+from bot.middlewares import DbSessionMiddleware, UserMiddleware
 
 from bot.keyboards import set_bot_commands
 from sqlalchemy import text
 
-from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse
 from pathlib import Path
 
 from services.redis_client import battle_storage
+from services.telegram_sender import outbound
+from services.quiz_images import quiz_images
+from services.quiz_pool import quiz_pool
+from services.activity_tracker import activity
+from services.summary_reconciler import summary_reconciler
+from services.expedition_scheduler import expedition_scheduler
+from prometheus_client import CONTENT_TYPE_LATEST
+from services.metrics import (
+    HandlerMetricsMiddleware,
+    TelegramMetricsMiddleware,
+    instrument_engine,
+    render as render_metrics,
+    track_webhook,
+)
+from services.query_stats import QueryStatsMiddleware, report, track_queries
+from services.static_cache import SHELL_CACHE_CONTROL, shell_files, static_files
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from database.models import User
@@ -66,8 +84,21 @@ WEBHOOK_URL = os.getenv("WEBHOOK_URL")
 
 # ===== TELEGRAM БОТ =====
 bot = Bot(token=TELEGRAM_BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
+bot.session.middleware(outbound)  # лимиты Telegram, приоритеты, retry_after
+bot.session.middleware(TelegramMetricsMiddleware())  # внутри outbound: сам запрос
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
+dp.message.middleware(QueryStatsMiddleware())  # первым: считает и запросы middleware
+dp.callback_query.middleware(QueryStatsMiddleware())
+dp.message.middleware(DbSessionMiddleware())  # одна сессия БД на апдейт
+dp.callback_query.middleware(DbSessionMiddleware())
+dp.message.middleware(UserMiddleware())  # db_user один раз на апдейт
+dp.callback_query.middleware(UserMiddleware())
+dp.message.middleware(HandlerMetricsMiddleware())  # время хендлеров для /metrics
+dp.callback_query.middleware(HandlerMetricsMiddleware())
+instrument_engine(engine)
+if replica_engine is not None:
+    instrument_engine(replica_engine, "replica")
 dp.include_router(expedition_router)
 dp.include_router(main_router)
 dp.include_router(arena_router)
@@ -77,17 +108,39 @@ dp.include_router(quiz_router)
 # ===== FASTAPI LIFESPAN =====
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
-    logger.info("🚀 Запуск Kami Deck...")
-    await set_bot_commands(bot)
+    # Startup: только то, без чего нельзя принимать запросы
+    await startup.step("outbound", outbound.start())
+    await startup.step("quiz_pool", quiz_pool.start())
+    await startup.step("activity", activity.start())
+    await startup.step("summary_reconciler", summary_reconciler.start())
+    await startup.step("expedition_scheduler", expedition_scheduler.start(bot))
 
     if os.getenv("REDIS_URL"):  # только если Redis настроен
-        await battle_storage.connect()
+        await startup.step("redis", battle_storage.connect())
+
+    # Некритичное — в фоне, когда приложение уже принимает запросы.
+    # До прогрева статика читается с диска по первому запросу.
+    startup.background("bot_commands", set_bot_commands(bot))
+    startup.background(
+        "arena_shell",
+        shell_files.warm([("arena.html", _arena_path() or "arena.html")]),
+    )
+    startup.background("static_files", static_files.warm())
+    startup.mark_ready()
 
     yield
     # Shutdown
+    await startup.stop()
+    await expedition_scheduler.stop()
+    await quiz_pool.stop()
+    await activity.stop()
+    await summary_reconciler.stop()
+    await outbound.stop()
+    await quiz_images.close()
     await bot.session.close()
     await engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
     logger.info("🛑 Бот остановлен")
 
 
@@ -99,28 +152,52 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
-# Монтируем статические файлы
-app.mount("/static", StaticFiles(directory="static"), name="static")
+@app.middleware("http")
+async def count_api_queries(request: Request, call_next):
+    """Учёт SQL-запросов для API эндпоинтов (вебхук считается по хендлерам)"""
+    if not request.url.path.startswith("/api/"):
+        return await call_next(request)
+    with track_queries("api") as stats:
+        try:
+            return await call_next(request)
+        finally:
+            # Метка — имя функции эндпоинта (путь содержит battle_id)
+            endpoint = request.scope.get("endpoint")
+            stats.label = getattr(endpoint, "__name__", stats.label)
+            report(stats)
+
+
+# Статические файлы — из памяти, со сжатием и ETag
+@app.get("/static/{path:path}")
+async def get_static(path: str, request: Request):
+    response = static_files.response(request, path)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return response
 
 # ===== ЭНДПОИНТЫ =====
 
 
+def _arena_path() -> Optional[str]:
+    """arena.html в корне, иначе в static"""
+    for path in ("arena.html", "static/arena.html"):
+        if Path(path).exists():
+            return path
+    return None
+
+
 # Упрощенный эндпоинт для арены (файл теперь в корне)
 @app.get("/arena.html", response_class=HTMLResponse)
-async def get_arena():
-    """Основной эндпоинт для WebApp"""
+async def get_arena(request: Request):
+    """Основной эндпоинт для WebApp (из памяти, 304 по ETag)"""
     try:
-        # Проверяем наличие файла в корне
-        arena_path = Path("arena.html")
-        if arena_path.exists():
-            content = arena_path.read_text(encoding="utf-8")
-            return HTMLResponse(content=content)
-
-        # Если нет в корне, проверяем в static
-        static_path = Path("static/arena.html")
-        if static_path.exists():
-            content = static_path.read_text(encoding="utf-8")
-            return HTMLResponse(content=content)
+        response = shell_files.response(request, "arena.html", SHELL_CACHE_CONTROL)
+        if response is None and _arena_path():
+            # Файла не было при старте — появился позже
+            shell_files.add("arena.html", _arena_path())
+            response = shell_files.response(request, "arena.html", SHELL_CACHE_CONTROL)
+        if response is not None:
+            return response
 
         # Файл не найден
         return HTMLResponse(
@@ -181,9 +258,10 @@ async def telegram_webhook(request: Request):
         raise HTTPException(status_code=403, detail="Forbidden")
 
     try:
-        update_data = await request.json()
-        update = Update(**update_data)
-        await dp.feed_update(bot=bot, update=update)
+        with track_webhook():
+            update_data = await request.json()
+            update = Update(**update_data)
+            await dp.feed_update(bot=bot, update=update)
         return {"status": "ok"}
     except Exception as e:
         logger.error(f"Ошибка обработки вебхука: {e}")
@@ -202,6 +280,17 @@ async def get_webhook_info():
     }
 
 
+@app.get("/metrics")
+async def metrics(request: Request):
+    """Метрики Prometheus (METRICS_TOKEN — закрыть Bearer-токеном)"""
+    token = os.getenv("METRICS_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return Response(
+        content=render_metrics(), headers={"Content-Type": CONTENT_TYPE_LATEST}
+    )
+
+
 @app.get("/health")
 async def health_check():
     try:
@@ -265,39 +354,11 @@ async def battle_turn(request: TurnRequest):
         enemy_cards_dict = {}
 
         for card_data in battle_data.get("player_cards", []):
-            card = BattleCard(
-                id=card_data["id"],
-                user_card_id=card_data["user_card_id"],
-                name=card_data["name"],
-                rarity=card_data.get("rarity", "E"),
-                anime=card_data.get("anime", ""),
-                power=card_data["power"],
-                health=card_data["health"],
-                max_health=card_data["max_health"],
-                attack=card_data["attack"],
-                defense=card_data["defense"],
-                level=card_data.get("level", 1),
-                image_url=card_data.get("image_url", ""),
-                position=card_data.get("position", 0),
-            )
+            card = BattleCard.from_dict(card_data)
             player_cards_dict[card.id] = card
 
         for card_data in battle_data.get("enemy_cards", []):
-            card = BattleCard(
-                id=card_data["id"],
-                user_card_id=card_data.get("user_card_id", -card_data["id"]),
-                name=card_data["name"],
-                rarity=card_data.get("rarity", "E"),
-                anime=card_data.get("anime", ""),
-                power=card_data["power"],
-                health=card_data["health"],
-                max_health=card_data["max_health"],
-                attack=card_data["attack"],
-                defense=card_data["defense"],
-                level=card_data.get("level", 1),
-                image_url=card_data.get("image_url", ""),
-                position=card_data.get("position", 0),
-            )
+            card = BattleCard.from_dict(card_data)
             enemy_cards_dict[card.id] = card
 
         # Создаем объект битвы
@@ -816,3 +877,6 @@ async def global_exception_handler(request: Request, exc: Exception):
     return JSONResponse(
         status_code=500, content={"status": "error", "detail": "Internal server error"}
     )
+
+
+startup.imported()
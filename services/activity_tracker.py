@@ -0,0 +1,92 @@
+# services/activity_tracker.py
+"""
+Отметки активности пользователей (users.last_active).
+
+Раньше last_active обновлялся в get_user_or_create на каждый апдейт, и любой
+просмотр профиля или коллекции превращался в запись в users. Теперь
+middleware только запоминает время в памяти, а фоновая задача раз в
+FLUSH_INTERVAL секунд пишет всё одним UPDATE ... FROM (VALUES ...).
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import DateTime, Integer, column, update, values
+
+from database.base import AsyncSessionLocal
+from database.models.user import User
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 30  # секунд между записями в БД
+BATCH_SIZE = 1000  # строк в одном UPDATE
+
+
+class ActivityTracker:
+    """Накопление last_active в памяти с периодическим сбросом в БД"""
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._pending: Dict[int, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self, user_id: int, when: datetime = None):
+        """Пользователь был активен (последнее значение побеждает)"""
+        self._pending[user_id] = when or datetime.now()
+
+    # ===== ЖИЗНЕННЫЙ ЦИКЛ =====
+
+    async def start(self):
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run(), name="activity-tracker")
+        logger.info("✅ Activity tracker started")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    # ===== ЗАПИСЬ =====
+
+    async def flush(self) -> int:
+        """Записать накопленные отметки, вернуть количество пользователей"""
+        if not self._pending:
+            return 0
+
+        pending, self._pending = self._pending, {}
+        rows = list(pending.items())
+        try:
+            async with AsyncSessionLocal() as session:
+                for start in range(0, len(rows), BATCH_SIZE):
+                    await session.execute(_bulk_update(rows[start : start + BATCH_SIZE]))
+                await session.commit()
+        except Exception as e:
+            logger.error(f"❌ Не удалось записать last_active ({len(rows)} польз.): {e}")
+            # Возвращаем отметки, не затирая более свежие
+            for user_id, ts in pending.items():
+                self._pending.setdefault(user_id, ts)
+            return 0
+
+        return len(rows)
+
+
+def _bulk_update(rows):
+    """UPDATE users SET last_active = v.ts FROM (VALUES ...) AS v(id, ts) WHERE users.id = v.id"""
+    v = values(column("id", Integer), column("ts", DateTime), name="v").data(rows)
+    users = User.__table__
+    return update(users).values(last_active=v.c.ts).where(users.c.id == v.c.id)
+
+
+activity = ActivityTracker()
@@ -0,0 +1,147 @@
+# services/anime_index.py
+"""
+Справочник аниме в памяти.
+
+Названия аниме хранятся в Card.anime_name свободным текстом. Индекс один раз
+читает каталог (card_id, anime_name), присваивает каждому названию целый
+anime_id и держит карты card_id → anime_id и anime_id → [card_id].
+Дальше дистракторы викторины, синергии и бонусы экспедиций сравнивают
+целые числа и не ходят в БД. Заодно хранятся card_id по редкостям, чтобы
+выбирать случайную карту награды без ORDER BY random().
+"""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.routing import read_only
+
+logger = logging.getLogger(__name__)
+
+NO_ANIME = 0  # anime_id для карт без аниме
+INDEX_TTL = 3600  # секунд до перечитывания каталога
+
+
+class AnimeIndex:
+    """anime_id ↔ название и карты по аниме"""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._names: List[Optional[str]] = [None]  # индекс = anime_id
+        self._card_anime: Dict[int, int] = {}
+        self._cards_by_anime: Dict[int, List[int]] = {}
+        self._anime_with_cards: List[int] = []
+        self._cards_by_rarity: Dict[str, List[int]] = {}
+        self._loaded_at = 0.0
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    # ===== ЗАГРУЗКА =====
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._card_anime)
+
+    async def ensure_loaded(self, session: AsyncSession = None):
+        """Построить индекс, если его нет или он устарел"""
+        if not self._needs_reload():
+            return
+        async with self._lock:
+            if not self._needs_reload():
+                return
+            if session is not None:
+                await self._load(session)
+            else:
+                from database.base import AsyncSessionLocal
+
+                async with AsyncSessionLocal() as session:
+                    await self._load(session)
+
+    def _needs_reload(self) -> bool:
+        return self._stale or time.monotonic() - self._loaded_at > INDEX_TTL
+
+    @read_only(user_arg=None)  # каталог общий — с реплики
+    async def _load(self, session: AsyncSession):
+        # Модели импортируются здесь: game/ использует intern() без движка БД
+        from database.models.card import Card
+
+        result = await session.execute(select(Card.id, Card.anime_name, Card.rarity))
+
+        card_anime: Dict[int, int] = {}
+        cards_by_anime: Dict[int, List[int]] = {}
+        cards_by_rarity: Dict[str, List[int]] = {}
+        for card_id, anime_name, rarity in result.all():
+            anime_id = self.intern(anime_name)
+            card_anime[card_id] = anime_id
+            cards_by_anime.setdefault(anime_id, []).append(card_id)
+            cards_by_rarity.setdefault(rarity, []).append(card_id)
+
+        self._card_anime = card_anime
+        self._cards_by_anime = cards_by_anime
+        self._cards_by_rarity = cards_by_rarity
+        self._anime_with_cards = [a for a in cards_by_anime if a != NO_ANIME]
+        self._loaded_at = time.monotonic()
+        self._stale = False
+        logger.info(
+            f"🎌 Индекс аниме: {len(card_anime)} карт, {len(self._names) - 1} аниме"
+        )
+
+    def invalidate(self):
+        """Перечитать каталог при следующем ensure_loaded (например, добавлены карты)"""
+        self._stale = True
+
+    # ===== СЛОВАРЬ =====
+
+    def intern(self, anime_name: Optional[str]) -> int:
+        """anime_id по названию (новое название получает новый id)"""
+        if not anime_name:
+            return NO_ANIME
+        anime_id = self._ids.get(anime_name)
+        if anime_id is None:
+            anime_id = self._ids[anime_name] = len(self._names)
+            self._names.append(anime_name)
+        return anime_id
+
+    def name(self, anime_id: int) -> Optional[str]:
+        return self._names[anime_id] if 0 <= anime_id < len(self._names) else None
+
+    def anime_of(self, card_id: int) -> Optional[int]:
+        """anime_id карты каталога (None — карты нет в индексе)"""
+        anime_id = self._card_anime.get(card_id)
+        if anime_id is None and self.loaded:
+            self._stale = True  # карта добавлена после построения индекса
+        return anime_id
+
+    def cards_of(self, anime_id: int) -> List[int]:
+        return self._cards_by_anime.get(anime_id, [])
+
+    def anime_ids(self) -> List[int]:
+        """Все аниме, у которых есть карты"""
+        return self._anime_with_cards
+
+    def random_card(self, rarity: str) -> Optional[int]:
+        """Случайная карта каталога данной редкости (None — таких нет)"""
+        pool = self._cards_by_rarity.get(rarity)
+        return random.choice(pool) if pool else None
+
+    # ===== ОПЕРАЦИИ =====
+
+    def same_anime(self, card_ids: Iterable[int]) -> bool:
+        """Все карты из одного аниме (как прежнее len(set(anime_name)) == 1)"""
+        anime = {self.anime_of(card_id) for card_id in card_ids}
+        return len(anime) == 1 and None not in anime
+
+    def random_distractors(self, exclude: Optional[str], count: int) -> List[str]:
+        """Случайные названия аниме, кроме exclude"""
+        exclude_id = self._ids.get(exclude, NO_ANIME) if exclude else NO_ANIME
+        pool = self._anime_with_cards
+        sample = random.sample(pool, min(len(pool), count + 1))
+        return [self._names[a] for a in sample if a != exclude_id][:count]
+
+
+anime_index = AnimeIndex()
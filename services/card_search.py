@@ -0,0 +1,268 @@
+# services/card_search.py
+"""
+Поиск карт по названию, персонажу и аниме.
+
+ILIKE '%...%' не использует индекс и просматривает весь каталог. Здесь
+каталог (id, card_name, character_name, anime_name) один раз читается в
+память и раскладывается в триграммный индекс: триграмма → список полей
+карт, где она встречается. Запрос разбивается на триграммы так же, как в
+pg_trgm, и карты ранжируются по доле найденных триграмм запроса (как
+word_similarity), при равенстве — по сходству всего поля. Опечатки и
+неполные слова находятся, а запрос стоит единицы миллисекунд на
+десятках тысяч карт. Запросы короче SHORT_QUERY символов дают слишком
+частые триграммы, поэтому ищутся по началу слова в отсортированном
+словаре (bisect).
+
+Поиск общий для просмотра коллекции и будущего inline-поиска:
+    hits = await card_search.search("наруто", limit=20)
+    ids = await card_search.matching_ids("naruto", within=user_card_ids)
+"""
+
+import asyncio
+import heapq
+import logging
+import math
+import re
+import time
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.routing import read_only
+
+logger = logging.getLogger(__name__)
+
+INDEX_TTL = 3600  # секунд до перечитывания каталога
+MIN_COVERAGE = 0.5  # доля триграмм запроса, которую должно содержать поле
+MAX_RESULTS = 500  # верхняя граница выдачи matching_ids
+MIN_QUERY = 2  # более короткие запросы ничего не находят
+SHORT_QUERY = 4  # запросы короче ищутся по началу слова, а не по триграммам
+
+# Поля карты и их вес в ранжировании
+FIELDS = ("card_name", "character_name", "anime_name")
+FIELD_WEIGHTS = (1.0, 1.0, 0.8)
+
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize(text: Optional[str]) -> str:
+    """Нижний регистр, ё → е, всё кроме букв и цифр → пробел"""
+    if not text:
+        return ""
+    return _NON_WORD.sub(" ", text.lower().replace("ё", "е")).strip()
+
+
+def _pad(text: str) -> str:
+    """Строка, в которой встречаются ровно триграммы слов текста"""
+    return "".join(f"  {word} " for word in text.split())
+
+
+def trigrams(text: str) -> FrozenSet[str]:
+    """Триграммы как в pg_trgm: каждое слово дополняется "  " слева и " " справа"""
+    result = set()
+    for word in text.split():
+        padded = _pad(word)
+        result.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return frozenset(result)
+
+
+@dataclass(frozen=True)
+class SearchHit:
+    card_id: int
+    score: float  # 0..1, доля найденных триграмм запроса с весом поля
+    field: str  # поле, по которому найдено
+
+
+class CardSearchIndex:
+    """Триграммный индекс каталога карт в памяти"""
+
+    def __init__(self):
+        # Документ — одно поле одной карты: doc = card_pos * len(FIELDS) + field
+        self._card_ids: List[int] = []
+        self._texts: List[str] = []
+        self._padded: List[str] = []  # слова с отступами — проверка триграмм через in
+        self._sizes: List[int] = []
+        self._words: List[Tuple[str, int]] = []  # (слово, doc) по алфавиту
+        self._postings: Dict[str, List[int]] = {}
+        self._loaded_at = 0.0
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    # ===== ЗАГРУЗКА =====
+
+    async def ensure_loaded(self, session: AsyncSession = None):
+        """Построить индекс, если его нет или он устарел"""
+        if not self._needs_reload():
+            return
+        async with self._lock:
+            if not self._needs_reload():
+                return
+            if session is not None:
+                await self._load(session)
+            else:
+                from database.base import AsyncSessionLocal
+
+                async with AsyncSessionLocal() as session:
+                    await self._load(session)
+
+    def _needs_reload(self) -> bool:
+        return self._stale or time.monotonic() - self._loaded_at > INDEX_TTL
+
+    @read_only(user_arg=None)  # каталог общий — с реплики
+    async def _load(self, session: AsyncSession):
+        from database.models.card import Card
+
+        started = time.perf_counter()
+        result = await session.execute(
+            select(Card.id, Card.card_name, Card.character_name, Card.anime_name)
+        )
+        rows = result.all()
+        # Построение занимает заметное время — не держим цикл событий
+        await asyncio.to_thread(self.build, rows)
+        logger.info(
+            f"🔎 Индекс поиска: {len(self._card_ids)} карт, "
+            f"{len(self._postings)} триграмм за {time.perf_counter() - started:.2f}с"
+        )
+
+    def build(
+        self, rows: Iterable[Tuple[int, Optional[str], Optional[str], Optional[str]]]
+    ):
+        """Построить индекс из строк (id, card_name, character_name, anime_name)"""
+        card_ids: List[int] = []
+        texts: List[str] = []
+        padded: List[str] = []
+        sizes: List[int] = []
+        words: List[Tuple[str, int]] = []
+        postings: Dict[str, List[int]] = {}
+
+        for card_id, *fields in rows:
+            card_ids.append(card_id)
+            for value in fields:
+                doc = len(texts)
+                text = normalize(value)
+                grams = trigrams(text)
+                texts.append(text)
+                padded.append(_pad(text))
+                words.extend((word, doc) for word in text.split())
+                sizes.append(len(grams))
+                for gram in grams:
+                    postings.setdefault(gram, []).append(doc)
+
+        self._card_ids = card_ids
+        self._texts = texts
+        self._padded = padded
+        self._words = sorted(words)
+        self._sizes = sizes
+        self._postings = postings
+        self._loaded_at = time.monotonic()
+        self._stale = False
+
+    def invalidate(self):
+        """Перечитать каталог при следующем ensure_loaded"""
+        self._stale = True
+
+    # ===== ПОИСК =====
+
+    async def search(
+        self,
+        query: str,
+        limit: int = 20,
+        within: Optional[Iterable[int]] = None,
+        session: AsyncSession = None,
+    ) -> List[SearchHit]:
+        """Лучшие карты по запросу (within — ограничить набором card_id)"""
+        await self.ensure_loaded(session)
+        return self.rank(query, limit, within)
+
+    async def matching_ids(
+        self,
+        query: str,
+        within: Optional[Iterable[int]] = None,
+        session: AsyncSession = None,
+    ) -> List[int]:
+        """card_id подходящих карт по убыванию релевантности"""
+        hits = await self.search(query, MAX_RESULTS, within, session)
+        return [hit.card_id for hit in hits]
+
+    def rank(
+        self, query: str, limit: int = 20, within: Optional[Iterable[int]] = None
+    ) -> List[SearchHit]:
+        """Синхронная часть поиска (индекс уже построен)"""
+        text = normalize(query)
+        if len(text) < MIN_QUERY:
+            return []
+        allowed = set(within) if within is not None else None
+        if len(text) < SHORT_QUERY and " " not in text:
+            return self._rank_prefix(text, limit, allowed)
+
+        query_grams = trigrams(text)
+
+        # Поле должно содержать не меньше need триграмм запроса, значит оно
+        # есть хотя бы в одном из (len - need + 1) самых редких списков.
+        grams = sorted(query_grams, key=lambda g: len(self._postings.get(g, ())))
+        need = max(1, math.ceil(len(grams) * MIN_COVERAGE))
+        candidates = set()
+        for gram in grams[: len(grams) - need + 1]:
+            candidates.update(self._postings.get(gram, ()))
+
+        width = len(FIELDS)
+
+        best: Dict[int, Tuple[float, float, int]] = {}
+        for doc in candidates:
+            card_id = self._card_ids[doc // width]
+            if allowed is not None and card_id not in allowed:
+                continue
+
+            padded = self._padded[doc]
+            shared = sum(1 for gram in grams if gram in padded)
+            if shared < need:
+                continue
+
+            field = doc % width
+            coverage = shared / len(grams)
+            if text in self._texts[doc]:
+                coverage = 1.0  # запрос целиком входит в поле
+            score = coverage * FIELD_WEIGHTS[field]
+            similarity = shared / (len(grams) + self._sizes[doc] - shared)
+
+            current = best.get(card_id)
+            if current is None or (score, similarity) > current[:2]:
+                best[card_id] = (score, similarity, field)
+
+        return self._top(best, limit)
+
+    def _rank_prefix(
+        self, text: str, limit: int, allowed: Optional[set]
+    ) -> List[SearchHit]:
+        """Короткий запрос: слова, начинающиеся с него (бинарный поиск)"""
+        start = bisect_left(self._words, (text,))
+        end = bisect_left(self._words, (text + "\uffff",))
+        width = len(FIELDS)
+
+        best: Dict[int, Tuple[float, float, int]] = {}
+        for word, doc in self._words[start:end]:
+            card_id = self._card_ids[doc // width]
+            if allowed is not None and card_id not in allowed:
+                continue
+            field = doc % width
+            rank = (FIELD_WEIGHTS[field], len(text) / len(word), field)
+            current = best.get(card_id)
+            if current is None or rank[:2] > current[:2]:
+                best[card_id] = rank
+        return self._top(best, limit)
+
+    @staticmethod
+    def _top(best: Dict[int, Tuple[float, float, int]], limit: int) -> List[SearchHit]:
+        ranked = heapq.nsmallest(
+            limit, best.items(), key=lambda item: (-item[1][0], -item[1][1], item[0])
+        )
+        return [
+            SearchHit(card_id=card_id, score=round(score, 3), field=FIELDS[field])
+            for card_id, (score, _, field) in ranked
+        ]
+
+
+card_search = CardSearchIndex()
@@ -0,0 +1,195 @@
+# services/expedition_scheduler.py
+"""
+Планировщик завершения экспедиций.
+
+Раньше статус COMPLETED проставлялся UPDATE'ом при каждом открытии меню
+экспедиций: чтение превращалось в запись, а тот, кто не заходил в бот, так
+и не узнавал о возвращении отряда. Теперь при старте из БД читаются все
+активные экспедиции в min-heap по ends_at, новые добавляются через
+schedule(), а фоновая задача спит до ближайшего срока и завершает всё,
+что наступило, одним UPDATE ... RETURNING. Владельцам отправляется
+уведомление с приоритетом NOTIFICATION (EXPEDITION_NOTIFY=0 — отключить).
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from sqlalchemy import select, update
+
+from database.base import AsyncSessionLocal
+from database.models.expedition import Expedition, ExpeditionStatus
+from database.models.user import User
+from services.telegram_sender import Priority, send_priority
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500  # экспедиций в одном UPDATE
+MAX_SLEEP = 300  # секунд — на случай изменения часов или пропущенного schedule()
+NOTIFY = os.getenv("EXPEDITION_NOTIFY", "1") != "0"
+
+
+class ExpeditionScheduler:
+    """min-heap (ends_at, expedition_id) и фоновое завершение"""
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int]] = []
+        self._scheduled: set = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._bot: Optional[Bot] = None
+        self._notifications: set = set()
+
+    # ===== ЖИЗНЕННЫЙ ЦИКЛ =====
+
+    async def start(self, bot: Bot = None):
+        if self._task and not self._task.done():
+            return
+        self._bot = bot
+        await self._seed()
+        self._task = asyncio.create_task(self._run(), name="expedition-scheduler")
+        logger.info(f"✅ Expedition scheduler started ({len(self._heap)} в очереди)")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _seed(self):
+        """Загрузить все активные экспедиции из БД"""
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(Expedition.id, Expedition.ends_at).where(
+                    Expedition.status == ExpeditionStatus.ACTIVE
+                )
+            )
+            for expedition_id, ends_at in result.all():
+                self.schedule(expedition_id, ends_at)
+
+    # ===== ОЧЕРЕДЬ =====
+
+    def schedule(self, expedition_id: int, ends_at: datetime):
+        """Поставить экспедицию в очередь (вызывать после коммита)"""
+        if expedition_id in self._scheduled or ends_at is None:
+            return
+        self._scheduled.add(expedition_id)
+        is_first = not self._heap or ends_at < self._heap[0][0]
+        heapq.heappush(self._heap, (ends_at, expedition_id))
+        if is_first:
+            self._wakeup.set()  # новая экспедиция раньше текущего ожидания
+
+    def _pop_due(self, now: datetime) -> List[int]:
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < BATCH_SIZE:
+            _, expedition_id = heapq.heappop(self._heap)
+            self._scheduled.discard(expedition_id)
+            due.append(expedition_id)
+        return due
+
+    async def _run(self):
+        while True:
+            due = self._pop_due(datetime.now())
+            if due:
+                try:
+                    await self.complete(due)
+                except Exception as e:
+                    logger.error(f"❌ Не удалось завершить экспедиции {due}: {e}")
+                    # Вернём их в очередь и попробуем позже
+                    retry_at = datetime.now()
+                    for expedition_id in due:
+                        self._scheduled.add(expedition_id)
+                        heapq.heappush(self._heap, (retry_at, expedition_id))
+                    await asyncio.sleep(5)
+                continue
+
+            timeout = MAX_SLEEP
+            if self._heap:
+                delay = (self._heap[0][0] - datetime.now()).total_seconds()
+                timeout = min(max(delay, 0), MAX_SLEEP)
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    # ===== ЗАВЕРШЕНИЕ =====
+
+    async def complete(self, expedition_ids: List[int]) -> int:
+        """Завершить экспедиции одним UPDATE и уведомить владельцев"""
+        expeditions = Expedition.__table__
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                update(expeditions)
+                .where(
+                    expeditions.c.id.in_(expedition_ids),
+                    expeditions.c.status == ExpeditionStatus.ACTIVE,
+                )
+                .values(status=ExpeditionStatus.COMPLETED)
+                .returning(expeditions.c.user_id, expeditions.c.name)
+            )
+            finished = result.all()
+
+            recipients: Dict[int, List[str]] = defaultdict(list)
+            if finished and NOTIFY and self._bot:
+                by_user: Dict[int, List[str]] = defaultdict(list)
+                for user_id, name in finished:
+                    by_user[user_id].append(name)
+                users = await session.execute(
+                    select(User.id, User.telegram_id).where(User.id.in_(by_user))
+                )
+                for user_id, telegram_id in users.all():
+                    recipients[telegram_id] = by_user[user_id]
+
+            await session.commit()
+
+        if finished:
+            logger.info(f"🏁 Завершено экспедиций: {len(finished)}")
+        if recipients:
+            task = asyncio.create_task(self._notify(recipients))
+            self._notifications.add(task)
+            task.add_done_callback(self._notifications.discard)
+        return len(finished)
+
+    async def _notify(self, recipients: Dict[int, List[str]]):
+        keyboard = InlineKeyboardMarkup(
+            inline_keyboard=[
+                [
+                    InlineKeyboardButton(
+                        text="🎁 Забрать", callback_data="exped_claim_all"
+                    )
+                ]
+            ]
+        )
+        with send_priority(Priority.NOTIFICATION):
+            results = await asyncio.gather(
+                *(
+                    self._bot.send_message(
+                        telegram_id, _notification_text(names), reply_markup=keyboard
+                    )
+                    for telegram_id, names in recipients.items()
+                ),
+                return_exceptions=True,
+            )
+        failed = sum(isinstance(r, Exception) for r in results)
+        if failed:
+            logger.warning(f"⚠️ Уведомления об экспедициях не доставлены: {failed}")
+
+
+def _notification_text(names: List[str]) -> str:
+    if len(names) == 1:
+        return f"🏕️ Экспедиция «{names[0]}» вернулась! Награда ждёт вас."
+    return f"🏕️ Вернулись экспедиции: {len(names)}. Награды ждут вас."
+
+
+expedition_scheduler = ExpeditionScheduler()
@@ -0,0 +1,119 @@
+# services/file_id_cache.py
+"""
+Кэш Telegram file_id для изображений карт.
+
+Первая успешная отправка карты запоминает file_id, который вернул Telegram,
+и сохраняет его в Card.image_data. Все последующие отправки используют
+file_id — Telegram не скачивает картинку заново. file_id, который Telegram
+не принял, забывается вместе с сохранённым в Card.image_data.
+"""
+import asyncio
+import logging
+from typing import Dict, Iterable, Optional
+
+from aiogram.types import Message
+from sqlalchemy import func, text
+
+from database.base import AsyncSessionLocal
+from database.models.card import Card
+
+logger = logging.getLogger(__name__)
+
+FILE_ID_KEY = "telegram_file_id"
+
+
+class CardFileIdCache:
+    """Процесс-локальная карта card_id → file_id поверх Card.image_data"""
+
+    def __init__(self):
+        self._file_ids: Dict[int, str] = {}
+        self._pending: set = set()
+        # card_id → file_id, который Telegram не принял: не брать его из
+        # image_data, пока карта не отправится заново
+        self._rejected: Dict[int, str] = {}
+
+    def photo_for(self, card: Card) -> str:
+        """file_id карты, если он уже известен, иначе исходный URL"""
+        file_id = self._file_ids.get(card.id)
+        if file_id:
+            return file_id
+
+        image_data = card.image_data if isinstance(card.image_data, dict) else None
+        if (
+            image_data
+            and image_data.get(FILE_ID_KEY)
+            and image_data[FILE_ID_KEY] != self._rejected.get(card.id)
+        ):
+            file_id = image_data[FILE_ID_KEY]
+            self._file_ids[card.id] = file_id
+            return file_id
+
+        return card.original_url
+
+    def remember(self, card: Card, message) -> None:
+        """Запомнить file_id из ответа Telegram (Message с фото)"""
+        if not isinstance(message, Message) or not message.photo:
+            return
+
+        file_id = message.photo[-1].file_id
+        if self._file_ids.get(card.id) == file_id:
+            return
+
+        self._file_ids[card.id] = file_id
+        self._rejected.pop(card.id, None)
+        self._spawn(self._persist(card.id, file_id))
+
+    def remember_many(self, cards: Iterable[Card], messages) -> None:
+        """То же для альбома: сообщения идут в порядке карт"""
+        for card, message in zip(cards, messages or []):
+            self.remember(card, message)
+
+    def forget(self, card_id: int) -> None:
+        """Сбросить file_id (например, если Telegram его не принял)"""
+        file_id = self._file_ids.pop(card_id, None)
+        if file_id:
+            self._rejected[card_id] = file_id
+            self._spawn(self._unpersist(card_id, file_id))
+
+    def get(self, card_id: int) -> Optional[str]:
+        return self._file_ids.get(card_id)
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _persist(self, card_id: int, file_id: str):
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(
+                    Card.__table__.update()
+                    .where(Card.id == card_id)
+                    .values(
+                        image_data=func.coalesce(
+                            Card.image_data, text("'{}'::jsonb")
+                        ).op("||")(func.jsonb_build_object(FILE_ID_KEY, file_id))
+                    )
+                )
+                await session.commit()
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить file_id карты {card_id}: {e}")
+
+    async def _unpersist(self, card_id: int, file_id: str):
+        try:
+            async with AsyncSessionLocal() as session:
+                # Только если там всё ещё этот file_id — новый не трогаем
+                await session.execute(
+                    Card.__table__.update()
+                    .where(
+                        Card.id == card_id,
+                        Card.image_data[FILE_ID_KEY].astext == file_id,
+                    )
+                    .values(image_data=Card.image_data.op("-")(FILE_ID_KEY))
+                )
+                await session.commit()
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось удалить file_id карты {card_id}: {e}")
+
+
+card_file_ids = CardFileIdCache()
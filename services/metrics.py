@@ -0,0 +1,221 @@
+# services/metrics.py
+"""
+Метрики Prometheus (эндпоинт /metrics в main.py).
+
+Что собирается:
+* время хендлеров aiogram — по имени функции хендлера и типу события;
+* время обработки вебхука целиком;
+* пулы соединений SQLAlchemy (основная БД и реплика) — читаются в момент scrape;
+* время команд Redis;
+* попадания/промахи battle_storage;
+* чтения @read_only: реплика / основная БД / повтор, отставание реплики;
+* время запросов к Telegram Bot API по методу.
+
+Всё — счётчики и гистограммы в памяти процесса: наблюдение стоит
+единицы микросекунд, поэтому метрики включены всегда.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.types import TelegramObject
+from prometheus_client import (
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# Бакеты в секундах: от быстрых ответов из кэша до медленных отправок фото
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_seconds",
+    "Время выполнения хендлера aiogram",
+    ["handler", "event", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+WEBHOOK_LATENCY = Histogram(
+    "bot_webhook_seconds",
+    "Время обработки POST /webhook",
+    ["status"],
+    buckets=LATENCY_BUCKETS,
+)
+REDIS_LATENCY = Histogram(
+    "redis_command_seconds",
+    "Время команды Redis",
+    ["command"],
+    buckets=FAST_BUCKETS,
+)
+BATTLE_STORAGE = Counter(
+    "battle_storage_lookups_total",
+    "Поиск боя в battle_storage",
+    ["result"],
+)
+TELEGRAM_LATENCY = Histogram(
+    "telegram_api_seconds",
+    "Время запроса к Telegram Bot API",
+    ["method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    "db_queries_per_request",
+    "SQL-запросов на апдейт / HTTP-запрос (services/query_stats.py)",
+    ["handler"],
+    buckets=(1, 2, 3, 5, 8, 13, 20, 30, 50, 100),
+)
+DB_READ_ROUTING = Counter(
+    "db_read_routing_total",
+    "Чтения @read_only по месту выполнения (database/routing.py)",
+    ["target"],
+)
+DB_REPLICA_LAG = Gauge(
+    "db_replica_lag_seconds",
+    "Отставание реплики при последней проверке (inf — недоступна)",
+)
+DB_TIME = Histogram(
+    "db_time_per_request_seconds",
+    "Суммарное время в БД на апдейт / HTTP-запрос",
+    ["handler"],
+    buckets=FAST_BUCKETS,
+)
+
+
+# ===== AIOGRAM =====
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: время хендлера с меткой по имени функции"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        status = "ok"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            HANDLER_LATENCY.labels(name, type(event).__name__, status).observe(
+                time.perf_counter() - started
+            )
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота. Регистрируется после outbound, чтобы оказаться
+    внутри него и мерить сам HTTP-запрос, а не ожидание в очереди.
+    """
+
+    async def __call__(
+        self, make_request: NextRequestMiddlewareType, bot, method
+    ) -> Any:
+        status = "ok"
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            TELEGRAM_LATENCY.labels(type(method).__name__, status).observe(
+                time.perf_counter() - started
+            )
+
+
+@contextmanager
+def track_webhook():
+    """Время обработки вебхука (with track_webhook(): ...)"""
+    status = "ok"
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        WEBHOOK_LATENCY.labels(status).observe(time.perf_counter() - started)
+
+
+# ===== REDIS =====
+
+
+def instrument_redis(client):
+    """Обернуть execute_command клиента — через него идут все команды"""
+    execute_command = client.execute_command
+
+    async def timed_execute_command(*args, **options):
+        started = time.perf_counter()
+        try:
+            return await execute_command(*args, **options)
+        finally:
+            command = str(args[0]).upper() if args else "UNKNOWN"
+            REDIS_LATENCY.labels(command).observe(time.perf_counter() - started)
+
+    client.execute_command = timed_execute_command
+    return client
+
+
+def battle_lookup(found: bool):
+    BATTLE_STORAGE.labels("hit" if found else "miss").inc()
+
+
+# ===== ПУЛ СОЕДИНЕНИЙ =====
+
+
+class PoolCollector:
+    """Состояние пулов SQLAlchemy в момент scrape (ничего не стоит между ними)"""
+
+    def __init__(self):
+        self.engines: Dict[str, Any] = {}  # метка engine → sync Engine
+
+    def collect(self):
+        gauges = [
+            GaugeMetricFamily(name, documentation, labels=["engine"])
+            for name, documentation in (
+                ("db_pool_size", "Размер пула"),
+                ("db_pool_checked_out", "Соединений выдано"),
+                ("db_pool_overflow", "Соединений сверх pool_size"),
+                ("db_pool_idle", "Свободных соединений в пуле"),
+            )
+        ]
+        for label, engine in self.engines.items():
+            pool = engine.pool  # dispose() заменяет пул — берём текущий
+            if not hasattr(pool, "checkedout"):
+                continue
+            values = (pool.size(), pool.checkedout(), pool.overflow(), pool.checkedin())
+            for gauge, value in zip(gauges, values):
+                gauge.add_metric([label], value)
+        yield from gauges
+
+
+_pool_collector = PoolCollector()
+REGISTRY.register(_pool_collector)
+
+
+def instrument_engine(engine, name: str = "primary"):
+    """Метрики пула под меткой engine=name (повторный вызов ничего не делает)"""
+    _pool_collector.engines.setdefault(name, engine.sync_engine)
+
+
+# ===== ЭКСПОРТ =====
+
+
+def render() -> bytes:
+    return generate_latest(REGISTRY)
@@ -0,0 +1,184 @@
+# services/query_stats.py
+"""
+Учёт SQL-запросов на апдейт и HTTP-запрос.
+
+События SQLAlchemy before/after_cursor_execute считают запросы и время в
+БД в объект QueryStats текущего контекста (contextvar доходит и до
+greenlet'ов async-движка). Middleware открывает такой учёт на каждый
+апдейт с меткой по имени хендлера; по завершении:
+* превышение бюджета QUERY_BUDGET запросов — предупреждение в лог;
+* один и тот же текст запроса QUERY_REPEAT_THRESHOLD раз и больше — N+1
+  (запрос в цикле), в лог попадает сам запрос;
+* число запросов и время в БД — в гистограммы /metrics.
+
+Учёт вложенный: запросы внутреннего блока попадают и во внешний. Команды
+Redis считаются так же, если клиент обёрнут count_redis_calls.
+
+Вне учёта (фоновые задачи, скрипты) обработчики событий ничего не делают.
+
+Проверка количества запросов хендлера:
+    with assert_max_queries(3):
+        await show_arena_top(message, session, db_user)
+"""
+
+import contextvars
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from services.metrics import DB_QUERIES, DB_TIME
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "20"))  # запросов на апдейт
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "5"))
+
+
+@dataclass
+class QueryStats:
+    """Запросы одного апдейта / HTTP-запроса"""
+
+    label: str
+    count: int = 0
+    seconds: float = 0.0
+    statements: Counter = field(default_factory=Counter)
+    redis_calls: int = 0
+    parent: Optional["QueryStats"] = field(default=None, repr=False)
+
+    def repeated(
+        self, threshold: int = QUERY_REPEAT_THRESHOLD
+    ) -> List[Tuple[str, int]]:
+        """Запросы, выполненные threshold раз и больше (кандидаты в N+1)"""
+        return [
+            (statement, times)
+            for statement, times in self.statements.most_common()
+            if times >= threshold
+        ]
+
+
+_current: contextvars.ContextVar[Optional[QueryStats]] = contextvars.ContextVar(
+    "query_stats", default=None
+)
+
+
+# ===== СОБЫТИЯ SQLALCHEMY =====
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None and context is not None:
+        context._query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    started = getattr(context, "_query_started", None)
+    elapsed = time.perf_counter() - started if started is not None else 0.0
+    # Вложенный учёт (хендлер внутри шага нагрузочного теста) считается
+    # и во внешний
+    while stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+        stats.statements[statement] += 1
+        stats = stats.parent
+
+
+def count_redis_calls(client):
+    """Обернуть execute_command клиента Redis — считать команды в QueryStats"""
+    execute_command = client.execute_command
+
+    async def counted_execute_command(*args, **options):
+        stats = _current.get()
+        while stats is not None:
+            stats.redis_calls += 1
+            stats = stats.parent
+        return await execute_command(*args, **options)
+
+    client.execute_command = counted_execute_command
+    return client
+
+
+# ===== УЧЁТ =====
+
+
+@contextmanager
+def track_queries(label: str):
+    """Считать запросы внутри блока в новый QueryStats"""
+    stats = QueryStats(label, parent=_current.get())
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def report(stats: QueryStats, budget: int = QUERY_BUDGET):
+    """Записать метрики и предупредить о превышении бюджета и N+1"""
+    DB_QUERIES.labels(stats.label).observe(stats.count)
+    DB_TIME.labels(stats.label).observe(stats.seconds)
+
+    if stats.count > budget:
+        logger.warning(
+            f"🐢 {stats.label}: {stats.count} SQL-запросов "
+            f"(бюджет {budget}), {stats.seconds * 1000:.1f} мс в БД"
+        )
+    for statement, times in stats.repeated():
+        logger.warning(
+            f"🔁 {stats.label}: N+1 — запрос выполнен {times} раз: "
+            f"{' '.join(statement.split())[:300]}"
+        )
+
+
+class QueryStatsMiddleware(BaseMiddleware):
+    """
+    Inner middleware: учёт запросов апдейта с меткой по имени хендлера.
+    Регистрируется первым, чтобы учитывать и запросы DbSessionMiddleware /
+    UserMiddleware.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        label = getattr(
+            getattr(handler_object, "callback", None), "__name__", "unknown"
+        )
+        with track_queries(label) as stats:
+            try:
+                return await handler(event, data)
+            finally:
+                report(stats)
+
+
+# ===== ПРОВЕРКИ =====
+
+
+@contextmanager
+def assert_max_queries(limit: int, label: str = "test"):
+    """Упасть с AssertionError, если внутри блока больше limit запросов"""
+    with track_queries(label) as stats:
+        yield stats
+    if stats.count > limit:
+        statements = "\n".join(
+            f"  {times}× {' '.join(statement.split())[:200]}"
+            for statement, times in stats.statements.most_common()
+        )
+        raise AssertionError(
+            f"{label}: {stats.count} SQL-запросов, ожидалось не больше {limit}\n"
+            f"{statements}"
+        )
@@ -0,0 +1,195 @@
+# services/quiz_images.py
+"""
+Картинки для викторины: скачивание, обрезка и кэш.
+
+* один общий aiohttp-клиент на весь процесс;
+* обрезка Pillow выполняется в пуле процессов, а не в event loop;
+* готовые картинки лежат в LRU в памяти и на диске (ключ — card_id + url);
+* после первой отправки используется file_id от Telegram.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import aiohttp
+from aiogram.types import BufferedInputFile, Message
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.getenv("QUIZ_IMAGE_CACHE_DIR", ".cache/quiz_images"))
+IMAGE_FORMAT = os.getenv("QUIZ_IMAGE_FORMAT", "JPEG").upper()  # JPEG или WEBP
+IMAGE_QUALITY = int(os.getenv("QUIZ_IMAGE_QUALITY", "85"))
+POOL_WORKERS = int(os.getenv("QUIZ_IMAGE_WORKERS", "2"))
+MEMORY_LIMIT = 128  # картинок в LRU
+CROP_RATIO = 0.82  # обрезаем нижние 18%, где обычно название аниме
+CROP_VERSION = 1  # поменять, если меняется обрезка — старый кэш станет невалидным
+DOWNLOAD_TIMEOUT = 15
+
+_EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp"}
+
+
+def _crop_image(data: bytes, ratio: float, image_format: str, quality: int) -> bytes:
+    """Обрезка в отдельном процессе (функция должна быть на уровне модуля)"""
+    import io
+
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(data))
+    width, height = img.size
+    cropped = img.crop((0, 0, width, int(height * ratio)))
+    if image_format == "JPEG" and cropped.mode != "RGB":
+        cropped = cropped.convert("RGB")
+
+    bio = io.BytesIO()
+    cropped.save(bio, format=image_format, quality=quality, optimize=True)
+    return bio.getvalue()
+
+
+class QuizImageService:
+    """Кэш обрезанных картинок для вопросов викторины"""
+
+    def __init__(self, cache_dir: Path = CACHE_DIR, memory_limit: int = MEMORY_LIMIT):
+        self.cache_dir = cache_dir
+        self.memory_limit = memory_limit
+        self.image_format = IMAGE_FORMAT if IMAGE_FORMAT in _EXTENSIONS else "JPEG"
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._file_ids: Dict[str, str] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    # ===== КЛЮЧИ =====
+
+    def cache_key(self, card_id: int, url: str) -> str:
+        raw = f"{card_id}:{url}:{CROP_VERSION}:{self.image_format}:{IMAGE_QUALITY}"
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.{_EXTENSIONS[self.image_format]}"
+
+    # ===== ПУБЛИЧНОЕ API =====
+
+    async def photo_for(self, card_id: int, url: str) -> Union[str, BufferedInputFile]:
+        """file_id, если картинка уже уходила в Telegram, иначе готовый файл"""
+        key = self.cache_key(card_id, url)
+        file_id = self._file_ids.get(key)
+        if file_id:
+            return file_id
+
+        data = await self.get_bytes(card_id, url)
+        return BufferedInputFile(
+            data, filename=f"quiz_{card_id}.{_EXTENSIONS[self.image_format]}"
+        )
+
+    def remember(self, card_id: int, url: str, message) -> None:
+        """Запомнить file_id из отправленного сообщения"""
+        if isinstance(message, Message) and message.photo:
+            self._file_ids[self.cache_key(card_id, url)] = message.photo[-1].file_id
+
+    def forget(self, card_id: int, url: str) -> None:
+        """Сбросить file_id (Telegram его не принял)"""
+        self._file_ids.pop(self.cache_key(card_id, url), None)
+
+    async def get_bytes(self, card_id: int, url: str) -> bytes:
+        """Обрезанная картинка: память → диск → скачать и обрезать"""
+        key = self.cache_key(card_id, url)
+
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            return data
+
+        # Одновременные запросы одной картинки ждут одну и ту же задачу
+        pending = self._inflight.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._load(key, url))
+            self._inflight[key] = pending
+            pending.add_done_callback(lambda _: self._inflight.pop(key, None))
+        data = await asyncio.shield(pending)
+
+        self._store_memory(key, data)
+        return data
+
+    async def warm(self, card_id: int, url: str) -> bool:
+        """Подготовить картинку заранее, ошибки только логируются"""
+        try:
+            await self.get_bytes(card_id, url)
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось подготовить картинку карты {card_id}: {e}")
+            return False
+
+    async def close(self):
+        if self._http and not self._http.closed:
+            await self._http.close()
+        self._http = None
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    # ===== ВНУТРЕННЕЕ =====
+
+    async def _load(self, key: str, url: str) -> bytes:
+        path = self._path(key)
+        data = await asyncio.to_thread(_read_file, path)
+        if data is not None:
+            return data
+
+        raw = await self._download(url)
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(
+            self._get_pool(),
+            _crop_image,
+            raw,
+            CROP_RATIO,
+            self.image_format,
+            IMAGE_QUALITY,
+        )
+
+        try:
+            await asyncio.to_thread(_write_file, path, data)
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось сохранить картинку в кэш {path}: {e}")
+        return data
+
+    async def _download(self, url: str) -> bytes:
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT)
+            )
+        async with self._http.get(url) as resp:
+            resp.raise_for_status()
+            return await resp.read()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=POOL_WORKERS)
+        return self._pool
+
+    def _store_memory(self, key: str, data: bytes):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_limit:
+            self._memory.popitem(last=False)
+
+
+def _read_file(path: Path) -> Optional[bytes]:
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def _write_file(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data)
+    tmp.replace(path)
+
+
+quiz_images = QuizImageService()
@@ -0,0 +1,160 @@
+# services/quiz_pool.py
+"""
+Пул заранее сгенерированных викторин.
+
+Фоновая задача держит в памяти несколько готовых викторин (вопросы,
+перемешанные варианты, обрезанные картинки) и доливает пул, когда он
+опускается ниже LOW_WATER. quiz_start просто забирает готовую.
+
+Каталог карт (id, имя, url, аниме) читается из БД одним запросом и
+обновляется раз в CATALOG_TTL — вместо ORDER BY random() и пяти
+SELECT DISTINCT на каждую викторину; варианты ответа даёт индекс аниме.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.base import AsyncSessionLocal
+from database.models.card import Card
+from database.routing import read_only
+from game.quiz_system import QuizManager
+from services.anime_index import anime_index
+from services.quiz_images import quiz_images
+
+logger = logging.getLogger(__name__)
+
+LOW_WATER = 5  # ниже — начинаем доливать
+HIGH_WATER = 20  # доливаем до этого количества
+CATALOG_TTL = 3600  # секунд между перечитываниями каталога
+RETRY_DELAY = 30  # пауза после ошибки генерации
+
+
+class QuizPool:
+    """Готовые викторины в памяти с фоновым пополнением"""
+
+    def __init__(self, low_water: int = LOW_WATER, high_water: int = HIGH_WATER):
+        self.low_water = low_water
+        self.high_water = high_water
+        self._quizzes: Deque[List[Dict]] = deque()
+        self._cards: List[Dict] = []
+        self._catalog_loaded_at = 0.0
+        self._refill: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # ===== ЖИЗНЕННЫЙ ЦИКЛ =====
+
+    async def start(self):
+        if self._task and not self._task.done():
+            return
+        self._refill = asyncio.Event()
+        self._refill.set()
+        self._task = asyncio.create_task(self._run(), name="quiz-pool")
+        logger.info("✅ Quiz pool started")
+
+    async def stop(self):
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def __len__(self) -> int:
+        return len(self._quizzes)
+
+    # ===== ПУБЛИЧНОЕ API =====
+
+    def pop(self) -> Optional[List[Dict]]:
+        """Забрать готовую викторину (None — пул пуст)"""
+        quiz = self._quizzes.popleft() if self._quizzes else None
+        if len(self._quizzes) < self.low_water and self._refill:
+            self._refill.set()
+        return quiz
+
+    # ===== ПРОИЗВОДИТЕЛЬ =====
+
+    async def _run(self):
+        while True:
+            await self._refill.wait()
+            self._refill.clear()
+            try:
+                await self._fill()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Ошибка пополнения пула викторин: {e}")
+                await asyncio.sleep(RETRY_DELAY)
+                self._refill.set()
+
+    async def _fill(self):
+        if len(self._quizzes) >= self.low_water:
+            return
+
+        await self._ensure_catalog()
+        if not self._cards:
+            return
+
+        added = 0
+        while len(self._quizzes) < self.high_water:
+            quiz = self._build_quiz()
+            # Картинки обрезаются заранее, чтобы вопрос показывался без задержки
+            await asyncio.gather(
+                *(quiz_images.warm(q["card_id"], q["image_url"]) for q in quiz)
+            )
+            self._quizzes.append(quiz)
+            added += 1
+
+        logger.info(f"🎯 Пул викторин пополнен: +{added}, всего {len(self._quizzes)}")
+
+    @read_only(user_arg=None)  # каталог общий — с реплики
+    async def _load_catalog(self, session: AsyncSession = None):
+        if session is None:
+            async with AsyncSessionLocal() as session:
+                return await self._load_catalog(session=session)
+
+        await anime_index.ensure_loaded(session)
+        result = await session.execute(
+            select(
+                Card.id,
+                Card.card_name,
+                Card.character_name,
+                Card.original_url,
+                Card.anime_name,
+            ).where(Card.anime_name.isnot(None))
+        )
+        return result.all()
+
+    def _build_quiz(self) -> List[Dict]:
+        count = min(QuizManager.QUESTIONS_COUNT, len(self._cards))
+        cards = random.sample(self._cards, count)
+        return QuizManager.build_questions(cards)
+
+    async def _ensure_catalog(self):
+        if self._cards and time.monotonic() - self._catalog_loaded_at < CATALOG_TTL:
+            return
+
+        rows = await self._load_catalog()
+        self._cards = [
+            {
+                "card_id": row.id,
+                "card_name": row.card_name,
+                "character_name": row.character_name,
+                "image_url": row.original_url,
+                "anime_name": row.anime_name,
+            }
+            for row in rows
+            if row.anime_name
+        ]
+        self._catalog_loaded_at = time.monotonic()
+        logger.info(f"📚 Каталог викторины: {len(self._cards)} карт")
+
+
+quiz_pool = QuizPool()
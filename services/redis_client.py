@@ -1,10 +1,12 @@
 # services/redis_client.py
-import redis.asyncio as redis
 import json
 import os
 import logging
 from typing import Optional, Dict
 
+from services.metrics import battle_lookup, instrument_redis
+from services.query_stats import count_redis_calls
+
 logger = logging.getLogger(__name__)
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
@@ -16,8 +18,14 @@ class BattleStorage:
 
     async def connect(self):
         """Подключение к Redis"""
+        # redis импортируется лениво: ~0.1с к холодному старту, а без
+        # REDIS_URL клиент вообще не нужен
+        import redis.asyncio as redis
+
         try:
-            self.redis = redis.from_url(REDIS_URL, decode_responses=True)
+            self.redis = instrument_redis(
+                count_redis_calls(redis.from_url(REDIS_URL, decode_responses=True))
+            )
             await self.redis.ping()
             logger.info("✅ Redis connected successfully")
         except Exception as e:
@@ -38,6 +46,7 @@ class BattleStorage:
             await self.connect()
         key = f"battle:{battle_id}"
         data = await self.redis.get(key)
+        battle_lookup(bool(data))
         if data:
             logger.info(f"✅ Battle {battle_id} found in Redis")
             return json.loads(data)
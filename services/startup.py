@@ -0,0 +1,176 @@
+# services/startup.py
+"""
+Профиль холодного старта.
+
+* startup.step() — замер шагов lifespan, которые нужны до приёма запросов;
+* startup.background() — некритичная работа (команды бота, прогрев
+  кэшей) уходит в фоновые задачи и выполняется, когда приложение уже
+  принимает трафик;
+* startup.mark_ready() — в лог пишется, сколько заняли импорт main и
+  lifespan до готовности, и из каких шагов это сложилось.
+
+Время импорта по модулям (python -X importtime, суммарно по пакетам):
+
+    python -m services.startup
+    python -m services.startup --top 40 --modules
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Awaitable, Dict, List, Optional, Set, Tuple
+
+# Засекается при первом импорте — main импортирует этот модуль первым
+IMPORT_STARTED = time.perf_counter()
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfiler:
+    """Шаги старта и фоновые задачи после него"""
+
+    def __init__(self):
+        self.import_seconds: Optional[float] = None
+        self.steps: List[Tuple[str, float]] = []
+        self.background_steps: Dict[str, float] = {}
+        self.ready_seconds: Optional[float] = None
+        self._lifespan_started: Optional[float] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def imported(self):
+        """Вызывается в конце main.py"""
+        self.import_seconds = time.perf_counter() - IMPORT_STARTED
+
+    async def step(self, name: str, awaitable: Awaitable):
+        """Критичный шаг: выполняется до приёма запросов и замеряется"""
+        if self._lifespan_started is None:
+            self._lifespan_started = time.perf_counter()
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.steps.append((name, time.perf_counter() - started))
+
+    def background(self, name: str, awaitable: Awaitable) -> asyncio.Task:
+        """Некритичный шаг: фоновая задача, ошибки только логируются"""
+
+        async def run():
+            started = time.perf_counter()
+            try:
+                await awaitable
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Фоновый шаг старта {name}: {e}")
+            else:
+                self.background_steps[name] = time.perf_counter() - started
+                logger.info(
+                    f"✅ Фоновый шаг старта {name}: "
+                    f"{self.background_steps[name]:.2f}с"
+                )
+
+        task = asyncio.create_task(run(), name=f"startup-{name}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def mark_ready(self):
+        """Lifespan дошёл до yield — приложение принимает запросы"""
+        lifespan = (
+            time.perf_counter() - self._lifespan_started
+            if self._lifespan_started is not None
+            else 0.0
+        )
+        self.ready_seconds = time.perf_counter() - IMPORT_STARTED
+        slowest = sorted(self.steps, key=lambda item: item[1], reverse=True)[:3]
+        logger.info(
+            f"🚀 Готов за {self.ready_seconds:.2f}с "
+            f"(импорт {self.import_seconds or 0:.2f}с, lifespan {lifespan:.2f}с; "
+            + ", ".join(f"{name} {seconds:.2f}с" for name, seconds in slowest)
+            + ")"
+        )
+
+    async def stop(self):
+        """Отменить незавершённые фоновые шаги (при остановке)"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def summary(self) -> dict:
+        return {
+            "import_seconds": self.import_seconds,
+            "ready_seconds": self.ready_seconds,
+            "steps": dict(self.steps),
+            "background": dict(self.background_steps),
+        }
+
+
+startup = StartupProfiler()
+
+
+# ===== ВРЕМЯ ИМПОРТА =====
+
+
+def import_times(statement: str = "import main") -> List[Tuple[str, int, int]]:
+    """
+    (модуль, собственное время, с зависимостями) в микросекундах — из
+    python -X importtime в отдельном процессе, чтобы замер был холодным
+    по модулям, но с тем же окружением.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        env=os.environ.copy(),
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:") :].split("|")
+        rows.append((module.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def by_package(rows: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    """Собственное время, сложенное по верхнему пакету"""
+    totals: Dict[str, int] = defaultdict(int)
+    for module, self_us, _ in rows:
+        totals[module.split(".")[0]] += self_us
+    return dict(totals)
+
+
+def main(args: argparse.Namespace):
+    rows = import_times(args.statement)
+    total = sum(self_us for _, self_us, _ in rows)
+    print(f"⏱ {args.statement}: {total / 1e6:.2f}с, модулей: {len(rows)}\n")
+
+    if args.modules:
+        top = sorted(rows, key=lambda row: row[2], reverse=True)[: args.top]
+        print(f"{'модуль':<50}{'своё мс':>10}{'всего мс':>10}")
+        for module, self_us, cumulative_us in top:
+            print(f"{module:<50}{self_us / 1000:>10.1f}{cumulative_us / 1000:>10.1f}")
+        return
+
+    packages = sorted(by_package(rows).items(), key=lambda item: -item[1])
+    print(f"{'пакет':<30}{'мс':>10}{'доля':>8}")
+    for package, self_us in packages[: args.top]:
+        print(f"{package:<30}{self_us / 1000:>10.1f}{self_us / total:>8.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Время импорта по модулям")
+    parser.add_argument("--statement", default="import main")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument(
+        "--modules", action="store_true", help="по модулям, а не по пакетам"
+    )
+    main(parser.parse_args())
@@ -0,0 +1,304 @@
+# services/stat_rebalance.py
+"""
+Пересчёт характеристик всех карт игроков.
+
+UserCard.current_* — снимок calculate_stats_for_level на момент последнего
+улучшения. После правки game/constants.py все сохранённые значения
+устаревают, а часть строк так и не была инициализирована (дефолтные
+100/100/10/10). Скрипт читает user_cards ⋈ cards серверным курсором
+порциями по CHUNK_SIZE, считает статы векторно в NumPy по тем же таблицам
+множителей, что и upgrade_calculator (результаты совпадают до единицы), и
+записывает только изменившиеся строки одним UPDATE ... FROM (VALUES ...)
+на порцию. Каждая порция — отдельная короткая транзакция на втором
+соединении, поэтому таблица не блокируется, а прогресс (последний id)
+сохраняется в файл и прерванный пересчёт продолжается с того же места.
+После полного прохода файл удаляется.
+
+Запуск:
+    python -m services.stat_rebalance            # продолжить или начать
+    python -m services.stat_rebalance --dry-run  # только посчитать
+    python -m services.stat_rebalance --restart  # начать с нуля
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import Integer, column, func, select, update, values
+
+from database.base import engine
+from database.models.card import Card
+from database.models.user_card import UserCard
+from game.constants import MAX_CARD_LEVEL, RARITY_BONUS
+from game.upgrade_calculator import calculate_stats_for_level, stat_tables
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5000  # строк в одной порции
+UPDATE_BATCH = 5000  # строк в одном UPDATE: 6 параметров на строку, лимит 32767
+CHECKPOINT_FILE = os.getenv("REBALANCE_CHECKPOINT", ".stat_rebalance.json")
+
+STATS = ("power", "health", "attack", "defense")
+DEFAULT_BASES = {"power": 100, "health": 100, "attack": 10, "defense": 10}
+
+
+# ===== ВЕКТОРНЫЙ РАСЧЁТ =====
+
+
+class StatTables:
+    """Таблицы множителей upgrade_calculator в виде массивов NumPy"""
+
+    def __init__(self):
+        growth, rarity_growth, ten_level = stat_tables()
+        self.rarities: List[str] = sorted(set(rarity_growth) | set(RARITY_BONUS))
+        self.codes: Dict[str, int] = {r: i for i, r in enumerate(self.rarities)}
+        unknown = len(self.rarities)  # код для редкостей не из констант
+
+        ones = [1.0] * (MAX_CARD_LEVEL + 1)
+        self.growth = {stat: np.array(growth[stat]) for stat in STATS}
+        self.rarity_growth = np.array(
+            [rarity_growth.get(r, ones) for r in self.rarities] + [ones]
+        )
+        self.ten_level = np.array(ten_level)
+        self.rarity_mult = np.array(
+            [RARITY_BONUS.get(r, 1.0) for r in self.rarities] + [1.0]
+        )
+        self.unknown = unknown
+
+    def encode(self, rarities: Sequence[str]) -> np.ndarray:
+        codes = self.codes
+        unknown = self.unknown
+        return np.fromiter(
+            (codes.get(r, unknown) for r in rarities),
+            dtype=np.int64,
+            count=len(rarities),
+        )
+
+    def compute(
+        self, rarity: np.ndarray, level: np.ndarray, bases: Dict[str, np.ndarray]
+    ) -> Dict[str, np.ndarray]:
+        """
+        Статы для уровней 1..MAX_CARD_LEVEL. Порядок операций как в
+        calculate_stats_for_level: int(база × рост), × рост редкости,
+        × бонус за 10 уровней, int(× бонус редкости).
+        """
+        rarity_growth = self.rarity_growth[rarity, level]
+        ten_level = np.where(level > 10, self.ten_level[level], 1.0)
+        rarity_mult = self.rarity_mult[rarity]
+
+        result = {}
+        for stat in STATS:
+            value = np.trunc(bases[stat] * self.growth[stat][level])
+            value = value * rarity_growth * ten_level
+            result[stat] = np.trunc(value * rarity_mult).astype(np.int64)
+        return result
+
+
+def rebalance_chunk(
+    tables: StatTables, rows: Sequence[tuple]
+) -> List[Tuple[int, int, int, int, int, int]]:
+    """
+    Строки (id, level, rarity, base_*, current_*) → изменившиеся
+    (id, level, power, health, attack, defense)
+    """
+    ids, levels, rarities, *columns = zip(*rows)
+    bases = {stat: np.array(columns[i], dtype=np.int64) for i, stat in enumerate(STATS)}
+    current = np.array(columns[len(STATS) :], dtype=np.int64)
+
+    ids = np.array(ids, dtype=np.int64)
+    levels = np.array(levels, dtype=np.int64)
+    rarity = tables.encode(rarities)
+
+    # Уровни вне таблиц (битые данные) считаем прямой формулой
+    in_range = (levels >= 1) & (levels <= MAX_CARD_LEVEL)
+    stats = tables.compute(rarity, np.where(in_range, levels, 1), bases)
+    for i in np.flatnonzero(~in_range):
+        card = SimpleNamespace(
+            rarity=rarities[i], **{f"base_{s}": int(bases[s][i]) for s in STATS}
+        )
+        direct = calculate_stats_for_level(card, int(levels[i]))
+        for stat in STATS:
+            stats[stat][i] = direct[stat]
+
+    computed = np.stack([stats[stat] for stat in STATS])
+    changed = np.flatnonzero((computed != current).any(axis=0))
+    return [
+        (int(ids[i]), int(levels[i]), *(int(v) for v in computed[:, i]))
+        for i in changed
+    ]
+
+
+# ===== БД =====
+
+
+def _source_query(after_id: int):
+    return (
+        select(
+            UserCard.id,
+            func.coalesce(UserCard.level, 1),
+            Card.rarity,
+            *(
+                func.coalesce(func.nullif(getattr(Card, f"base_{s}"), 0), default)
+                for s, default in DEFAULT_BASES.items()
+            ),
+            *(func.coalesce(getattr(UserCard, f"current_{s}"), -1) for s in STATS),
+        )
+        .join(Card, UserCard.card_id == Card.id)
+        .where(UserCard.id > after_id)
+        .order_by(UserCard.id)
+    )
+
+
+def _update_statement(changes: List[tuple]):
+    data = values(
+        column("id", Integer),
+        column("level", Integer),
+        *(column(stat, Integer) for stat in STATS),
+        name="v",
+    ).data(changes)
+    user_cards = UserCard.__table__
+    # Уровень мог измениться после чтения — такую строку уже пересчитало
+    # само улучшение. NULL читался как 1: сравниваем так же и записываем
+    # уровень вместе со статами, посчитанными для него
+    matches = (user_cards.c.id == data.c.id) & (
+        func.coalesce(user_cards.c.level, 1) == data.c.level
+    )
+    return (
+        update(user_cards)
+        .where(matches)
+        .values(
+            level=data.c.level,
+            **{f"current_{stat}": data.c[stat] for stat in STATS},
+        )
+    )
+
+
+# ===== ПРОГРЕСС =====
+
+
+def load_checkpoint(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"last_id": 0, "scanned": 0, "updated": 0}
+
+
+def save_checkpoint(path: str, state: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)  # атомарно — прерывание не испортит файл
+
+
+def clear_checkpoint(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def rebalance(
+    chunk_size: int = CHUNK_SIZE,
+    dry_run: bool = False,
+    restart: bool = False,
+    checkpoint: str = CHECKPOINT_FILE,
+    pause: float = 0.0,
+) -> dict:
+    """Пересчитать статы всех карт, вернуть итог {last_id, scanned, updated}"""
+    state = {"last_id": 0, "scanned": 0, "updated": 0}
+    if not restart:
+        state = load_checkpoint(checkpoint)
+    tables = StatTables()
+
+    async with engine.connect() as reader:
+        max_id = (await reader.execute(select(func.max(UserCard.id)))).scalar() or 0
+        if state["last_id"] >= max_id:
+            # Прошлый проход дошёл до конца — это новый пересчёт
+            state = {"last_id": 0, "scanned": 0, "updated": 0}
+        start_id = state["last_id"]
+        if start_id >= max_id:
+            logger.info("✅ Пересчёт статов: карт нет")
+            return state
+        logger.info(
+            f"🔁 Пересчёт статов с id > {start_id} до {max_id}"
+            f"{' (dry run)' if dry_run else ''}"
+        )
+
+        started = time.perf_counter()
+        # Серверный курсор: строки приходят порциями, память не растёт
+        result = await reader.stream(
+            _source_query(start_id).execution_options(yield_per=chunk_size)
+        )
+        async for rows in result.partitions():
+            changes = await asyncio.to_thread(rebalance_chunk, tables, rows)
+
+            if changes and not dry_run:
+                async with engine.begin() as writer:
+                    for i in range(0, len(changes), UPDATE_BATCH):
+                        await writer.execute(
+                            _update_statement(changes[i : i + UPDATE_BATCH])
+                        )
+
+            state["last_id"] = rows[-1][0]
+            state["scanned"] += len(rows)
+            state["updated"] += len(changes)
+            if not dry_run:
+                save_checkpoint(checkpoint, state)
+
+            elapsed = time.perf_counter() - started
+            done = (state["last_id"] - start_id) / max(max_id - start_id, 1)
+            logger.info(
+                f"📈 {done:6.1%} | id ≤ {state['last_id']} | "
+                f"просмотрено {state['scanned']}, исправлено {state['updated']} | "
+                f"{state['scanned'] / max(elapsed, 1e-9):,.0f} строк/с"
+            )
+            if pause:
+                await asyncio.sleep(pause)
+
+    # Чекпоинт нужен только прерванному проходу: следующий запуск (после
+    # новой правки констант) должен начать с начала
+    if not dry_run:
+        clear_checkpoint(checkpoint)
+    logger.info(
+        f"✅ Пересчёт статов завершён: исправлено {state['updated']} "
+        f"из {state['scanned']}"
+    )
+    return state
+
+
+async def main(args: argparse.Namespace):
+    state = await rebalance(
+        chunk_size=args.chunk_size,
+        dry_run=args.dry_run,
+        restart=args.restart,
+        checkpoint=args.checkpoint,
+        pause=args.pause,
+    )
+
+    # Сила карт изменилась — пересчитываем сводки коллекций
+    if state["updated"] and not args.dry_run:
+        from services.summary_reconciler import summary_reconciler
+
+        await summary_reconciler.reconcile_all()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Пересчёт статов user_cards")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="ничего не писать")
+    parser.add_argument("--restart", action="store_true", help="начать с нуля")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument(
+        "--pause", type=float, default=0.0, help="секунд между порциями"
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,239 @@
+# services/static_cache.py
+"""
+Статика из памяти: arena.html (оболочка WebApp) и файлы /static.
+
+Раньше arena.html читался с диска и отдавался целиком (35 КБ без сжатия и
+без заголовков кэширования) при каждом открытии WebApp. Теперь файлы один
+раз читаются при старте, для текстовых сразу готовятся gzip- и brotli-
+варианты, ETag — хэш содержимого. Повторное открытие с If-None-Match
+стоит ответа 304 без тела. Изменение файла на диске замечается по
+mtime/размеру (проверка не чаще раза в CHECK_INTERVAL) — файл
+перечитывается и пережимается.
+
+brotli — необязательная зависимость: без неё отдаются gzip и исходник.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - зависит от окружения
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+CHECK_INTERVAL = 2.0  # секунд между проверками файла на диске
+MIN_COMPRESS_SIZE = 512  # байт — меньше сжимать нет смысла
+
+# Оболочку WebApp браузер всегда перепроверяет (304), остальное кэширует
+SHELL_CACHE_CONTROL = "no-cache"
+STATIC_CACHE_CONTROL = "public, max-age=3600, must-revalidate"
+
+_COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg")
+
+
+@dataclass
+class StaticAsset:
+    """Файл в памяти со сжатыми вариантами"""
+
+    path: Path
+    content_type: str
+    body: bytes
+    gzip: Optional[bytes]
+    br: Optional[bytes]
+    etag: str  # без кавычек; у сжатых вариантов свой суффикс
+    mtime_ns: int
+    size: int
+    checked_at: float
+
+    def variant(self, accept_encoding: str):
+        """(тело, Content-Encoding или None, ETag) под Accept-Encoding клиента"""
+        accepted = _accepted_encodings(accept_encoding)
+        if self.br is not None and "br" in accepted:
+            return self.br, "br", f'"{self.etag}-br"'
+        if self.gzip is not None and "gzip" in accepted:
+            return self.gzip, "gzip", f'"{self.etag}-gz"'
+        return self.body, None, f'"{self.etag}"'
+
+    def matches(self, if_none_match: str) -> bool:
+        """If-None-Match совпадает с любым вариантом этого содержимого"""
+        if if_none_match.strip() == "*":
+            return True
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            tag = tag.strip('"')
+            if tag in (self.etag, f"{self.etag}-br", f"{self.etag}-gz"):
+                return True
+        return False
+
+
+def _accepted_encodings(header: str) -> set:
+    """Кодировки из Accept-Encoding, кроме явно запрещённых (q=0)"""
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                pass
+        if quality > 0:
+            accepted.add(name)
+    return accepted
+
+
+def _compressible(content_type: str) -> bool:
+    return content_type.startswith(_COMPRESSIBLE)
+
+
+def load_asset(path: Path) -> StaticAsset:
+    """Прочитать файл и приготовить сжатые варианты"""
+    stat = path.stat()
+    body = path.read_bytes()
+    # charset для text/* добавит Response
+    content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+    gzipped = compressed_br = None
+    if _compressible(content_type) and len(body) >= MIN_COMPRESS_SIZE:
+        gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+        if brotli is not None:
+            compressed_br = brotli.compress(body, quality=11)
+        # Сжатие, которое не уменьшает файл, не отдаём
+        if len(gzipped) >= len(body):
+            gzipped = None
+        if compressed_br is not None and len(compressed_br) >= len(body):
+            compressed_br = None
+
+    return StaticAsset(
+        path=path,
+        content_type=content_type,
+        body=body,
+        gzip=gzipped,
+        br=compressed_br,
+        etag=hashlib.sha256(body).hexdigest()[:32],
+        mtime_ns=stat.st_mtime_ns,
+        size=stat.st_size,
+        checked_at=time.monotonic(),
+    )
+
+
+class StaticCache:
+    """Файлы по URL-имени (относительный путь) с проверкой изменений"""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = Path(directory) if directory else None
+        self._assets: Dict[str, StaticAsset] = {}
+        self._scanned_at = 0.0
+
+    # ===== ЗАГРУЗКА =====
+
+    def _scan(self):
+        """Загрузить все файлы каталога (новые — добавить)"""
+        self._scanned_at = time.monotonic()
+        if not self.directory or not self.directory.is_dir():
+            return
+        for path in self.directory.rglob("*"):
+            if path.is_file():
+                name = path.relative_to(self.directory).as_posix()
+                if name not in self._assets:
+                    self._load(name, path)
+
+    def _load(self, name: str, path: Path) -> Optional[StaticAsset]:
+        try:
+            asset = load_asset(path)
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось прочитать {path}: {e}")
+            self._assets.pop(name, None)
+            return None
+        self._assets[name] = asset
+        return asset
+
+    def add(self, name: str, path: str) -> Optional[StaticAsset]:
+        """Добавить отдельный файл (не из каталога)"""
+        return self._load(name, Path(path))
+
+    async def warm(self, files: Iterable[tuple] = ()):
+        """Загрузить каталог и файлы заранее (brotli q11 — не в цикле событий)"""
+
+        def load_all():
+            for name, path in files:
+                if Path(path).is_file():
+                    self.add(name, path)
+            self._scan()
+
+        started = time.perf_counter()
+        await asyncio.to_thread(load_all)
+        logger.info(
+            f"✅ Static cache: {len(self._assets)} файлов за "
+            f"{time.perf_counter() - started:.2f}с"
+            f"{'' if brotli else ' (без brotli)'}"
+        )
+
+    # ===== ДОСТУП =====
+
+    def get(self, name: str) -> Optional[StaticAsset]:
+        """Файл по имени; изменённый на диске перечитывается"""
+        asset = self._assets.get(name)
+        now = time.monotonic()
+        if asset is None:
+            # Новый файл в каталоге — пересканируем, но не чаще CHECK_INTERVAL
+            if now - self._scanned_at > CHECK_INTERVAL:
+                self._scan()
+                return self._assets.get(name)
+            return None
+
+        if now - asset.checked_at > CHECK_INTERVAL:
+            asset.checked_at = now
+            try:
+                stat = os.stat(asset.path)
+            except OSError:
+                self._assets.pop(name, None)
+                return None
+            if stat.st_mtime_ns != asset.mtime_ns or stat.st_size != asset.size:
+                logger.info(f"🔄 {asset.path} изменился — перечитываем")
+                asset = self._load(name, asset.path)
+        return asset
+
+    def response(
+        self, request: Request, name: str, cache_control: str = STATIC_CACHE_CONTROL
+    ) -> Optional[Response]:
+        """Ответ 200/304 для файла или None, если его нет"""
+        asset = self.get(name)
+        if asset is None:
+            return None
+
+        body, encoding, etag = asset.variant(request.headers.get("accept-encoding", ""))
+        headers = {
+            "ETag": etag,
+            "Cache-Control": cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and asset.matches(if_none_match):
+            return Response(status_code=304, headers=headers)
+
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type=asset.content_type, headers=headers)
+
+
+static_files = StaticCache("static")
+shell_files = StaticCache()  # arena.html — без каталога, добавляется явно
@@ -0,0 +1,85 @@
+# services/summary_reconciler.py
+"""
+Сверка сводок коллекций.
+
+Сводки поддерживаются инкрементально (database/crud_summary.py), но ручные
+правки в БД или старый код, пишущий в user_cards мимо apply_*, могут их
+рассинхронизировать. Фоновая задача раз в RECONCILE_INTERVAL пересчитывает
+все сводки пачками по BATCH_SIZE пользователей, каждая пачка — отдельная
+короткая транзакция.
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy import func, select
+
+from database.base import AsyncSessionLocal, engine
+from database.crud_summary import reconcile_summaries
+from database.models.user import User
+from database.models.user_collection_summary import UserCollectionSummary
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL = 6 * 3600  # секунд между полными сверками
+FIRST_RUN_DELAY = 60  # секунд после старта до первой сверки
+BATCH_SIZE = 500  # пользователей в одной транзакции
+
+
+class SummaryReconciler:
+    """Периодический пересчёт user_collection_summary"""
+
+    def __init__(self, interval: float = RECONCILE_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task and not self._task.done():
+            return
+        await ensure_table()
+        self._task = asyncio.create_task(self._run(), name="summary-reconciler")
+        logger.info("✅ Summary reconciler started")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        await asyncio.sleep(FIRST_RUN_DELAY)
+        while True:
+            try:
+                await self.reconcile_all()
+            except Exception as e:
+                logger.error(f"❌ Ошибка сверки сводок: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def reconcile_all(self) -> int:
+        """Пересчитать сводки всех пользователей, вернуть количество"""
+        async with AsyncSessionLocal() as session:
+            max_id = (await session.execute(select(func.max(User.id)))).scalar() or 0
+
+        total = 0
+        for after_id in range(0, max_id, BATCH_SIZE):
+            async with AsyncSessionLocal() as session:
+                total += await reconcile_summaries(
+                    session, after_id, after_id + BATCH_SIZE
+                )
+                await session.commit()
+
+        logger.info(f"📊 Сводки коллекций пересчитаны: {total}")
+        return total
+
+
+async def ensure_table():
+    """Создать таблицу сводок, если её ещё нет"""
+    async with engine.begin() as conn:
+        await conn.run_sync(UserCollectionSummary.__table__.create, checkfirst=True)
+
+
+summary_reconciler = SummaryReconciler()
@@ -0,0 +1,347 @@
+# services/telegram_sender.py
+"""
+Планировщик исходящих запросов к Telegram Bot API.
+
+Подключается как middleware сессии бота, поэтому через него проходят все
+вызовы (answer_photo, edit_text, answer_media_group и т.д.):
+
+* token bucket на глобальный лимит (~30 запросов/с) и на каждый чат (1/с);
+* приоритетные очереди: ответы пользователю раньше уведомлений;
+* автоматический повтор после 429 с учётом retry_after;
+* подряд идущие фото в один чат склеиваются в media group.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Deque, Dict, List, Optional, Tuple, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMediaGroup, SendPhoto, TelegramMethod
+from aiogram.types import InputMediaPhoto
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RATE = 30  # запросов в секунду на бота
+CHAT_RATE = 1  # сообщений в секунду в один чат
+CHAT_BURST = 3  # короткий всплеск (ответ + редактирование) не тормозим
+MAX_RETRIES = 3
+MEDIA_GROUP_LIMIT = 10  # ограничение Telegram на размер альбома
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # ответы на команды и нажатия
+    NOTIFICATION = 1  # рассылки, награды, напоминания
+
+
+_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar(
+    "outbound_priority", default=Priority.INTERACTIVE
+)
+
+
+@contextmanager
+def send_priority(priority: Priority):
+    """Все запросы внутри блока попадают в указанную очередь"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен (0 — прямо сейчас)"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, seconds: float, now: float):
+        """Telegram попросил подождать (429 retry_after)"""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0
+
+    def is_idle(self, now: float) -> bool:
+        return now >= self.blocked_until and self.delay(now) == 0 and (
+            self.tokens >= self.capacity
+        )
+
+
+@dataclass
+class _Job:
+    bot: Bot
+    method: TelegramMethod
+    make_request: NextRequestMiddlewareType
+    chat_id: Optional[Union[int, str]]
+    priority: Priority
+    future: asyncio.Future
+    attempts: int = 0
+    coalesce: bool = True
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Очередь исходящих запросов с лимитами Telegram"""
+
+    def __init__(
+        self,
+        global_rate: float = GLOBAL_RATE,
+        chat_rate: float = CHAT_RATE,
+        chat_burst: float = CHAT_BURST,
+        max_retries: int = MAX_RETRIES,
+        coalesce: bool = True,
+    ):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.coalesce = coalesce
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: Dict[Union[int, str], TokenBucket] = {}
+        self._lanes: Dict[Priority, Deque[_Job]] = {p: deque() for p in Priority}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: set = set()
+
+    # ===== ЖИЗНЕННЫЙ ЦИКЛ =====
+
+    async def start(self):
+        if self._task and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="outbound-scheduler")
+        logger.info("✅ Outbound scheduler started")
+
+    async def stop(self):
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+        dropped = 0
+        for lane in self._lanes.values():
+            while lane:
+                job = lane.popleft()
+                if not job.future.done():
+                    job.future.set_exception(RuntimeError("Outbound scheduler stopped"))
+                dropped += 1
+        if dropped:
+            logger.warning(f"⚠️ Outbound scheduler stopped, dropped {dropped} requests")
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    # ===== MIDDLEWARE =====
+
+    async def __call__(self, make_request, bot, method):
+        if not self.running:
+            return await make_request(bot, method)
+
+        job = _Job(
+            bot=bot,
+            method=method,
+            make_request=make_request,
+            chat_id=getattr(method, "chat_id", None),
+            priority=_priority.get(),
+            future=asyncio.get_running_loop().create_future(),
+        )
+        self._lanes[job.priority].append(job)
+        self._wakeup.set()
+        return await job.future
+
+    # ===== ДИСПЕТЧЕР =====
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10_000:
+                now = time.monotonic()
+                for key in [k for k, b in self._chats.items() if b.is_idle(now)]:
+                    del self._chats[key]
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _next_batch(self) -> Tuple[Optional[List[_Job]], Optional[float]]:
+        """Первая готовая к отправке задача (с учётом лимитов) или время ожидания"""
+        now = time.monotonic()
+        has_jobs = any(self._lanes.values())
+        if not has_jobs:
+            return None, None
+
+        global_delay = self._global.delay(now)
+        if global_delay > 0:
+            return None, global_delay
+
+        wait = None
+        for priority in Priority:
+            lane = self._lanes[priority]
+            for index, job in enumerate(lane):
+                if job.chat_id is None:
+                    delay = 0.0
+                else:
+                    delay = self._chat_bucket(job.chat_id).delay(now)
+                if delay > 0:
+                    wait = delay if wait is None else min(wait, delay)
+                    continue
+
+                del lane[index]
+                self._global.consume(now)
+                if job.chat_id is not None:
+                    self._chat_bucket(job.chat_id).consume(now)
+                return [job] + self._take_coalescable(job, lane, index), None
+
+        return None, wait
+
+    def _can_coalesce(self, job: _Job) -> bool:
+        method = job.method
+        return (
+            self.coalesce
+            and job.coalesce
+            and isinstance(method, SendPhoto)
+            and method.reply_markup is None
+            and method.reply_parameters is None
+            and method.reply_to_message_id is None
+        )
+
+    def _take_coalescable(self, head: _Job, lane: Deque[_Job], start: int) -> List[_Job]:
+        """Забирает подряд идущие фото в тот же чат для отправки одним альбомом"""
+        if not self._can_coalesce(head):
+            return []
+
+        taken = []
+        index = start
+        while index < len(lane) and len(taken) + 1 < MEDIA_GROUP_LIMIT:
+            job = lane[index]
+            if job.chat_id != head.chat_id:
+                index += 1
+                continue
+            if (
+                not self._can_coalesce(job)
+                or job.method.message_thread_id != head.method.message_thread_id
+            ):
+                break  # порядок сообщений в чате важнее склейки
+            taken.append(job)
+            del lane[index]
+        return taken
+
+    async def _run(self):
+        while True:
+            batch, wait = self._next_batch()
+            if batch is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self._execute(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    # ===== ОТПРАВКА =====
+
+    async def _execute(self, batch: List[_Job]):
+        head = batch[0]
+        try:
+            if len(batch) == 1:
+                result = await head.make_request(head.bot, head.method)
+                _resolve(head, result)
+                return
+
+            media_group = SendMediaGroup(
+                chat_id=head.chat_id,
+                message_thread_id=head.method.message_thread_id,
+                disable_notification=head.method.disable_notification,
+                media=[
+                    InputMediaPhoto(
+                        media=job.method.photo,
+                        caption=job.method.caption,
+                        parse_mode=job.method.parse_mode,
+                        caption_entities=job.method.caption_entities,
+                        has_spoiler=job.method.has_spoiler,
+                    )
+                    for job in batch
+                ],
+            )
+            messages = await head.make_request(head.bot, media_group)
+            for job, message in zip(batch, messages):
+                _resolve(job, message)
+
+        except TelegramRetryAfter as e:
+            logger.warning(f"⏳ 429 от Telegram, chat={head.chat_id}, ждём {e.retry_after}с")
+            now = time.monotonic()
+            if head.chat_id is not None:
+                self._chat_bucket(head.chat_id).block(e.retry_after, now)
+            else:
+                self._global.block(e.retry_after, now)
+            self._requeue(batch, e)
+
+        except Exception as e:
+            if len(batch) > 1:
+                # Альбом не ушёл целиком — отправляем фото по одному
+                for job in batch:
+                    job.coalesce = False
+                self._requeue(batch, e, count_attempt=False)
+            else:
+                _fail(head, e)
+
+    def _requeue(self, batch: List[_Job], error: Exception, count_attempt: bool = True):
+        for job in reversed(batch):
+            if count_attempt:
+                job.attempts += 1
+            if job.attempts > self.max_retries:
+                _fail(job, error)
+                continue
+            self._lanes[job.priority].appendleft(job)
+        self._wakeup.set()
+
+
+def _resolve(job: _Job, result):
+    if not job.future.done():
+        job.future.set_result(result)
+
+
+def _fail(job: _Job, error: Exception):
+    if not job.future.done():
+        job.future.set_exception(error)
+
+
+outbound = OutboundScheduler()